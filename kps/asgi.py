@@ -5,13 +5,17 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serves both HTTP and websockets; see the Procfile for the production command
+(gunicorn managing uvicorn workers). Run more than one worker only with a
+Redis channel layer (CHANNEL_LAYER=redis or pubsub). The async views under
+/api/async/ (school.async_views) run on the event loop here instead of in a
+worker thread.
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
-import os
-
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 
@@ -1,5 +1,10 @@
+import os
 from pathlib import Path
 
+import environ
+
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -51,6 +56,30 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Opt-in request profiling: SQL count/time, repeated query shapes and view /
+# render time per request, sent as Server-Timing headers and JSON log lines on
+# the school.profiling logger. SAMPLE_RATE is the fraction of requests (and
+# websocket events) profiled; anything slower than SLOW_MS is logged at WARNING.
+REQUEST_PROFILING = {
+    'ENABLED': os.environ.get('REQUEST_PROFILING', '') in ('1', 'true'),
+    'SAMPLE_RATE': float(os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', '1.0')),
+    'SLOW_MS': float(os.environ.get('REQUEST_PROFILING_SLOW_MS', '500')),
+    'SERVER_TIMING': True,
+}
+if REQUEST_PROFILING['ENABLED']:
+    MIDDLEWARE.insert(0, 'school.middleware.RequestProfilingMiddleware')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'school': {'handlers': ['console'], 'level': os.environ.get('SCHOOL_LOG_LEVEL', 'INFO')},
+    },
+}
+
 ROOT_URLCONF = 'kps.urls'
 
 TEMPLATES = [
@@ -75,12 +104,38 @@ ASGI_APPLICATION = 'kps.asgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# DATABASE_URL (e.g. postgres://user:pass@db:5432/kp_school) defaults to the
+# local SQLite file. DATABASE_REPLICA_URLS is a comma-separated list of read
+# replicas, used for safe-method API reads (see school.routers).
+env = environ.Env()
+# seconds a connection is kept open for reuse. The default of 0 closes it after
+# each request: the app is served over ASGI (see Procfile), where sync views
+# and sync_to_async calls run on executor threads that each hold their own
+# persistent connection, so a non-zero age piles up idle connections per
+# worker. Reuse connections with PgBouncer (transaction pooling) in front of
+# Postgres instead; a raised age only suits single-threaded processes such as
+# WSGI workers or run_outbox.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '0'))
+
+
+def database(url):
+    config = env.db_url_config(url)
+    config['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    config['CONN_HEALTH_CHECKS'] = DB_CONN_MAX_AGE > 0
+    if config['ENGINE'] == 'django.db.backends.postgresql':
+        config.setdefault('OPTIONS', {})['connect_timeout'] = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+    return config
+
+
+DATABASES = {'default': database(os.environ.get('DATABASE_URL', f'sqlite:///{BASE_DIR / "db.sqlite3"}'))}
+REPLICA_DATABASES = []
+for n, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    DATABASES[f'replica_{n}'] = {**database(url.strip()), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(f'replica_{n}')
+
+DATABASE_ROUTERS = ['school.routers.ReplicaRouter']
+# seconds a user's reads stay on the primary after they write
+READ_AFTER_WRITE_PIN = int(os.environ.get('READ_AFTER_WRITE_PIN', '5'))
 
 
 # Password validation
@@ -119,6 +174,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -132,16 +190,90 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    # cursor pagination on the primary key; small admin lists opt back in to
+    # LimitOffsetPagination (see school.pagination)
+    'DEFAULT_PAGINATION_CLASS': 'school.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
 }
 
 
 AUTH_USER_MODEL = 'school.User'
 
-# Channels - simple in-memory layer for development
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+# Cache - local memory for development, Redis when REDIS_URL is set
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # the default of 300 entries evicts response-cache and counter keys early
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# seconds a cached dashboard figure may be served before it is recomputed
+DASHBOARD_CACHE_TIMEOUT = 300
+# Parents' child-id sets are invalidated by signals; the timeout is only a backstop.
+GUARDIAN_CACHE_TIMEOUT = 3600
+
+# Channels layer, chosen with CHANNEL_LAYER:
+#   memory - in-process only; fine for a single development server
+#   redis  - channels_redis list-based layer (default when REDIS_URL is set)
+#   pubsub - channels_redis pub/sub layer, lighter on Redis, no delivery guarantees
+# With more than one process (web workers, the outbox worker) a Redis layer is
+# required, otherwise pushes never reach sockets held by another process.
+CHANNEL_LAYER = os.environ.get('CHANNEL_LAYER', 'redis' if os.environ.get('REDIS_URL') else 'memory')
+CHANNEL_REDIS_URL = os.environ.get('CHANNEL_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
+if CHANNEL_LAYER == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
     }
+elif CHANNEL_LAYER == 'redis':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+                'capacity': int(os.environ.get('CHANNEL_CAPACITY', '1000')),
+                'expiry': 30,
+            },
+        }
+    }
+elif CHANNEL_LAYER == 'pubsub':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG': {'hosts': [CHANNEL_REDIS_URL]},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'CHANNEL_LAYER must be memory, redis or pubsub, not {CHANNEL_LAYER!r}')
+
+# Websocket admission control (see school.consumers). Sockets over either
+# limit are accepted and immediately closed with code 4429.
+WEBSOCKET_LIMITS = {
+    'MAX_CONNECTIONS_PER_USER': int(os.environ.get('WS_MAX_CONNECTIONS_PER_USER', '10')),
+    'CONNECTS_PER_MINUTE': int(os.environ.get('WS_CONNECTS_PER_MINUTE', '30')),
+}
+# Seconds a websocket token -> user lookup is cached (never beyond the token's expiry).
+JWT_USER_CACHE_TIMEOUT = 300
+
+# cached list/detail responses for read-mostly viewsets (school.responsecache)
+RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('RESPONSE_CACHE', '1') == '1',
+    'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', '300')),
 }
+
+# Opening a thread writes one Message.read_by receipt per unread message. Past
+# this many missing receipts only the participant's read watermark is advanced.
+MESSAGE_RECEIPT_LIMIT = 200
+
+# Processes used to render term report PDFs (1 renders in-process).
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '4'))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Student, SchoolClass, Subject, Assessment, GradeEntry, AttendanceRecord, BehaviourIncident, MessageThread, Message, Notification, AcademicYear, Term
+from .models import User, Student, SchoolClass, Subject, Assessment, GradeEntry, AttendanceRecord, BehaviourIncident, MessageThread, Message, Notification, AcademicYear, Term, OutboxEvent
 
 # Register your models here.
 admin.site.register(User)
@@ -15,3 +15,4 @@ admin.site.register(Message)
 admin.site.register(Notification)
 admin.site.register(AcademicYear)
 admin.site.register(Term)
+admin.site.register(OutboxEvent)
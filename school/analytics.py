@@ -0,0 +1,158 @@
+"""Attendance analytics from per-class daily rollups.
+
+``AttendanceDailyRollup`` holds one row per class and day with a count for
+each attendance status. Records count in ``AttendanceRecord.school_class``,
+the pupil's class when the record was taken, so moving a pupil to another
+class leaves the days already counted where they were. Single writes adjust
+the rollups from ``school.signals``, the bulk register applies its changes
+with ``apply``, and ``rebuild`` (the
+``rebuild_attendance_rollups`` command) recomputes any date range from the
+raw records after writes that bypass both, such as ``QuerySet.update()``.
+
+``class_rates`` answers rate and late-trend questions for any range from the
+rollups alone; ``chronic_absence`` needs per-pupil figures and so reads the
+raw records, restricted to the date range by ``attendance_date_idx``.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import AttendanceDailyRollup, AttendanceRecord
+
+STATUSES = ('present', 'absent', 'late', 'excused')
+PERIODS = {'week': TruncWeek, 'month': TruncMonth}
+
+
+def apply(changes):
+    """Apply ``{(class_id, date): Counter({status: delta})}`` to the rollups."""
+    changes = {key: delta for key, delta in changes.items() if key[0] is not None and any(delta.values())}
+    if not changes:
+        return
+    with transaction.atomic():
+        AttendanceDailyRollup.objects.bulk_create(
+            [AttendanceDailyRollup(school_class_id=class_id, date=day) for class_id, day in changes],
+            ignore_conflicts=True,
+        )
+        for (class_id, day), delta in changes.items():
+            AttendanceDailyRollup.objects.filter(school_class_id=class_id, date=day).update(
+                **{status: F(status) + n for status, n in delta.items() if n}
+            )
+        emptied = [key for key, delta in changes.items() if any(n < 0 for n in delta.values())]
+        if emptied:
+            # a day whose last record moved away keeps no row, as after a rebuild
+            days = Q()
+            for class_id, day in emptied:
+                days |= Q(school_class_id=class_id, date=day)
+            AttendanceDailyRollup.objects.filter(days, **{s: 0 for s in STATUSES}).delete()
+
+
+def record_changed(before=None, after=None):
+    """Move one record's count: ``before``/``after`` are ``(class_id, date, status)`` or None."""
+    changes = defaultdict(Counter)
+    if before:
+        changes[before[:2]][before[2]] -= 1
+    if after:
+        changes[after[:2]][after[2]] += 1
+    apply(changes)
+
+
+def rebuild(date_from=None, date_to=None, class_ids=None):
+    """Recompute the rollups for a date range (default: everything); returns rows written."""
+    records = AttendanceRecord.objects.filter(school_class__isnull=False)
+    rollups = AttendanceDailyRollup.objects.all()
+    if date_from:
+        records, rollups = records.filter(date__gte=date_from), rollups.filter(date__gte=date_from)
+    if date_to:
+        records, rollups = records.filter(date__lte=date_to), rollups.filter(date__lte=date_to)
+    if class_ids:
+        records = records.filter(school_class__in=class_ids)
+        rollups = rollups.filter(school_class__in=class_ids)
+
+    rows = (
+        records.values('school_class', 'date')
+        .annotate(**{status: Count('id', filter=Q(status=status)) for status in STATUSES})
+        .order_by()
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = AttendanceDailyRollup.objects.bulk_create(
+            [
+                AttendanceDailyRollup(school_class_id=row['school_class'], date=row['date'], **{s: row[s] for s in STATUSES})
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def _rates(row):
+    total = sum(row[s] for s in STATUSES)
+    attended = row['present'] + row['late']
+    return {
+        'total': total,
+        'attendance_rate': round(100 * attended / total, 1) if total else None,
+        'late_rate': round(100 * row['late'] / total, 1) if total else None,
+        'absence_rate': round(100 * row['absent'] / total, 1) if total else None,
+    }
+
+
+def class_rates(date_from, date_to, period='week', class_ids=None):
+    """Status counts and rates per class per period (``day``, ``week``, ``month`` or ``total``)."""
+    qs = AttendanceDailyRollup.objects.filter(date__range=(date_from, date_to))
+    if class_ids:
+        qs = qs.filter(school_class__in=class_ids)
+    group = ['school_class', 'school_class__name']
+    if period == 'day':
+        qs = qs.annotate(period=F('date'))
+    elif period in PERIODS:
+        qs = qs.annotate(period=PERIODS[period]('date'))
+    if period != 'total':
+        group.append('period')
+
+    rows = qs.values(*group).annotate(**{s: Sum(s) for s in STATUSES}).order_by('school_class__name', 'school_class', *group[2:])
+    return [
+        {
+            'school_class': row['school_class'],
+            'class_name': row['school_class__name'],
+            'period_start': row.get('period', date_from),
+            **{s: row[s] for s in STATUSES},
+            **_rates(row),
+        }
+        for row in rows
+    ]
+
+
+def chronic_absence(date_from, date_to, threshold=10.0, min_days=1, class_ids=None):
+    """Pupils absent on at least ``threshold`` percent of their recorded days in the range.
+
+    Like the rollups, days count in the class the record was taken in, so a
+    pupil who moved classes has one row per class.
+    """
+    qs = AttendanceRecord.objects.filter(date__range=(date_from, date_to), school_class__isnull=False)
+    if class_ids:
+        qs = qs.filter(school_class__in=class_ids)
+    rows = (
+        qs.values('student', 'student__first_name', 'student__last_name', 'student__admission_number', 'school_class', 'school_class__name')
+        .annotate(days=Count('id'), absent=Count('id', filter=Q(status='absent')), late=Count('id', filter=Q(status='late')))
+        .filter(days__gte=min_days)
+        .order_by()
+    )
+    found = []
+    for row in rows:
+        rate = 100 * row['absent'] / row['days']
+        if row['absent'] and rate >= threshold:
+            found.append({
+                'student': row['student'],
+                'name': f"{row['student__first_name']} {row['student__last_name']}",
+                'admission_number': row['student__admission_number'],
+                'school_class': row['school_class'],
+                'class_name': row['school_class__name'],
+                'days': row['days'],
+                'absent': row['absent'],
+                'late': row['late'],
+                'absence_rate': round(rate, 1),
+            })
+    found.sort(key=lambda r: (-r['absence_rate'], r['name']))
+    return found
@@ -7,4 +7,7 @@ class SchoolConfig(AppConfig):
 
 # register signals
     def ready(self):
-        import school.signals
\ No newline at end of file
+        import school.signals
+        from school import profiling
+        if profiling.enabled():
+            profiling.install()
@@ -0,0 +1,170 @@
+"""Async messaging endpoints for the ASGI server.
+
+``/api/async/threads/<id>/messages/`` (GET list, POST send) and
+``/api/async/unread/`` (GET) mirror the ``MessageThreadViewSet`` ``messages``
+and ``unread_count`` actions, but run as coroutines:
+
+* reads use the async ORM;
+* the transactional writes are one ``sync_to_async`` call each, since Django
+  cannot run ``atomic`` blocks in async code;
+* once a message is committed, the recipients' new unread counts are pushed
+  straight to the channel layer with ``outbox.send``. It fans out with
+  ``asyncio.gather`` and hands failed pushes to the outbox worker, so a send
+  never holds a worker thread while the channel layer is slow.
+
+Requests authenticate with ``Authorization: Bearer <access token>`` through the
+cached token lookup the websockets use (``middleware.user_for_token``).
+Messages and the unread total have the same JSON shapes as those actions, but
+pages differ: messages are listed newest first and keyset-paginated with
+``?before=<message id>`` and ``?limit=`` (default 50, max 200), in a
+``{"next_before": <id or null>, "results": [...]}`` envelope rather than the
+cursor links of ``MessageCursorPagination``.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.fields import DateTimeField
+
+from . import outbox, unread
+from .fastserializers import compile_serializer
+from .middleware import user_for_token
+from .models import Message, MessageThread, ThreadReadState, User, UserUnreadCount
+from .serializers import UserSerializer
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_timestamp = DateTimeField().to_representation
+
+
+def _error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+async def authenticate(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    user = await user_for_token(token.strip())
+    return user if user.is_authenticated else None
+
+
+def _is_staff(user):
+    return getattr(user, 'role', None) in ('admin', 'teacher') or getattr(user, 'is_superuser', False)
+
+
+async def _can_see_thread(user, thread_id):
+    threads = MessageThread.objects.filter(pk=thread_id)
+    if not _is_staff(user):
+        threads = threads.filter(participants=user.id)
+    return await threads.aexists()
+
+
+async def _users(user_ids):
+    compiled = compile_serializer(UserSerializer)
+    return {row['id']: compiled.row(row) async for row in User.objects.filter(pk__in=user_ids).values(*compiled.lookups)}
+
+
+async def _push_unread(user_ids):
+    totals = dict.fromkeys(user_ids, 0)
+    async for user_id, count in UserUnreadCount.objects.filter(user_id__in=user_ids).values_list('user_id', 'unread'):
+        totals[user_id] = count
+    await outbox.send({(user_id, 'unread.count'): {'type': 'unread.count', 'unread': count} for user_id, count in totals.items()})
+
+
+def _create_message(thread_id, user_id, body):
+    with transaction.atomic():
+        message = Message.objects.create(thread_id=thread_id, sender_id=user_id, body=body)
+        message.read_by.add(user_id)
+        return message, unread.record_message(message)
+
+
+async def _send(request, user, thread_id):
+    try:
+        body = json.loads(request.body or b'{}').get('body', '')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'invalid JSON body'}, status=400)
+    body = body.strip() if isinstance(body, str) else ''
+    if not body:
+        return JsonResponse({'error': 'body required'}, status=400)
+
+    message, recipients = await sync_to_async(_create_message)(thread_id, user.id, body)
+    sender, _ = await asyncio.gather(_users([user.id]), _push_unread(recipients))
+    return JsonResponse({
+        'id': message.id,
+        'thread': thread_id,
+        'sender': sender[user.id],
+        'body': message.body,
+        'sent_at': _timestamp(message.sent_at),
+        'read_by': [sender[user.id]],
+    }, status=201)
+
+
+async def _list(request, user, thread_id):
+    limit, before = request.GET.get('limit', ''), request.GET.get('before', '')
+    limit = min(int(limit), MAX_PAGE_SIZE) if limit.isdigit() and int(limit) > 0 else PAGE_SIZE
+    if await sync_to_async(unread.mark_thread_read)(user.id, thread_id):
+        # the lower count reaches the user's other sessions
+        await _push_unread([user.id])
+
+    messages = Message.objects.filter(thread_id=thread_id).order_by('-id')
+    if before.isdigit():
+        messages = messages.filter(id__lt=int(before))
+    rows = [row async for row in messages.values('id', 'sender_id', 'body', 'sent_at')[:limit + 1]]
+    rows, more = rows[:limit], len(rows) > limit
+    ids = [row['id'] for row in rows]
+
+    receipts = [pair async for pair in Message.read_by.through.objects.filter(message_id__in=ids).values_list('message_id', 'user_id')]
+    watermarks = [
+        pair async for pair in ThreadReadState.objects.filter(thread_id=thread_id, last_read_message__isnull=False)
+        .values_list('last_read_message_id', 'user_id')
+    ]
+    users = await _users({row['sender_id'] for row in rows} | {u for _, u in receipts} | {u for _, u in watermarks})
+
+    readers = {message_id: [] for message_id in ids}
+    for message_id, user_id in receipts:
+        readers[message_id].append(user_id)
+    results = []
+    for row in rows:
+        read_by = readers[row['id']]
+        read_by += [u for last_read, u in watermarks if last_read >= row['id'] and u not in read_by]
+        results.append({
+            'id': row['id'],
+            'thread': thread_id,
+            'sender': users.get(row['sender_id']),
+            'body': row['body'],
+            'sent_at': _timestamp(row['sent_at']),
+            'read_by': [users[u] for u in read_by],
+        })
+    return JsonResponse({'next_before': ids[-1] if more else None, 'results': results})
+
+
+@csrf_exempt
+async def thread_messages(request, thread_id):
+    """GET: a page of the thread's messages (marks the thread read). POST ``{"body": ...}``: send a message."""
+    if request.method not in ('GET', 'POST'):
+        return _error(f'Method "{request.method}" not allowed.', 405)
+    user = await authenticate(request)
+    if user is None:
+        return _error('Authentication credentials were not provided.', 401)
+    if not await _can_see_thread(user, thread_id):
+        return _error('No MessageThread matches the given query.', 404)
+    if request.method == 'POST':
+        return await _send(request, user, thread_id)
+    return await _list(request, user, thread_id)
+
+
+@csrf_exempt
+async def unread_count(request):
+    """GET: the caller's total unread messages."""
+    if request.method != 'GET':
+        return _error(f'Method "{request.method}" not allowed.', 405)
+    user = await authenticate(request)
+    if user is None:
+        return _error('Authentication credentials were not provided.', 401)
+    count = await UserUnreadCount.objects.filter(user_id=user.id).values_list('unread', flat=True).afirst()
+    return JsonResponse({'unread': count or 0})
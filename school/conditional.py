@@ -0,0 +1,68 @@
+"""Conditional GET (ETag / Last-Modified) for read endpoints.
+
+Validators are computed without building the response body: lists use one
+aggregate over the same scoped queryset the view would serialize (row count,
+newest timestamp, highest id), and detail views use the object they have
+already loaded. A client whose copy is current gets a 304 with no
+serialization. ETags are weak and include the caller's scope and the query
+string, since two parents (or two filters) can see different rows with the
+same timestamps.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def scope(request):
+    """Staff all see the same rows; anyone else sees rows scoped to themselves."""
+    user = request.user
+    if getattr(user, 'role', None) in ('admin', 'teacher') or getattr(user, 'is_superuser', False):
+        return 'staff'
+    return f'user:{user.pk}'
+
+
+def make_etag(*parts):
+    return 'W/"%s"' % hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def queryset_validators(queryset, timestamp_field):
+    """``(count, newest timestamp, highest pk)`` for a (possibly sliced) queryset, in one query."""
+    stats = queryset.aggregate(count=Count('pk'), changed=Max(timestamp_field), last=Max('pk'))
+    return stats['count'], stats['changed'], stats['last']
+
+
+def respond(request, etag, last_modified, build, *args, **kwargs):
+    """Answer 304/412 when the client's validators match, else ``build(*args, **kwargs)``; attach validators."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build(*args, **kwargs)
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+class ConditionalGetMixin:
+    """Conditional ``list`` and ``retrieve`` keyed on ``conditional_timestamp``.
+
+    The timestamp field must change on every write that changes the
+    serialized row (``auto_now`` or set explicitly on bulk paths).
+    """
+    conditional_timestamp = 'updated_at'
+
+    def list(self, request, *args, **kwargs):
+        count, changed, last = queryset_validators(self.filter_queryset(self.get_queryset()), self.conditional_timestamp)
+        etag = make_etag(scope(request), request.get_full_path(), count, changed, last)
+        return respond(request, etag, changed, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        changed = getattr(instance, self.conditional_timestamp)
+        etag = make_etag(scope(request), instance.pk, changed)
+        return respond(request, etag, changed, lambda: Response(self.get_serializer(instance).data))
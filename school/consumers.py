@@ -1,6 +1,77 @@
+import time
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from django.core.cache import cache
+
+from . import notifications, unread
+from .profiling import ProfiledConsumerMixin
+
+CLOSE_TOO_MANY = 4429
+# open sockets per user; refreshed on every connect so leaked counts from
+# crashed processes expire
+CONNECTION_COUNT_TIMEOUT = 3600
+
+
+async def _incr(key, timeout):
+    await cache.aadd(key, 0, timeout)
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        # expired between add and incr
+        await cache.aset(key, 1, timeout)
+        return 1
+
+
+class AdmissionControlMixin:
+    """Refuse sockets beyond ``WEBSOCKET_LIMITS`` per user, before any database work.
 
-class UnreadConsumer(AsyncJsonWebsocketConsumer):
+    Counters live in the Django cache so limits hold across processes when
+    the cache is Redis. Refused sockets are accepted and closed with 4429 so
+    clients can tell throttling from an auth failure and back off.
+    """
+    admitted = False
+
+    async def admit(self, user):
+        limits = settings.WEBSOCKET_LIMITS
+        window = int(time.time() // 60)
+        if await _incr(f'ws:connects:{user.id}:{window}', 120) > limits['CONNECTS_PER_MINUTE']:
+            return False
+        key = f'ws:open:{user.id}'
+        if await _incr(key, CONNECTION_COUNT_TIMEOUT) > limits['MAX_CONNECTIONS_PER_USER']:
+            await self.release(key)
+            return False
+        await cache.atouch(key, CONNECTION_COUNT_TIMEOUT)
+        self.admitted = True
+        return True
+
+    async def release(self, key):
+        try:
+            await cache.adecr(key)
+        except ValueError:
+            pass
+
+    async def refuse(self):
+        await self.accept()
+        await self.close(code=CLOSE_TOO_MANY)
+
+    async def disconnect(self, close_code):
+        if self.admitted:
+            self.admitted = False
+            await self.release(f'ws:open:{self.user.id}')
+
+
+class UnreadConsumer(ProfiledConsumerMixin, AdmissionControlMixin, AsyncJsonWebsocketConsumer):
+    """Per-user push channel for unread message counts and notifications.
+
+    On connect the client gets a ``snapshot`` (unread counts plus the newest
+    notifications, or with ``?last_id=<id>`` only the ones it missed). After
+    that the outbox worker pushes ``unread_count``, ``notification`` and
+    ``notification_count`` events. Clients may send
+    ``{"action": "mark_all_read"}`` or ``{"action": "mark_read", "ids": [...]}``.
+    """
     async def connect(self):
         user = self.scope.get('user')
         if not user or not getattr(user, 'is_authenticated', False):
@@ -9,11 +80,31 @@ class UnreadConsumer(AsyncJsonWebsocketConsumer):
             return
 
         self.user = user
+        if not await self.admit(user):
+            await self.refuse()
+            return
         self.group_name = f'user_{user.id}'
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
+        await self.send_json({'type': 'snapshot', **await self.get_snapshot(self.resume_id())})
+
+    def resume_id(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        last_id = query.get('last_id', [''])[0]
+        return int(last_id) if last_id.isdigit() else None
+
+    @database_sync_to_async
+    def get_snapshot(self, last_id):
+        data = notifications.snapshot(self.user.id, last_id)
+        return {
+            'unread': unread.unread_total(self.user.id),
+            'notifications_unread': data['unread'],
+            'notifications': data['notifications'],
+            'truncated': data['truncated'],
+        }
 
     async def disconnect(self, close_code):
+        await super().disconnect(close_code)
         try:
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
         except Exception:
@@ -26,6 +117,26 @@ class UnreadConsumer(AsyncJsonWebsocketConsumer):
             'unread': event.get('unread', 0)
         })
 
+    async def notification_new(self, event):
+        for notification in event['notifications']:
+            await self.send_json({'type': 'notification', 'notification': notification})
+
+    async def notification_count(self, event):
+        await self.send_json({'type': 'notification_count', 'unread': event.get('unread', 0)})
+
+    @database_sync_to_async
+    def mark_read(self, ids):
+        notifications.mark_read(self.user.id, ids)
+        return notifications.unread_counts([self.user.id])[self.user.id]
+
     async def receive_json(self, content, **kwargs):
-        # no-op: this consumer is server push only
-        return
+        action = content.get('action') if isinstance(content, dict) else None
+        if action == 'mark_all_read':
+            ids = None
+        elif action == 'mark_read' and isinstance(content.get('ids'), list):
+            ids = [i for i in content['ids'] if isinstance(i, int)]
+        else:
+            return
+        count = await self.mark_read(ids)
+        # every open tab of this user, including this one, gets the new badge count
+        await self.channel_layer.group_send(self.group_name, {'type': 'notification.count', 'unread': count})
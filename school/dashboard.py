@@ -0,0 +1,167 @@
+"""Cached aggregates behind ``DashboardView``.
+
+Every piece of the admin/teacher dashboard lives under its own cache key so
+writes can adjust just the part they affect: counters are incremented or
+decremented in place, recent-item lists are dropped and rebuilt on the next
+read. Parent dashboards are cached whole, per parent and per day, and are
+dropped when anything about one of their children changes.
+
+The receivers in ``school.signals`` call the ``*_changed`` hooks below once
+the write commits, so a rolled-back transaction leaves the cache alone; bulk
+writes that bypass model signals register the hooks with ``on_commit``
+themselves. ``?fresh=1`` on the dashboard recomputes every figure.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import User, Student, AttendanceRecord, BehaviourIncident
+from .guardians import child_ids
+from .notifications import guardians_by_student
+
+TOTAL_KEYS = {
+    'total_students': 'dashboard:total_students',
+    'total_parents': 'dashboard:total_parents',
+    'total_teachers': 'dashboard:total_teachers',
+}
+RECENT_STUDENTS_KEY = 'dashboard:recent_students'
+RECENT_INCIDENTS_KEY = 'dashboard:recent_incidents'
+
+
+def _attendance_key(day):
+    return f'dashboard:attendance:{day.isoformat()}'
+
+
+def _parent_key(user_id, day):
+    return f'dashboard:parent:{user_id}:{day.isoformat()}'
+
+
+def _cached(key, compute, fresh=False):
+    if not fresh:
+        value = cache.get(key)
+        if value is not None:
+            return value
+    value = compute()
+    cache.set(key, value, settings.DASHBOARD_CACHE_TIMEOUT)
+    return value
+
+
+def _adjust(key, delta):
+    # counters that are not cached yet are simply computed on the next read
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def _incident_summary(i):
+    return {
+        'id': i.id,
+        'student': {'id': i.student.id, 'name': f"{i.student.first_name} {i.student.last_name}"} if i.student else None,
+        'date': i.date.isoformat() if getattr(i, 'date', None) is not None else None,
+        'severity': i.severity,
+        'description': (i.description[:140] + '...') if i.description and len(i.description) > 140 else i.description,
+    }
+
+
+def _recent_students():
+    return [
+        {
+            'id': s.id,
+            'first_name': s.first_name,
+            'last_name': s.last_name,
+            'admission_number': s.admission_number,
+            'class': s.current_class.name if s.current_class else None,
+            'created_at': s.created_at.isoformat() if getattr(s, 'created_at', None) is not None else None,
+        }
+        for s in Student.objects.select_related('current_class').order_by('-created_at')[:6]
+    ]
+
+
+def _recent_incidents():
+    return [_incident_summary(i) for i in BehaviourIncident.objects.select_related('student').order_by('-date')[:6]]
+
+
+def staff_dashboard(fresh=False):
+    """Totals, today's attendance and recent items for admins and teachers."""
+    today = timezone.now().date()
+    return {
+        'total_students': _cached(TOTAL_KEYS['total_students'], Student.objects.count, fresh),
+        'total_parents': _cached(TOTAL_KEYS['total_parents'], User.objects.filter(role='parent').count, fresh),
+        'total_teachers': _cached(TOTAL_KEYS['total_teachers'], User.objects.filter(role='teacher').count, fresh),
+        'attendance_today': _cached(_attendance_key(today), AttendanceRecord.objects.filter(date=today).count, fresh),
+        'recent_students': _cached(RECENT_STUDENTS_KEY, _recent_students, fresh),
+        'recent_incidents': _cached(RECENT_INCIDENTS_KEY, _recent_incidents, fresh),
+    }
+
+
+def parent_dashboard(user, fresh=False):
+    """A parent's children, their attendance today and recent incidents."""
+    today = timezone.now().date()
+
+    def compute():
+        children = child_ids(user)
+        students = [
+            {
+                'id': s.id,
+                'first_name': s.first_name,
+                'last_name': s.last_name,
+                'admission_number': s.admission_number,
+                'class': s.current_class.name if s.current_class else None,
+            }
+            for s in Student.objects.filter(id__in=children).select_related('current_class')
+        ]
+        incidents = BehaviourIncident.objects.select_related('student').filter(student_id__in=children).order_by('-date')[:6]
+        return {
+            'students': students,
+            'attendance_today': AttendanceRecord.objects.filter(student_id__in=children, date=today).count(),
+            'recent_incidents': [_incident_summary(i) for i in incidents],
+        }
+
+    return _cached(_parent_key(user.id, today), compute, fresh)
+
+
+def forget_parents(user_ids):
+    """Drop today's cached dashboards for these parents."""
+    today = timezone.now().date()
+    cache.delete_many([_parent_key(user_id, today) for user_id in user_ids])
+
+
+def forget_guardians_of(student_ids):
+    guardians = guardians_by_student(student_ids)
+    forget_parents({user_id for users in guardians.values() for user_id in users})
+
+
+# --- write hooks ---
+
+def student_changed(student, created=False, deleted=False):
+    if created:
+        _adjust(TOTAL_KEYS['total_students'], 1)
+    elif deleted:
+        # guardians are unlinked before post_delete; see the pre_delete receiver
+        _adjust(TOTAL_KEYS['total_students'], -1)
+    else:
+        forget_guardians_of([student.pk])
+    cache.delete(RECENT_STUDENTS_KEY)
+
+
+def user_changed(user, created=False, deleted=False, update_fields=None):
+    key = {'parent': TOTAL_KEYS['total_parents'], 'teacher': TOTAL_KEYS['total_teachers']}.get(user.role)
+    if created or deleted:
+        if key:
+            _adjust(key, 1 if created else -1)
+    elif update_fields is None or 'role' in update_fields:
+        # the role may have changed; recount both on the next read
+        cache.delete_many([TOTAL_KEYS['total_parents'], TOTAL_KEYS['total_teachers']])
+
+
+def attendance_changed(day, student_ids, created=0, deleted=0):
+    if created or deleted:
+        _adjust(_attendance_key(day), created - deleted)
+    if student_ids:
+        forget_guardians_of(student_ids)
+
+
+def incident_changed(incident):
+    cache.delete(RECENT_INCIDENTS_KEY)
+    forget_guardians_of([incident.student_id])
@@ -0,0 +1,136 @@
+"""Streaming CSV / NDJSON exports.
+
+``ExportMixin`` adds an ``export`` list action to a ViewSet. Rows are read
+with ``values_list().iterator()`` (a server-side cursor on PostgreSQL) and
+written to a ``StreamingHttpResponse`` as they arrive, so memory use does not
+depend on the size of the export. Under ASGI the body is an async generator
+that pulls ``CHUNK_SIZE`` lines at a time through ``sync_to_async``; Django
+would otherwise read a sync iterator to the end before sending anything.
+
+The ViewSet's ``get_queryset`` still applies, which keeps the role-based
+filtering (parents only export their children's rows).
+
+``GET /api/<prefix>/export/?format=csv|ndjson&school_class=&term=&date_from=&date_to=``
+"""
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.http import StreamingHttpResponse
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+
+from .models import SchoolClass, Term
+
+CHUNK_SIZE = 2000
+
+
+class _ErrorBodyRenderer(BaseRenderer):
+    """Export formats stream their own body; the renderer only serializes error responses."""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class CSVRenderer(_ErrorBodyRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(_ErrorBodyRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class ExportFilterSerializer(serializers.Serializer):
+    school_class = serializers.PrimaryKeyRelatedField(queryset=SchoolClass.objects.all(), required=False)
+    term = serializers.PrimaryKeyRelatedField(queryset=Term.objects.all(), required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+
+class _Echo:
+    """csv.writer target that hands back each formatted line instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(headers, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+async def async_chunks(lines, size):
+    """Yield ``lines`` in ``size``-line strings, reading each chunk in the request's sync thread."""
+    lines = iter(lines)
+    # thread-sensitive, so the cursor stays on the thread (and connection) that opened it
+    pull = sync_to_async(lambda: ''.join(itertools.islice(lines, size)), thread_sensitive=True)
+    while chunk := await pull():
+        yield chunk
+
+
+class ExportMixin:
+    """Add a streaming ``export`` action.
+
+    Subclasses set ``export_columns`` (``(header, lookup)`` pairs for
+    ``values_list``) and the lookups used by the filters: ``export_class_lookup``
+    (pupil's class), ``export_date_lookup`` and, where the rows belong to an
+    assessment, ``export_term_lookup``; otherwise ``term`` filters by the
+    term's dates.
+    """
+    export_columns = ()
+    export_class_lookup = 'student__current_class'
+    export_date_lookup = 'date'
+    export_term_lookup = None
+
+    def filter_export(self, qs, params):
+        if 'school_class' in params:
+            qs = qs.filter(**{self.export_class_lookup: params['school_class']})
+        term = params.get('term')
+        if term is not None:
+            if self.export_term_lookup:
+                qs = qs.filter(**{self.export_term_lookup: term})
+            else:
+                qs = qs.filter(**{f'{self.export_date_lookup}__range': (term.start_date, term.end_date)})
+        if 'date_from' in params:
+            qs = qs.filter(**{f'{self.export_date_lookup}__gte': params['date_from']})
+        if 'date_to' in params:
+            qs = qs.filter(**{f'{self.export_date_lookup}__lte': params['date_to']})
+        return qs
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        params = ExportFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = self.filter_export(self.get_queryset(), params.validated_data)
+        # the body streams after the view returns, outside the request's routing scope
+        qs = qs.using(router.db_for_read(qs.model))
+        headers = [header for header, _ in self.export_columns]
+        rows = qs.order_by('pk').values_list(*(lookup for _, lookup in self.export_columns)).iterator(chunk_size=CHUNK_SIZE)
+
+        if request.accepted_renderer.format == 'ndjson':
+            lines, content_type, extension = ndjson_lines(headers, rows), 'application/x-ndjson', 'ndjson'
+        else:
+            lines, content_type, extension = csv_lines(headers, rows), 'text/csv; charset=utf-8', 'csv'
+        if isinstance(request._request, ASGIRequest):
+            lines = async_chunks(lines, CHUNK_SIZE)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{self.basename}-export.{extension}"'
+        return response
@@ -0,0 +1,106 @@
+"""Class gradebook: a student x assessment score matrix for one term.
+
+Rows are the class's active pupils and columns are the term's assessments for
+the class, so a pupil or assessment with no marks yet still has its row or
+column. Scores come from one ``values_list`` query over those rows and
+columns; totals, means, standard deviations and ranks are then whole-column
+operations over the pivoted lists. The payload is columnar (parallel lists
+rather than one object per cell) to keep it compact.
+
+Missing scores: the weighted total (and so the rank) counts a missing score
+as 0, so a pupil with one mark of 100 does not outrank one who sat every
+assessment. A pupil with no scores at all has no total and is unranked.
+Subject averages and the per-assessment and per-subject statistics use
+recorded scores only.
+"""
+from statistics import fmean, pstdev
+
+from .models import Assessment, GradeEntry, Student
+from .reports import rank_with_ties
+
+
+def _weighted_mean(scores, weights):
+    pairs = [(s, w) for s, w in zip(scores, weights) if s is not None]
+    total_weight = sum(w for _, w in pairs)
+    return round(sum(s * w for s, w in pairs) / total_weight, 2) if total_weight else None
+
+
+def _weighted_total(scores, weights):
+    """Weighted mean over every assessment, a missing score counting as 0; None without any score."""
+    total_weight = sum(weights)
+    if not total_weight or all(s is None for s in scores):
+        return None
+    return round(sum((s or 0) * w for s, w in zip(scores, weights)) / total_weight, 2)
+
+
+def _column_stats(values):
+    present = [v for v in values if v is not None]
+    if not present:
+        return None, None
+    return round(fmean(present), 2), round(pstdev(present), 2)
+
+
+def class_gradebook(school_class, term_id):
+    pupils = (
+        Student.objects.filter(current_class=school_class, is_active=True)
+        .order_by('last_name', 'first_name', 'id')
+        .values_list('id', 'first_name', 'last_name', 'admission_number')
+    )
+    students = {sid: (last, first, admission) for sid, first, last, admission in pupils}
+    columns = (
+        Assessment.objects.filter(school_class=school_class, term_id=term_id)
+        .order_by('subject__name', 'id')
+        .values_list('id', 'subject__name', 'title', 'weight')
+    )
+    assessments = {aid: (subject, title, weight) for aid, subject, title, weight in columns}
+    cells = {}
+    if students and assessments:
+        entries = GradeEntry.objects.filter(assessment__in=list(assessments), student__in=list(students))
+        for sid, aid, score in entries.values_list('student_id', 'assessment_id', 'score'):
+            cells[(sid, aid)] = score
+
+    student_ids = list(students)
+    assessment_ids = list(assessments)
+    weights = [assessments[a][2] for a in assessment_ids]
+    matrix = [[cells.get((s, a)) for a in assessment_ids] for s in student_ids]
+
+    subjects = sorted({assessments[a][0] for a in assessment_ids})
+    subject_columns = [[i for i, a in enumerate(assessment_ids) if assessments[a][0] == name] for name in subjects]
+    subject_averages = [
+        [_weighted_mean([row[i] for i in cols], [weights[i] for i in cols]) for cols in subject_columns]
+        for row in matrix
+    ]
+    subject_stats = [_column_stats([row[j] for row in subject_averages]) for j in range(len(subjects))]
+    assessment_stats = [_column_stats([row[i] for row in matrix]) for i in range(len(assessment_ids))]
+
+    totals = [_weighted_total(row, weights) for row in matrix]
+    ranks = rank_with_ties(dict(enumerate(totals)))
+
+    return {
+        'school_class': {'id': school_class.id, 'name': school_class.name},
+        'term': term_id,
+        'students': {
+            'id': student_ids,
+            'name': [f'{students[s][1]} {students[s][0]}' for s in student_ids],
+            'admission_number': [students[s][2] for s in student_ids],
+            'weighted_total': totals,
+            'rank': [ranks.get(i) for i in range(len(student_ids))],
+        },
+        'assessments': {
+            'id': assessment_ids,
+            'title': [assessments[a][1] for a in assessment_ids],
+            'subject': [assessments[a][0] for a in assessment_ids],
+            'weight': weights,
+            'mean': [m for m, _ in assessment_stats],
+            'std': [sd for _, sd in assessment_stats],
+        },
+        'subjects': {
+            'name': subjects,
+            'mean': [m for m, _ in subject_stats],
+            'std': [sd for _, sd in subject_stats],
+        },
+        # rows follow students.id, columns follow assessments.id / subjects.name; null = no score
+        # (counted as 0 in weighted_total, see the module docstring)
+        'scores': matrix,
+        'subject_averages': subject_averages,
+    }
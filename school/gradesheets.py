@@ -0,0 +1,185 @@
+"""Bulk grade-sheet import.
+
+Scores for one assessment arrive either as a JSON list or as a CSV/XLSX
+upload. Rows are read lazily, validated and written in chunks with
+``bulk_create``/``bulk_update``, and guardian notifications for the new
+entries are left to the outbox worker (a single ``grades.recorded`` event).
+"""
+import csv
+import io
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import GradeEntry, Student
+from . import outbox
+from .serializers import GradeSheetEntrySerializer
+
+CHUNK_SIZE = 500
+
+
+class GradeSheetError(Exception):
+    """Raised when an uploaded grade sheet cannot be read."""
+
+
+def iter_upload_rows(upload):
+    """Yield one dict per data row of an uploaded CSV or XLSX grade sheet."""
+    if (upload.name or '').lower().endswith('.xlsx'):
+        return _iter_xlsx_rows(upload)
+    return _iter_csv_rows(upload)
+
+
+def _check_header(header):
+    if 'score' not in header or not ({'student', 'admission_number'} & set(header)):
+        raise GradeSheetError('grade sheet needs a score column and a student or admission_number column')
+
+
+def _iter_csv_rows(upload):
+    text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = [(h or '').strip().lower() for h in next(reader, [])]
+        _check_header(header)
+        for values in reader:
+            if not any(v.strip() for v in values):
+                continue
+            # blank cells are missing values, e.g. no student id on an admission_number row
+            yield {key: value.strip() or None for key, value in zip(header, values) if key}
+    except UnicodeDecodeError:
+        raise GradeSheetError('CSV grade sheets must be UTF-8 encoded')
+    finally:
+        # leave the underlying upload open for Django to clean up
+        text.detach()
+
+
+def _iter_xlsx_rows(upload):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise GradeSheetError('XLSX grade sheets require openpyxl; upload a CSV instead')
+
+    try:
+        workbook = load_workbook(upload, read_only=True, data_only=True)
+    except Exception:
+        raise GradeSheetError('could not read XLSX file')
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h).strip().lower() if h is not None else '' for h in next(rows, ())]
+        _check_header(header)
+        for values in rows:
+            if all(v is None or v == '' for v in values):
+                continue
+            row = {}
+            for key, value in zip(header, values):
+                if isinstance(value, str):
+                    value = value.strip() or None
+                if not key or value is None:
+                    continue
+                # spreadsheets store whole numbers (ids, admission numbers) as floats
+                if isinstance(value, float) and value.is_integer() and key != 'score':
+                    value = int(value)
+                row[key] = value
+            yield row
+    finally:
+        workbook.close()
+
+
+def import_grade_sheet(assessment, rows, user):
+    """Upsert ``rows`` as grade entries for ``assessment``.
+
+    Returns a summary dict with one result per row, in input order. Rows that
+    fail validation are reported and skipped; the rest are saved. Only pupils
+    enrolled in the assessment's class are accepted.
+    """
+    results = []
+    created = []
+    seen = set()
+    counts = {'created': 0, 'updated': 0, 'errors': 0}
+
+    with transaction.atomic():
+        numbered = enumerate(rows)
+        while True:
+            chunk = list(islice(numbered, CHUNK_SIZE))
+            if not chunk:
+                break
+            created.extend(_import_chunk(assessment, chunk, user, seen, results, counts))
+        if created:
+            # one outbox row; the worker notifies guardians
+            outbox.enqueue('grades.recorded', {'entries': [entry.pk for entry in created]})
+
+    return {'assessment': assessment.id, **counts, 'results': results}
+
+
+def _import_chunk(assessment, chunk, user, seen, results, counts):
+    chunk_results = []
+    parsed = []
+    for index, row in chunk:
+        entry = GradeSheetEntrySerializer(data=row)
+        if entry.is_valid():
+            parsed.append((index, entry.validated_data))
+            chunk_results.append(None)
+        else:
+            chunk_results.append(_error(index, row.get('student') or row.get('admission_number'), entry.errors))
+
+    # resolve ids / admission numbers and check enrolment in one query
+    ids = {d['student'] for _, d in parsed if d.get('student') is not None}
+    numbers = {d['admission_number'] for _, d in parsed if d.get('student') is None}
+    by_id = {}
+    by_number = {}
+    if parsed:
+        enrolled = Student.objects.filter(current_class_id=assessment.school_class_id).filter(
+            Q(id__in=ids) | Q(admission_number__in=numbers)
+        ).values_list('id', 'admission_number')
+        for student_id, number in enrolled:
+            by_id[student_id] = student_id
+            by_number[number] = student_id
+
+    valid = {}
+    for index, data in parsed:
+        key = data.get('student')
+        student_id = by_id.get(key) if key is not None else by_number.get(data['admission_number'])
+        slot = index - chunk[0][0]
+        if student_id is None:
+            chunk_results[slot] = _error(index, key or data['admission_number'], {'student': ['Student is not enrolled in this class.']})
+        elif student_id in seen:
+            chunk_results[slot] = _error(index, student_id, {'student': ['Duplicate entry for this student.']})
+        else:
+            seen.add(student_id)
+            valid[student_id] = (slot, data)
+
+    existing = dict(
+        GradeEntry.objects.filter(assessment=assessment, student_id__in=valid.keys()).values_list('student_id', 'id')
+    )
+    to_create = []
+    to_update = []
+    for student_id, (slot, data) in valid.items():
+        entry = GradeEntry(
+            id=existing.get(student_id),
+            student_id=student_id,
+            assessment=assessment,
+            score=data['score'],
+            remarks=data.get('remarks'),
+            recorded_by=user,
+        )
+        (to_update if entry.id else to_create).append(entry)
+        chunk_results[slot] = {
+            'index': chunk[slot][0],
+            'student': student_id,
+            'status': 'updated' if entry.id else 'created',
+            'score': data['score'],
+        }
+    if to_update:
+        GradeEntry.objects.bulk_update(to_update, ['score', 'remarks', 'recorded_by'])
+    if to_create:
+        GradeEntry.objects.bulk_create(to_create)
+
+    counts['created'] += len(to_create)
+    counts['updated'] += len(to_update)
+    counts['errors'] += sum(1 for r in chunk_results if r['status'] == 'error')
+    results.extend(chunk_results)
+    return to_create
+
+
+def _error(index, student, errors):
+    return {'index': index, 'student': student, 'status': 'error', 'errors': errors}
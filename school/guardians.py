@@ -0,0 +1,36 @@
+"""Which pupils each parent is a guardian of.
+
+A parent's child ids are cached in the Django cache (``guardian:children:<id>``)
+and memoized on the request, so permission checks and parent-scoped querysets
+filter with ``student_id__in`` instead of joining the guardian m2m table on
+every request. ``school.signals`` drops a parent's entry whenever their
+guardian links change.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Student
+
+
+def _key(user_id):
+    return f'guardian:children:{user_id}'
+
+
+def child_ids(user, request=None):
+    """The ids of the pupils ``user`` is a guardian of, as a frozenset."""
+    memo = getattr(request, '_guardian_child_ids', None)
+    if memo is not None and memo[0] == user.pk:
+        return memo[1]
+    ids = cache.get(_key(user.pk))
+    if ids is None:
+        ids = list(Student.guardian.through.objects.filter(user_id=user.pk).values_list('student_id', flat=True))
+        cache.set(_key(user.pk), ids, settings.GUARDIAN_CACHE_TIMEOUT)
+    ids = frozenset(ids)
+    if request is not None:
+        request._guardian_child_ids = (user.pk, ids)
+    return ids
+
+
+def forget(user_ids):
+    """Drop the cached child ids of these parents."""
+    cache.delete_many([_key(user_id) for user_id in user_ids])
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from school.fastserializers import FastListMixin, compile_serializer
+from school.models import User
+from school.urls import router
+
+
+class Command(BaseCommand):
+    help = "Print the SQL and EXPLAIN plan of every router ViewSet's list query, as seen by one user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to run the queries as (default: first superuser or admin).')
+        parser.add_argument('--analyze', action='store_true', help='Run EXPLAIN ANALYZE (PostgreSQL only).')
+        parser.add_argument('--only', action='append', help='Only explain this router prefix (repeatable).')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        factory = APIRequestFactory()
+        explain_options = {'analyze': True} if options['analyze'] else {}
+
+        for prefix, viewset, basename in router.registry:
+            if options['only'] and prefix not in options['only']:
+                continue
+            request = factory.get(f'/api/{prefix}/')
+            force_authenticate(request, user=user)
+            view = viewset(action_map={'get': 'list'}, basename=basename, detail=False)
+            view.action = 'list'
+            view.args, view.kwargs = (), {}
+            view.format_kwarg = None
+            view.request = view.initialize_request(request)
+            view.headers = {}
+
+            qs = view.filter_queryset(view.get_queryset())
+            if isinstance(view, FastListMixin):
+                # these views list from values() through the compiled serializer
+                qs = compile_serializer(view.get_serializer_class()).values(qs)
+            qs = self.page_query(view, qs)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== /api/{prefix}/ ({viewset.__name__}) as {user.username}'))
+            self.stdout.write(str(qs.query))
+            self.stdout.write(qs.explain(**explain_options))
+            self.stdout.write('')
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {username!r}')
+        user = User.objects.filter(is_superuser=True).first() or User.objects.filter(role='admin').first()
+        if user is None:
+            raise CommandError('No superuser or admin found; pass --user')
+        return user
+
+    def page_query(self, view, qs):
+        """Apply the ordering and LIMIT the view's paginator would use for page one."""
+        paginator = view.paginator
+        if isinstance(paginator, CursorPagination):
+            ordering = paginator.get_ordering(view.request, qs, view)
+            return qs.order_by(*ordering)[:paginator.get_page_size(view.request) + 1]
+        if isinstance(paginator, LimitOffsetPagination):
+            return qs[:paginator.get_limit(view.request)]
+        return qs
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from school.models import SchoolClass, Term, User
+from school.reports import generate_term_reports
+
+
+class Command(BaseCommand):
+    help = "Generate report card PDFs for a term, skipping reports whose inputs have not changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', type=int, required=True, help='Term id.')
+        parser.add_argument('--class', type=int, action='append', dest='classes', help='Only this class id (repeatable).')
+        parser.add_argument('--workers', type=int, help='Render processes (default: settings.REPORT_WORKERS).')
+        parser.add_argument('--force', action='store_true', help='Regenerate even unchanged reports.')
+        parser.add_argument('--user', help='Username recorded as generated_by.')
+
+    def handle(self, *args, **options):
+        try:
+            term = Term.objects.select_related('academic_year').get(pk=options['term'])
+        except Term.DoesNotExist:
+            raise CommandError(f"No term with id {options['term']}")
+        classes = None
+        if options['classes']:
+            classes = list(SchoolClass.objects.filter(pk__in=options['classes']))
+            missing = set(options['classes']) - {c.pk for c in classes}
+            if missing:
+                raise CommandError(f'No class with id {sorted(missing)}')
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}")
+
+        summary = generate_term_reports(term, classes=classes, workers=options['workers'], force=options['force'], user=user)
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary['generated']} reports, skipped {summary['skipped']} unchanged."))
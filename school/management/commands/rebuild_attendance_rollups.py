@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from school import analytics
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-class daily attendance rollups from the attendance records.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='First date (YYYY-MM-DD) to rebuild.')
+        parser.add_argument('--to', dest='date_to', help='Last date (YYYY-MM-DD) to rebuild.')
+        parser.add_argument('--class', type=int, action='append', dest='classes', help='Only this class id (repeatable).')
+
+    def handle(self, *args, **options):
+        rows = analytics.rebuild(options['date_from'], options['date_to'], options['classes'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily rollups.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from school import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the pupil search keys from the student table.'
+
+    def handle(self, *args, **options):
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} pupils.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from school import unread
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized unread-message counters from message read receipts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--thread', type=int, action='append', dest='threads', help='Only rebuild this thread (repeatable).')
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only rebuild this user (repeatable).')
+
+    def handle(self, *args, **options):
+        rows = unread.rebuild(thread_ids=options['threads'], user_ids=options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} thread counters.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from school import responsecache
+
+
+class Command(BaseCommand):
+    help = 'Show response cache hits and misses per view.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after reporting.')
+
+    def handle(self, *args, **options):
+        report = responsecache.stats(reset=options['reset'])
+        if not report:
+            self.stdout.write('No cached views have been requested yet.')
+        for view, row in sorted(report.items()):
+            self.stdout.write(f"{view:<32} hits {row['hit']:>8}  misses {row['miss']:>8}  hit rate {row['hit_rate']}%")
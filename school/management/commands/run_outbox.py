@@ -0,0 +1,20 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from school import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver outbox events: guardian notifications and websocket pushes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE, help='Events claimed per batch.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when nothing is due.')
+        parser.add_argument('--once', action='store_true', help='Exit once no events are due.')
+
+    def handle(self, *args, **options):
+        try:
+            asyncio.run(outbox.run(options['batch_size'], options['interval'], options['once']))
+        except KeyboardInterrupt:
+            pass
@@ -1,12 +1,83 @@
+import hashlib
+import time
+import urllib.parse
+
 from channels.middleware import BaseMiddleware
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.db import close_old_connections
 from asgiref.sync import sync_to_async
 
+from . import profiling
+from .models import User
+
+class CachedUser:
+    """The few ``User`` fields socket and async code needs, cached per access token."""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username, role, is_superuser):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.is_superuser = is_superuser
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __repr__(self):
+        return f'<CachedUser {self.id} {self.username}>'
+
+
+_jwt_auth = JWTAuthentication()
+
+
+def _token_key(raw_token):
+    return 'jwtuser:' + hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+def _load_user(validated):
+    """Read the user projection for a validated token; None if missing or inactive."""
+    user_id = validated.get(jwt_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None
+    row = (
+        User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}, is_active=True)
+        .values('id', 'username', 'role', 'is_superuser').first()
+    )
+    return row
+
+
+async def user_for_token(raw_token):
+    """Resolve a JWT access token to a ``CachedUser`` (or ``AnonymousUser``).
+
+    The projection is cached under a hash of the token for at most
+    ``settings.JWT_USER_CACHE_TIMEOUT`` seconds and never past the token's
+    expiry, so repeated connects with the same token skip the database.
+    """
+    key = _token_key(raw_token)
+    row = await cache.aget(key)
+    if row is None:
+        try:
+            validated = _jwt_auth.get_validated_token(raw_token)
+        except Exception:
+            return AnonymousUser()
+        row = await sync_to_async(_load_user)(validated) or {}
+        ttl = min(int(validated['exp'] - time.time()), settings.JWT_USER_CACHE_TIMEOUT)
+        if ttl > 0:
+            await cache.aset(key, row, ttl)
+    return CachedUser(**row) if row else AnonymousUser()
+
+
 class JWTAuthMiddleware(BaseMiddleware):
     """Custom middleware that takes a JWT token from the query string `token` and
     authenticates the user for the scope.
+
+    ``scope['user']`` is a ``CachedUser`` projection, see ``user_for_token``.
     """
     async def __call__(self, scope, receive, send):
         # Close old DB connections to prevent usage in threads
@@ -15,21 +86,77 @@ class JWTAuthMiddleware(BaseMiddleware):
         token = None
         if query_string:
             try:
-                import urllib.parse
                 qs = urllib.parse.parse_qs(query_string)
                 token = qs.get('token', [None])[0]
             except Exception:
                 token = None
 
-        if token:
-            try:
-                jwt_auth = JWTAuthentication()
-                validated = jwt_auth.get_validated_token(token)
-                user = await sync_to_async(jwt_auth.get_user)(validated)
-                scope['user'] = user
-            except Exception:
-                scope['user'] = AnonymousUser()
-        else:
-            scope['user'] = AnonymousUser()
-
+        scope['user'] = await user_for_token(token) if token else AnonymousUser()
         return await super().__call__(scope, receive, send)
+
+
+class RequestProfilingMiddleware:
+    """Opt-in HTTP profiling (see ``school.profiling`` and ``REQUEST_PROFILING`` in settings).
+
+    For a sampled request it records SQL query count and time, repeated query
+    shapes, time spent in the view outside SQL (serializer and Python work),
+    any ``profiling.span`` blocks the view ran (``serialize`` for compiled
+    list serialization), response rendering time and total wall time. The figures are returned in a
+    ``Server-Timing`` header and logged as one JSON line on the
+    ``school.profiling`` logger, at WARNING when the request is slower than
+    ``SLOW_MS``.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.enabled() or not profiling.sampled():
+            return self.get_response(request)
+
+        with profiling.profile(f'{request.method} {request.path}') as p:
+            response = self.get_response(request)
+        p.finish()
+
+        if settings.REQUEST_PROFILING.get('SERVER_TIMING', True):
+            response['Server-Timing'] = self.server_timing(p)
+        user = getattr(request, 'user', None)
+        profiling.log(
+            p,
+            protocol='http',
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            user=getattr(user, 'id', None),
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        p = profiling.current()
+        if p is not None:
+            request._profile_view_start = (time.perf_counter(), p.db_time)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this hook; time the view up to here
+        # and the renderer via a post-render callback
+        p = profiling.current()
+        start = getattr(request, '_profile_view_start', None)
+        if p is not None and start is not None:
+            started, db_before = start
+            p.add_span('view', (time.perf_counter() - started) - (p.db_time - db_before))
+            render_start = time.perf_counter()
+
+            def rendered(r):
+                p.add_span('render', time.perf_counter() - render_start)
+            response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def server_timing(p):
+        parts = [f'db;dur={p.db_time * 1000:.1f};desc="{p.queries} queries"']
+        for name, duration in p.spans.items():
+            parts.append(f'{name};dur={duration * 1000:.1f}')
+        duplicates = p.duplicates()
+        if duplicates:
+            parts.append(f'dup;desc="{len(duplicates)} repeated query shapes, worst x{duplicates[0][1]}"')
+        parts.append(f'total;dur={p.total * 1000:.1f}')
+        return ', '.join(parts)
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    # same counts as school.unread.rebuild; there are no read watermarks yet
+    MessageThread = apps.get_model('school', 'MessageThread')
+    Message = apps.get_model('school', 'Message')
+    ThreadReadState = apps.get_model('school', 'ThreadReadState')
+    UserUnreadCount = apps.get_model('school', 'UserUnreadCount')
+    Participant = MessageThread.participants.through
+    # the participants table is new: seed it with everyone who sent or read a message in the thread
+    members = set(Message.objects.filter(sender__isnull=False).values_list('thread_id', 'sender_id'))
+    members.update(Message.read_by.through.objects.values_list('message__thread_id', 'user_id'))
+    Participant.objects.bulk_create(
+        [Participant(messagethread_id=t, user_id=u) for t, u in members], batch_size=1000, ignore_conflicts=True
+    )
+    unread = (
+        Message.objects
+        .filter(thread_id=OuterRef('messagethread_id'))
+        .filter(~Exists(Message.read_by.through.objects.filter(message_id=OuterRef('pk'), user_id=OuterRef(OuterRef('user_id')))))
+        .values('thread_id')
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    rows = list(
+        Participant.objects
+        .annotate(unread=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)))
+        .values_list('messagethread_id', 'user_id', 'unread')
+    )
+    ThreadReadState.objects.bulk_create(
+        [ThreadReadState(thread_id=t, user_id=u, unread_count=c) for t, u, c in rows], batch_size=1000
+    )
+    totals = {}
+    for _, user_id, count in rows:
+        totals[user_id] = totals.get(user_id, 0) + count
+    UserUnreadCount.objects.bulk_create(
+        [UserUnreadCount(user_id=u, unread=total) for u, total in totals.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserUnreadCount',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='participants',
+            field=models.ManyToManyField(blank=True, related_name='threads', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='ThreadReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.IntegerField(default=0)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='school.messagethread')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thread_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('thread', 'user')},
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
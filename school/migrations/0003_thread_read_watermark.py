@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0002_unread_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='threadreadstate',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='school.message'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0004_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='termreport',
+            name='inputs_digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='termreport',
+            name='summary',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0006_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='kind',
+            field=models.CharField(choices=[('grades.recorded', 'Grades recorded'), ('incident.reported', 'Incident reported'), ('unread.changed', 'Unread counts changed'), ('notifications.changed', 'Notifications read'), ('push', 'Channel-layer push retry')], max_length=50),
+        ),
+    ]
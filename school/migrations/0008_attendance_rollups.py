@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_rollups(apps, schema_editor):
+    AttendanceRecord = apps.get_model('school', 'AttendanceRecord')
+    AttendanceDailyRollup = apps.get_model('school', 'AttendanceDailyRollup')
+    statuses = ('present', 'absent', 'late', 'excused')
+    rows = (
+        AttendanceRecord.objects.filter(student__current_class__isnull=False)
+        .values('student__current_class', 'date')
+        .annotate(**{s: Count('id', filter=Q(status=s)) for s in statuses})
+        .order_by()
+    )
+    AttendanceDailyRollup.objects.bulk_create(
+        [AttendanceDailyRollup(school_class_id=row['student__current_class'], date=row['date'], **{s: row[s] for s in statuses}) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0007_outbox_notification_kinds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('present', models.IntegerField(default=0)),
+                ('absent', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('excused', models.IntegerField(default=0)),
+                ('school_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='school.schoolclass')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='rollup_date_idx')],
+                'unique_together': {('school_class', 'date')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
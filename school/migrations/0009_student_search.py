@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_search_keys(apps, schema_editor):
+    from school.search import keys_for
+
+    Student = apps.get_model('school', 'Student')
+    StudentSearchKey = apps.get_model('school', 'StudentSearchKey')
+    StudentSearchKey.objects.bulk_create(
+        [
+            StudentSearchKey(student_id=pk, key=key, is_variant=is_variant)
+            for pk, first, last, admission in Student.objects.values_list('pk', 'first_name', 'last_name', 'admission_number').iterator()
+            for key, is_variant in keys_for(first, last, admission)
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0008_attendance_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSearchKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('is_variant', models.BooleanField(default=False)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_keys', to='school.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key'], name='student_search_key_idx')],
+            },
+        ),
+        migrations.RunPython(populate_search_keys, migrations.RunPython.noop),
+    ]
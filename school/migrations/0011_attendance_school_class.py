@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def stamp_classes(apps, schema_editor):
+    # existing rollups were keyed on the pupil's current class; keep that
+    AttendanceRecord = apps.get_model('school', 'AttendanceRecord')
+    Student = apps.get_model('school', 'Student')
+    AttendanceRecord.objects.update(
+        school_class=Subquery(Student.objects.filter(pk=OuterRef('student')).values('current_class')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0010_attendance_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancerecord',
+            name='school_class',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attendance_records', to='school.schoolclass'),
+        ),
+        migrations.RunPython(stamp_classes, migrations.RunPython.noop),
+    ]
@@ -13,6 +13,12 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     phone = models.CharField(max_length=20, blank=True, null=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # dashboard totals count users per role
+            models.Index(fields=['role'], name='user_role_idx'),
+        ]
+
     def is_teacher(self):
         return self.role == 'teacher'
     def is_parent(self):
@@ -61,9 +67,29 @@ class Student(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # dashboard "recent students"
+            models.Index(fields=['-created_at'], name='student_created_idx'),
+            # class registers only list pupils still on roll
+            models.Index(fields=['current_class'], condition=models.Q(is_active=True), name='student_active_class_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.admission_number})"
 
+class StudentSearchKey(models.Model):
+    """One normalized token (or one-deletion variant of a token) of a pupil's names and admission number; see school.search."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='search_keys')
+    key = models.CharField(max_length=64)
+    is_variant = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # equality and prefix range lookups
+            models.Index(fields=['key'], name='student_search_key_idx'),
+        ]
+
 # --- Subjects ---
 class Subject(models.Model):
     name = models.CharField(max_length=100)
@@ -89,13 +115,37 @@ class AttendanceRecord(models.Model):
         ('excused', 'Excused'),
     )
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='attendance')
+    # the class the pupil was counted in (their class when the record was
+    # taken); the attendance rollups are keyed on it, not on current_class
+    school_class = models.ForeignKey(SchoolClass, on_delete=models.SET_NULL, null=True, blank=True, related_name='attendance_records')
     date = models.DateField()
     status = models.CharField(max_length=20, choices=ATTENDANCE_CHOICES)
     recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='attendance_records')
     note = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('student', 'date')
+        indexes = [
+            # per-day counts (dashboard); per-student history uses the unique key
+            models.Index(fields=['date'], name='attendance_date_idx'),
+        ]
+
+class AttendanceDailyRollup(models.Model):
+    """Per-class, per-day counts of each attendance status (maintained by school.analytics)."""
+    school_class = models.ForeignKey(SchoolClass, on_delete=models.CASCADE, related_name='attendance_rollups')
+    date = models.DateField()
+    present = models.IntegerField(default=0)
+    absent = models.IntegerField(default=0)
+    late = models.IntegerField(default=0)
+    excused = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('school_class', 'date')
+        indexes = [
+            # school-wide range queries; per-class ranges use the unique key
+            models.Index(fields=['date'], name='rollup_date_idx'),
+        ]
 
 # --- Assessments / Grades ---
 class Assessment(models.Model):
@@ -143,6 +193,13 @@ class BehaviourIncident(models.Model):
     severity = models.CharField(max_length=20, choices=SEVERITY, default='low')
     notified_parents = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # staff "recent incidents" and the parent variant filtered by child
+            models.Index(fields=['-date'], name='incident_date_idx'),
+            models.Index(fields=['student', '-date'], name='incident_student_date_idx'),
+        ]
+
 # --- Messaging between teacher/parent/admin ---
 class MessageThread(models.Model):
     subject = models.CharField(max_length=200)
@@ -157,6 +214,29 @@ class Message(models.Model):
     sent_at = models.DateTimeField(auto_now_add=True)
     read_by = models.ManyToManyField(User, related_name='read_messages', blank=True)
 
+    class Meta:
+        indexes = [
+            # thread message pages and the inbox "last message" subqueries
+            models.Index(fields=['thread', 'sent_at'], name='message_thread_sent_idx'),
+        ]
+
+# --- Unread message counters (maintained by school.unread) ---
+class ThreadReadState(models.Model):
+    """Per-participant unread count and read watermark for one thread."""
+    thread = models.ForeignKey(MessageThread, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='thread_read_states')
+    unread_count = models.IntegerField(default=0)
+    # every message up to and including this one counts as read by the user
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        unique_together = ('thread', 'user')
+
+class UserUnreadCount(models.Model):
+    """Total unread messages for a user across all of their threads."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    unread = models.IntegerField(default=0)
+
 # --- Notifications (simple) ---
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -166,6 +246,14 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     link = models.CharField(max_length=500, blank=True, null=True)  # e.g. link to student report
 
+    class Meta:
+        indexes = [
+            # a user's notification list, newest first
+            models.Index(fields=['user', '-created_at'], name='notification_user_created_idx'),
+            # unread badge counts only touch unread rows
+            models.Index(fields=['user'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
+
 # --- Report snapshot (e.g. term report export) ---
 class TermReport(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='term_reports')
@@ -173,6 +261,34 @@ class TermReport(models.Model):
     generated_at = models.DateTimeField(auto_now_add=True)
     generated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     pdf_file = models.FileField(upload_to='reports/', blank=True, null=True)  # optional generated PDF
+    inputs_digest = models.CharField(max_length=64, blank=True, default='')  # sha256 of the data the PDF was rendered from
+    summary = models.JSONField(default=dict, blank=True)
 
     class Meta:
         unique_together = ('student', 'term')
+
+# --- Transactional outbox for notification fan-out (drained by `manage.py run_outbox`) ---
+class OutboxEvent(models.Model):
+    KINDS = (
+        ('grades.recorded', 'Grades recorded'),
+        ('incident.reported', 'Incident reported'),
+        ('unread.changed', 'Unread counts changed'),
+        ('notifications.changed', 'Notifications read'),
+        ('push', 'Channel-layer push retry'),
+    )
+    kind = models.CharField(max_length=50, choices=KINDS)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)  # not claimed again before this time
+    attempts = models.PositiveIntegerField(default=0)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # the worker's claim query only scans pending rows
+            models.Index(fields=['available_at'], condition=models.Q(processed_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}"
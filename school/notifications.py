@@ -0,0 +1,132 @@
+"""Guardian notification helpers.
+
+Notifications are built in memory and written with a single ``bulk_create``
+so that recording one grade (or a whole grade sheet) costs a fixed number of
+queries however many guardians the pupils have.
+"""
+from django.db.models import Count
+
+from .models import Student, Assessment, Notification
+
+SNAPSHOT_SIZE = 20   # notifications sent when a socket connects without a resume id
+RESUME_LIMIT = 100   # most notifications replayed on resume; beyond that the client refetches over REST
+
+
+def guardians_by_student(student_ids):
+    """Map student id -> list of guardian user ids, read from the m2m table in one query."""
+    guardians = {}
+    rows = Student.guardian.through.objects.filter(student_id__in=student_ids).values_list('student_id', 'user_id')
+    for student_id, user_id in rows:
+        guardians.setdefault(student_id, []).append(user_id)
+    return guardians
+
+
+def _related(entries, name, model):
+    """Return {pk: obj} for a FK on ``entries``, reusing already-loaded relations."""
+    field = entries[0]._meta.get_field(name)
+    found = {}
+    missing = set()
+    for entry in entries:
+        if field.is_cached(entry):
+            obj = getattr(entry, name)
+            found[obj.pk] = obj
+        else:
+            missing.add(getattr(entry, field.attname))
+    if missing:
+        found.update(model.objects.in_bulk(missing))
+    return found
+
+
+def notify_guardians_of_grades(entries):
+    """Create one notification per guardian for each new grade entry."""
+    entries = list(entries)
+    if not entries:
+        return []
+    students = _related(entries, 'student', Student)
+    assessments = _related(entries, 'assessment', Assessment)
+    guardians = guardians_by_student(students.keys())
+
+    notifications = []
+    for entry in entries:
+        student = students[entry.student_id]
+        assessment = assessments[entry.assessment_id]
+        for user_id in guardians.get(entry.student_id, ()):
+            notifications.append(Notification(
+                user_id=user_id,
+                title=f"New grade for {student.first_name}",
+                message=f"{assessment.title} - {entry.score}. Remarks: {entry.remarks}",
+                link=f"/students/{student.id}/reports/{assessment.id}",
+            ))
+    return Notification.objects.bulk_create(notifications, batch_size=500)
+
+
+def notify_guardians_of_incidents(incidents):
+    """Create one notification per guardian of the pupil involved in each incident."""
+    incidents = list(incidents)
+    if not incidents:
+        return []
+    students = _related(incidents, 'student', Student)
+    guardians = guardians_by_student(students.keys())
+    notifications = [
+        Notification(
+            user_id=user_id,
+            title=f"Behaviour incident for {students[incident.student_id].first_name}",
+            message=incident.description,
+            link=f"/students/{incident.student_id}/incidents/{incident.id}",
+        )
+        for incident in incidents
+        for user_id in guardians.get(incident.student_id, ())
+    ]
+    return Notification.objects.bulk_create(notifications, batch_size=500)
+
+
+def as_message(notification):
+    """The JSON shape of a notification pushed over the websocket."""
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'link': notification.link,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def unread_counts(user_ids):
+    """Return {user_id: unread notifications} for several users in one query."""
+    counts = dict.fromkeys(user_ids, 0)
+    counts.update(
+        Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .values('user_id').annotate(n=Count('id')).order_by().values_list('user_id', 'n')
+    )
+    return counts
+
+
+def snapshot(user_id, last_id=None):
+    """What a (re)connecting socket needs: the unread count plus recent or missed notifications.
+
+    Without ``last_id`` the newest ``SNAPSHOT_SIZE`` notifications are sent.
+    With it, only notifications created after ``last_id`` are replayed (oldest
+    first, at most ``RESUME_LIMIT``; ``truncated`` tells the client there are more).
+    """
+    qs = Notification.objects.filter(user_id=user_id)
+    if last_id is None:
+        rows = list(qs.order_by('-id')[:SNAPSHOT_SIZE])
+        truncated = False
+    else:
+        rows = list(qs.filter(id__gt=last_id).order_by('id')[:RESUME_LIMIT + 1])
+        truncated = len(rows) > RESUME_LIMIT
+        rows = rows[:RESUME_LIMIT]
+    return {
+        'notifications': [as_message(n) for n in rows],
+        'truncated': truncated,
+        'unread': unread_counts([user_id])[user_id],
+    }
+
+
+def mark_read(user_id, ids=None):
+    """Mark a user's notifications (all, or just ``ids``) as read; returns how many changed."""
+    qs = Notification.objects.filter(user_id=user_id, is_read=False)
+    if ids is not None:
+        qs = qs.filter(id__in=ids)
+    return qs.update(is_read=True)
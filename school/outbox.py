@@ -0,0 +1,218 @@
+"""Transactional outbox for notification fan-out.
+
+Requests record what happened with ``enqueue``, which writes one
+``OutboxEvent`` row in the request's own transaction, and return without
+touching guardians or the channel layer. The ``run_outbox`` worker claims
+due events in batches and, per batch:
+
+* handles each kind of event together: guardian notifications for all the
+  grade entries / incidents in the batch are created with bulk inserts;
+* coalesces channel-layer messages to one ``group_send`` per user and
+  message type (``unread.count``, ``notification.new`` carrying every new
+  notification for that user, ``notification.count``), sent concurrently.
+
+When a kind's handler raises, its events are handled again one at a time, so
+one bad event cannot hold back the rest of its batch; each event that still
+fails stays pending with exponential backoff (``MAX_ATTEMPTS`` tries). Handling an event and marking it processed happen
+in one transaction; pushes that fail afterwards are queued again as a
+``push`` event, so database work is never repeated.
+"""
+import asyncio
+import datetime
+import logging
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BehaviourIncident, GradeEntry, OutboxEvent
+from .notifications import as_message, notify_guardians_of_grades, notify_guardians_of_incidents, unread_counts
+from . import unread
+
+logger = logging.getLogger('school.outbox')
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+BACKOFF_SECONDS = 5  # doubled after every failed attempt
+LEASE = datetime.timedelta(minutes=5)  # how long a claimed event stays hidden from other workers
+
+
+def enqueue(kind, payload, delay=None):
+    """Record an event for the worker; call inside the transaction that caused it."""
+    event = OutboxEvent(kind=kind, payload=payload)
+    if delay:
+        event.available_at = timezone.now() + delay
+    event.save()
+    return event
+
+
+def backoff(attempts):
+    return datetime.timedelta(seconds=BACKOFF_SECONDS * 2 ** max(attempts - 1, 0))
+
+
+def claim(batch_size=BATCH_SIZE):
+    """Lease up to ``batch_size`` due events to this worker."""
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, available_at__lte=now, attempts__lt=MAX_ATTEMPTS)
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if events:
+            OutboxEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+                available_at=now + LEASE, attempts=F('attempts') + 1
+            )
+    for event in events:
+        event.attempts += 1
+    return events
+
+
+# Handlers take a list of events of one kind and return channel-layer messages
+# keyed by (user_id, message type); see _merge for how a batch's messages combine.
+
+def _notification_counts(user_ids):
+    return {
+        (user_id, 'notification.count'): {'type': 'notification.count', 'unread': count}
+        for user_id, count in unread_counts(user_ids).items()
+    }
+
+
+def _new_notifications(notifications):
+    messages = {}
+    for n in notifications:
+        key = (n.user_id, 'notification.new')
+        messages.setdefault(key, {'type': 'notification.new', 'notifications': []})['notifications'].append(as_message(n))
+    messages.update(_notification_counts({n.user_id for n in notifications}))
+    return messages
+
+
+def _grades_recorded(events):
+    ids = [pk for event in events for pk in event.payload['entries']]
+    return _new_notifications(
+        notify_guardians_of_grades(GradeEntry.objects.filter(pk__in=ids).select_related('student', 'assessment'))
+    )
+
+
+def _incident_reported(events):
+    ids = [pk for event in events for pk in event.payload['incidents']]
+    return _new_notifications(
+        notify_guardians_of_incidents(BehaviourIncident.objects.filter(pk__in=ids).select_related('student'))
+    )
+
+
+def _notifications_changed(events):
+    return _notification_counts({user_id for event in events for user_id in event.payload['users']})
+
+
+def _unread_changed(events):
+    users = {user_id for event in events for user_id in event.payload['users']}
+    return {
+        (user_id, 'unread.count'): {'type': 'unread.count', 'unread': count}
+        for user_id, count in unread.unread_totals(users).items()
+    }
+
+
+def _push(events):
+    return {(user_id, message['type']): message for event in events for user_id, message in event.payload['messages']}
+
+
+HANDLERS = {
+    'grades.recorded': _grades_recorded,
+    'incident.reported': _incident_reported,
+    'unread.changed': _unread_changed,
+    'notifications.changed': _notifications_changed,
+    'push': _push,
+}
+
+
+def _merge(messages, new):
+    """New notification lists are appended; any other message replaces the older one."""
+    for key, message in new.items():
+        if key in messages and 'notifications' in message:
+            messages[key]['notifications'].extend(message['notifications'])
+        else:
+            messages[key] = message
+
+
+def handle(kind, events):
+    """Run one kind's handler and mark its events processed, atomically."""
+    with transaction.atomic():
+        messages = HANDLERS[kind](events)
+        OutboxEvent.objects.filter(pk__in=[e.pk for e in events]).update(processed_at=timezone.now(), last_error='')
+    return messages
+
+
+def fail(events, exc):
+    now = timezone.now()
+    for event in events:
+        event.available_at = now + backoff(event.attempts)
+        event.last_error = repr(exc)[:1000]
+    OutboxEvent.objects.bulk_update(events, ['available_at', 'last_error'])
+
+
+async def send(messages, attempt=1):
+    """Send each message to its user's group concurrently; requeue the ones that fail."""
+    layer = get_channel_layer()
+    if layer is None or not messages:
+        return
+    keys = list(messages)
+    results = await asyncio.gather(
+        *(layer.group_send(f'user_{user_id}', messages[(user_id, kind)]) for user_id, kind in keys),
+        return_exceptions=True,
+    )
+    failed = [[user_id, messages[(user_id, kind)]] for (user_id, kind), result in zip(keys, results) if isinstance(result, Exception)]
+    if not failed:
+        return
+    if attempt >= MAX_ATTEMPTS:
+        logger.error('outbox: dropping %d channel-layer messages after %d attempts', len(failed), attempt)
+        return
+    logger.warning('outbox: %d channel-layer sends failed, retrying later', len(failed))
+    await sync_to_async(enqueue)('push', {'messages': failed, 'attempt': attempt + 1}, delay=backoff(attempt))
+
+
+async def process_batch(batch_size=BATCH_SIZE):
+    """Claim and handle one batch; returns the number of events claimed."""
+    events = await sync_to_async(claim)(batch_size)
+    by_kind = {}
+    for event in events:
+        by_kind.setdefault(event.kind, []).append(event)
+
+    messages = {}
+    for kind, group in by_kind.items():
+        try:
+            _merge(messages, await sync_to_async(handle)(kind, group))
+        except Exception as exc:
+            if len(group) == 1:
+                logger.exception('outbox: %s event %s failed', kind, group[0].pk)
+                await sync_to_async(fail)(group, exc)
+                continue
+            logger.warning('outbox: %d %s events failed together, retrying one by one', len(group), kind)
+            for event in group:
+                try:
+                    _merge(messages, await sync_to_async(handle)(kind, [event]))
+                except Exception as exc:
+                    logger.exception('outbox: %s event %s failed', kind, event.pk)
+                    await sync_to_async(fail)([event], exc)
+    await send(messages, attempt=max((e.payload.get('attempt', 1) for e in by_kind.get('push', ())), default=1))
+    return len(events)
+
+
+async def run(batch_size=BATCH_SIZE, interval=1.0, once=False):
+    """Drain the outbox forever (or, with ``once``, until nothing is due)."""
+    while True:
+        claimed = await process_batch(batch_size)
+        if claimed:
+            continue
+        if once:
+            return
+        # like the request cycle, drop connections that have outlived CONN_MAX_AGE
+        await sync_to_async(close_old_connections)()
+        await asyncio.sleep(interval)
+
+
+def drain(batch_size=BATCH_SIZE):
+    """Synchronously process every event that is currently due (for tests and scripts)."""
+    async_to_sync(run)(batch_size, once=True)
@@ -0,0 +1,59 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCountMixin:
+    """Add ``count`` to a cursor page only when the client asks with ``?count=1``.
+
+    Cursor pages never need a ``COUNT(*)`` themselves; clients that show a
+    total opt in to paying for one.
+    """
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return schema
+
+
+class KeysetPagination(OptionalCountMixin, CursorPagination):
+    """Default pagination: newest first by primary key, so page N costs the same as page one.
+
+    Small admin lists that want ``limit``/``offset`` and a total set
+    ``pagination_class = LimitOffsetPagination`` explicitly.
+    """
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class NotificationCursorPagination(KeysetPagination):
+    """A user's notifications, newest first (matches notification_user_created_idx)."""
+    ordering = ('-created_at', '-id')
+
+
+class ThreadCursorPagination(CursorPagination):
+    """Inbox listing, most recently active thread first.
+
+    Relies on the ``last_activity`` annotation added by ``MessageThreadViewSet``.
+    """
+    ordering = ('-last_activity', '-id')
+    page_size = 20
+
+
+class MessageCursorPagination(OptionalCountMixin, CursorPagination):
+    """Messages inside one thread, newest first."""
+    ordering = ('-sent_at', '-id')
+    page_size = 50
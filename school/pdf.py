@@ -0,0 +1,87 @@
+"""Minimal single-page PDF report cards.
+
+Deliberately free of Django imports and third-party dependencies so that
+``render_report_card`` can run in ``ProcessPoolExecutor`` workers and only
+ever receives plain dicts.
+"""
+
+PAGE_WIDTH = 595   # A4 in points
+PAGE_HEIGHT = 842
+MARGIN = 50
+
+
+def _escape(text):
+    text = str(text).encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _fmt(value, suffix=''):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.1f}{suffix}'
+    return f'{value}{suffix}'
+
+
+def build_pdf(lines):
+    """Build a one-page PDF from ``(font, size, x, y, text)`` tuples (font is 'F1' regular or 'F2' bold)."""
+    content = '\n'.join(
+        f'BT /{font} {size} Tf {x} {y} Td ({_escape(text)}) Tj ET' for font, size, x, y, text in lines
+    ).encode('latin-1')
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] /Contents 4 0 R '
+         f'/Resources << /Font << /F1 5 0 R /F2 6 0 R >> >> >>').encode(),
+        b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>',
+    ]
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def render_report_card(card):
+    """Render one report card payload (as built by ``school.reports``) to PDF bytes."""
+    lines = []
+    y = PAGE_HEIGHT - MARGIN
+
+    def line(text, size=11, font='F1', x=MARGIN, step=16):
+        nonlocal y
+        lines.append((font, size, x, y, text))
+        y -= step
+
+    line(card['school_class'] + ' - ' + card['term'], size=16, font='F2', step=24)
+    line(f"{card['student']['name']}  ({card['student']['admission_number']})", size=13, font='F2', step=28)
+
+    columns = (MARGIN, MARGIN + 260, MARGIN + 340, MARGIN + 420)
+    for x, title in zip(columns, ('Subject', 'Average', 'Position', 'Assessments')):
+        lines.append(('F2', 11, x, y, title))
+    y -= 18
+    for subject in card['subjects']:
+        for x, value in zip(columns, (
+            subject['name'],
+            _fmt(subject['average']),
+            f"{subject['position']} / {card['class_size']}",
+            subject['assessments'],
+        )):
+            lines.append(('F1', 11, x, y, value))
+        y -= 16
+
+    y -= 12
+    line(f"Overall average: {_fmt(card['overall_average'])}", font='F2')
+    line(f"Position in class: {_fmt(card['position'])} of {card['class_size']}", font='F2')
+    line(f"Attendance: {_fmt(card['attendance']['percentage'], '%')} "
+         f"({card['attendance']['attended']} of {card['attendance']['days']} days)")
+    line(f"Behaviour incidents this term: {card['incidents']}")
+    return build_pdf(lines)
@@ -0,0 +1,168 @@
+"""Lightweight request / websocket profiling.
+
+A ``Profile`` is attached to the current context (a ``ContextVar``, so it
+follows work handed to ``sync_to_async`` threads) and a database execute
+wrapper installed on every connection records each query's duration and a
+normalized fingerprint into it. Repeated fingerprints within one request are
+reported as likely N+1 patterns.
+
+``RequestProfilingMiddleware`` (school.middleware) profiles HTTP requests and
+``ProfiledConsumerMixin`` below profiles Channels consumer handlers. Both are
+controlled by ``settings.REQUEST_PROFILING`` and cost nothing when disabled.
+"""
+import contextvars
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('school.profiling')
+
+_current = contextvars.ContextVar('school_profile', default=None)
+
+_IN_LIST = re.compile(r'IN \((?:%s|\?)(?:, (?:%s|\?))*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Normalize SQL so queries that differ only in literals or IN-list length compare equal."""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _NUMBER.sub('N', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class Profile:
+    """Timings and query statistics for one request or consumer event."""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.finished = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.spans = {}
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.fingerprints[fingerprint(sql)] += 1
+
+    def add_span(self, name, duration):
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def duplicates(self):
+        """Query shapes executed more than once, most frequent first."""
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n > 1]
+
+    def as_dict(self):
+        data = {
+            'label': self.label,
+            'total_ms': round(self.total * 1000, 2),
+            'db_ms': round(self.db_time * 1000, 2),
+            'queries': self.queries,
+        }
+        for name, duration in self.spans.items():
+            data[f'{name}_ms'] = round(duration * 1000, 2)
+        duplicates = self.duplicates()
+        if duplicates:
+            data['duplicate_queries'] = [{'sql': sql[:300], 'count': n} for sql, n in duplicates[:5]]
+        return data
+
+
+def current():
+    """The profile of the running request/event, or None."""
+    return _current.get()
+
+
+@contextmanager
+def profile(label):
+    p = Profile(label)
+    token = _current.set(p)
+    try:
+        yield p
+    finally:
+        _current.reset(token)
+        p.finish()
+
+
+@contextmanager
+def span(name):
+    """Time a block of code into the current profile (no-op when not profiling)."""
+    p = _current.get()
+    if p is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        p.add_span(name, time.perf_counter() - start)
+
+
+def enabled():
+    return settings.REQUEST_PROFILING['ENABLED']
+
+
+def sampled():
+    return random.random() < settings.REQUEST_PROFILING['SAMPLE_RATE']
+
+
+def log(p, **extra):
+    """Emit one structured log line; slow events are logged as warnings."""
+    data = {'event': 'profile', **extra, **p.as_dict()}
+    slow = data['total_ms'] >= settings.REQUEST_PROFILING['SLOW_MS']
+    logger.log(logging.WARNING if slow else logging.INFO, json.dumps(data, default=str))
+
+
+def _record_queries(execute, sql, params, many, context):
+    p = _current.get()
+    if p is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        p.record_query(sql, time.perf_counter() - start)
+
+
+def _install_wrapper(sender=None, connection=None, **kwargs):
+    if _record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_queries)
+
+
+def install():
+    """Record queries on every database connection (called from AppConfig.ready when enabled)."""
+    connection_created.connect(_install_wrapper, dispatch_uid='school.profiling')
+    for conn in connections.all(initialized_only=True):
+        _install_wrapper(connection=conn)
+
+
+class ProfiledConsumerMixin:
+    """Profile each handler a Channels consumer dispatches (connect, receive, group events)."""
+
+    async def dispatch(self, message):
+        if not enabled() or not sampled():
+            return await super().dispatch(message)
+        with profile(f"ws {type(self).__name__} {message.get('type')}") as p:
+            try:
+                return await super().dispatch(message)
+            finally:
+                p.finish()
+                user = self.scope.get('user')
+                log(p, protocol='websocket', path=self.scope.get('path'), user=getattr(user, 'id', None))
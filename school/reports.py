@@ -0,0 +1,203 @@
+"""Term report card generation.
+
+For each class the data every report card needs comes from three grouped
+queries: weighted subject averages (``Sum(score * weight) / Sum(weight)`` per
+student and subject), attendance counts by status and incident counts within
+the term's dates. Positions are computed in Python from those aggregates.
+
+Each card is a plain dict; its SHA-256 digest is stored on ``TermReport`` so
+a report whose inputs have not changed since it was generated is skipped.
+PDFs are rendered by ``school.pdf`` in a ``ProcessPoolExecutor``.
+"""
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import AttendanceRecord, BehaviourIncident, GradeEntry, SchoolClass, Student, TermReport
+from .pdf import render_report_card
+
+SAVE_BATCH = 200
+
+
+def rank_with_ties(values):
+    """Competition ranking ("1, 2, 2, 4") of ``{key: value}``, highest first; None values are unranked."""
+    ordered = sorted((v, k) for k, v in values.items() if v is not None)
+    ordered.reverse()
+    ranks = {}
+    previous = None
+    for index, (value, key) in enumerate(ordered, start=1):
+        if value != previous:
+            rank, previous = index, value
+        ranks[key] = rank
+    return ranks
+
+
+def class_report_cards(school_class, term):
+    """Build the report card payload of every active pupil in ``school_class`` for ``term``."""
+    students = list(
+        Student.objects.filter(current_class=school_class, is_active=True)
+        .order_by('last_name', 'first_name', 'id')
+        .values_list('id', 'first_name', 'last_name', 'admission_number')
+    )
+    if not students:
+        return []
+    in_class = {'student__current_class': school_class, 'student__is_active': True}
+
+    subjects = {}
+    averages = {}  # (student_id, subject_id) -> (average, assessments)
+    grade_rows = (
+        GradeEntry.objects.filter(assessment__term=term, assessment__school_class=school_class, **in_class)
+        .values('student_id', 'assessment__subject_id', 'assessment__subject__name')
+        .annotate(points=Sum(F('score') * F('assessment__weight')), weight=Sum('assessment__weight'), assessments=Count('id'))
+        .order_by()
+    )
+    for row in grade_rows:
+        subject_id = row['assessment__subject_id']
+        subjects[subject_id] = row['assessment__subject__name']
+        average = round(row['points'] / row['weight'], 2) if row['weight'] else None
+        averages[(row['student_id'], subject_id)] = (average, row['assessments'])
+
+    attendance = {}
+    attendance_rows = (
+        AttendanceRecord.objects.filter(date__range=(term.start_date, term.end_date), **in_class)
+        .values('student_id', 'status').annotate(n=Count('id')).order_by()
+    )
+    for row in attendance_rows:
+        attendance.setdefault(row['student_id'], {})[row['status']] = row['n']
+
+    incidents = dict(
+        BehaviourIncident.objects.filter(date__range=(term.start_date, term.end_date), **in_class)
+        .values('student_id').annotate(n=Count('id')).order_by().values_list('student_id', 'n')
+    )
+
+    subject_order = sorted(subjects, key=lambda s: subjects[s])
+    subject_ranks = {
+        subject_id: rank_with_ties({sid: averages.get((sid, subject_id), (None,))[0] for sid, *_ in students})
+        for subject_id in subject_order
+    }
+    overall = {}
+    for sid, *_ in students:
+        scores = [averages[(sid, s)][0] for s in subject_order if averages.get((sid, s), (None,))[0] is not None]
+        overall[sid] = round(sum(scores) / len(scores), 2) if scores else None
+    positions = rank_with_ties(overall)
+
+    cards = []
+    for sid, first_name, last_name, admission_number in students:
+        counts = attendance.get(sid, {})
+        days = sum(counts.values())
+        attended = counts.get('present', 0) + counts.get('late', 0)
+        cards.append({
+            'term': str(term),
+            'term_id': term.id,
+            'school_class': school_class.name,
+            'class_size': len(students),
+            'student': {'id': sid, 'name': f'{first_name} {last_name}', 'admission_number': admission_number},
+            'subjects': [
+                {
+                    'id': subject_id,
+                    'name': subjects[subject_id],
+                    'average': averages.get((sid, subject_id), (None, 0))[0],
+                    'assessments': averages.get((sid, subject_id), (None, 0))[1],
+                    'position': subject_ranks[subject_id].get(sid),
+                }
+                for subject_id in subject_order
+            ],
+            'overall_average': overall[sid],
+            'position': positions.get(sid),
+            'attendance': {
+                'days': days,
+                'attended': attended,
+                'absent': counts.get('absent', 0),
+                'percentage': round(100 * attended / days, 1) if days else None,
+            },
+            'incidents': incidents.get(sid, 0),
+        })
+    return cards
+
+
+def card_digest(card):
+    return hashlib.sha256(json.dumps(card, sort_keys=True).encode()).hexdigest()
+
+
+def render_cards(cards, workers):
+    """Yield the PDF bytes of each card, in order, using up to ``workers`` processes."""
+    if workers <= 1 or len(cards) < 2:
+        yield from map(render_report_card, cards)
+        return
+    # spawn: workers only import school.pdf and never share the parent's DB connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield from pool.map(render_report_card, cards, chunksize=max(1, len(cards) // (workers * 4)))
+
+
+def generate_term_reports(term, classes=None, workers=None, force=False, user=None):
+    """Generate (or refresh) the ``TermReport`` of every pupil in ``classes`` (default: all classes).
+
+    Reports whose inputs digest matches the stored one are skipped unless
+    ``force`` is set. Returns ``{'generated': n, 'skipped': n}``.
+    """
+    if workers is None:
+        workers = settings.REPORT_WORKERS
+    if classes is None:
+        classes = SchoolClass.objects.all()
+
+    pending = []  # (card, digest, existing report or None)
+    skipped = 0
+    for school_class in classes:
+        cards = class_report_cards(school_class, term)
+        existing = {
+            r.student_id: r
+            for r in TermReport.objects.filter(term=term, student_id__in=[c['student']['id'] for c in cards])
+        }
+        for card in cards:
+            digest = card_digest(card)
+            report = existing.get(card['student']['id'])
+            if report and report.pdf_file and report.inputs_digest == digest and not force:
+                skipped += 1
+                continue
+            pending.append((card, digest, report))
+
+    created, updated, replaced = [], [], []
+    now = timezone.now()
+    for (card, digest, report), pdf in zip(pending, render_cards([p[0] for p in pending], workers)):
+        if report is None:
+            report = TermReport(student_id=card['student']['id'], term=term)
+            created.append(report)
+        else:
+            if report.pdf_file:
+                replaced.append(report.pdf_file.name)
+            updated.append(report)
+        report.pdf_file.save(f"{term.id}-{card['student']['admission_number']}.pdf", ContentFile(pdf), save=False)
+        report.inputs_digest = digest
+        report.summary = card
+        report.generated_at = now
+        report.generated_by = user
+        if len(created) + len(updated) >= SAVE_BATCH:
+            _save(created, updated, replaced)
+            created, updated, replaced = [], [], []
+    _save(created, updated, replaced)
+    return {'generated': len(pending), 'skipped': skipped}
+
+
+def _save(created, updated, replaced):
+    """Save a batch of reports; the PDFs they replace are deleted only once the rows commit.
+
+    The new files were written under fresh names, so a failed batch leaves the
+    old rows pointing at their old, intact files.
+    """
+    with transaction.atomic():
+        TermReport.objects.bulk_create(created)
+        TermReport.objects.bulk_update(updated, ['pdf_file', 'inputs_digest', 'summary', 'generated_at', 'generated_by'])
+        transaction.on_commit(lambda: _delete_files(replaced))
+
+
+def _delete_files(names):
+    storage = TermReport._meta.get_field('pdf_file').storage
+    for name in names:
+        storage.delete(name)
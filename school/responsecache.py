@@ -0,0 +1,163 @@
+"""Per-role response cache for read-mostly list and detail endpoints.
+
+``ResponseCacheMixin`` caches the body and validators of successful ``list``
+and ``retrieve`` responses. Each cache key is built from:
+
+* the view and action;
+* the caller's scope: ``staff`` is shared by every admin and teacher, and each
+  parent gets their own scope;
+* the full request path, including the query string;
+* the current generation of every model in ``cache_models``.
+
+Saves and deletes of a watched model bump its generation counter (see
+``school.signals``), and bulk writes call ``bump`` themselves. A bump happens
+at once and again when the surrounding transaction commits: a miss in between
+still reads the old rows, and the second bump retires what it cached. Stale entries
+are never looked up again and expire on their own, so invalidation never
+scans keys. Generations start at a time-based value, so a counter that is
+evicted cannot come back to an old number and revive stale entries.
+
+A bump also marks the model as recently written for ``READ_AFTER_WRITE_PIN``
+seconds. A miss in that window builds its response from the primary, so an
+entry shared by the whole scope is never filled from a replica that has not
+caught up with the write.
+
+Hits and misses are counted per view in the cache. The
+``response_cache_stats`` command reports them. Cached responses carry
+``X-Cache: HIT`` or ``MISS``.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from .conditional import scope
+from .models import Assessment, SchoolClass, Student, User
+from .routers import use_primary
+
+# models whose writes invalidate cached responses
+WATCHED = {Assessment, SchoolClass, Student, User}
+STATS_KEY = 'respcache:stats'
+VALIDATORS = ('ETag', 'Last-Modified')
+
+
+def _generation_key(model):
+    return f'respcache:gen:{model._meta.label_lower}'
+
+
+def _recent_key(model):
+    return f'respcache:recent:{model._meta.label_lower}'
+
+
+def generations(models):
+    keys = [_generation_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*models):
+    """Invalidate every cached response that depends on ``models``, now and on commit."""
+    _bump(models)
+    transaction.on_commit(lambda: _bump(models))
+
+
+def _bump(models):
+    for model in models:
+        key = _generation_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+        cache.set(_recent_key(model), 1, settings.READ_AFTER_WRITE_PIN)
+
+
+def recently_bumped(models):
+    """True while a replica may still lag behind the last write to any of ``models``."""
+    return bool(cache.get_many([_recent_key(model) for model in models]))
+
+
+def record(view_name, outcome):
+    key = f'{STATS_KEY}:{view_name}:{outcome}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def cached_views():
+    """``<basename>-<action>`` for every routed viewset that uses the cache."""
+    from .urls import router
+    return [
+        f'{basename}-{action}'
+        for _, viewset, basename in router.registry
+        if issubclass(viewset, ResponseCacheMixin)
+        for action in ('list', 'retrieve')
+    ]
+
+
+def stats(reset=False):
+    """``{view: {'hit': n, 'miss': n, 'hit_rate': pct}}`` for views with traffic; optionally zero the counters."""
+    keys = [f'{STATS_KEY}:{view}:{outcome}' for view in cached_views() for outcome in ('hit', 'miss')]
+    counts = cache.get_many(keys)
+    report = {}
+    for view in cached_views():
+        hit = counts.get(f'{STATS_KEY}:{view}:hit', 0)
+        miss = counts.get(f'{STATS_KEY}:{view}:miss', 0)
+        if hit or miss:
+            report[view] = {'hit': hit, 'miss': miss, 'hit_rate': round(100 * hit / (hit + miss), 1)}
+    if reset:
+        cache.delete_many(keys)
+    return report
+
+
+class ResponseCacheMixin:
+    """Serve ``list`` and ``retrieve`` from the cache while ``cache_models`` are unchanged."""
+    cache_models = ()
+
+    def cached(self, request, build, *args, **kwargs):
+        config = settings.RESPONSE_CACHE
+        if not config['ENABLED']:
+            return build(request, *args, **kwargs)
+        view_name = f'{self.basename}-{self.action}'
+        parts = (view_name, scope(request), request.get_full_path(), *generations(self.cache_models))
+        key = 'respcache:' + hashlib.sha256(repr(parts).encode()).hexdigest()
+
+        entry = cache.get(key)
+        if entry is not None:
+            record(view_name, 'hit')
+            data, headers = entry
+            last_modified = parse_http_date_safe(headers['Last-Modified']) if 'Last-Modified' in headers else None
+            response = get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified)
+            if response is None:
+                response = Response(data)
+            for name, value in headers.items():
+                response[name] = value
+            outcome = 'HIT'
+        else:
+            record(view_name, 'miss')
+            if recently_bumped(self.cache_models):
+                use_primary()
+            response = build(request, *args, **kwargs)
+            if response.status_code == 200 and hasattr(response, 'data'):
+                headers = {name: response[name] for name in VALIDATORS if response.has_header(name)}
+                cache.set(key, (response.data, headers), config['TIMEOUT'])
+            outcome = 'MISS'
+        response['X-Cache'] = outcome
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(request, super().retrieve, *args, **kwargs)
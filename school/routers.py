@@ -0,0 +1,89 @@
+"""Primary/replica database routing.
+
+Reads go to a replica only inside a request that ``ReplicaReadMixin`` marked
+as a read: a safe-method request from a user who has not written recently.
+Everything else stays on ``default``, including writes, the outbox worker,
+management commands and websocket consumers.
+
+Two rules keep users from seeing stale data through replication lag:
+
+* the first write in a request moves that request's remaining reads to the
+  primary;
+* a request that wrote pins the user's reads to the primary for
+  ``READ_AFTER_WRITE_PIN`` seconds. The pin is kept in the cache so it holds
+  across workers.
+
+Replica aliases are listed in ``REPLICA_DATABASES``; when it is empty every
+query uses ``default``.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+_request_state = contextvars.ContextVar('db_request_state', default=None)
+
+
+def _pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(_pin_key(user_id), 1, settings.READ_AFTER_WRITE_PIN)
+
+
+def is_pinned(user_id):
+    return cache.get(_pin_key(user_id)) is not None
+
+
+def use_primary():
+    """Send the rest of the current request's reads to the primary."""
+    state = _request_state.get()
+    if state is not None:
+        state['read'] = None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        return state['read'] if state else None
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['read'] = None
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas receive the schema through replication
+        return False if db in settings.REPLICA_DATABASES else None
+
+
+class ReplicaReadMixin:
+    """Route a view's safe-method reads to a replica (see module docstring)."""
+
+    def dispatch(self, request, *args, **kwargs):
+        state = {'read': None, 'wrote': False}
+        token = _request_state.set(state)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _request_state.reset(token)
+            user = getattr(request, 'user', None)
+            if state['wrote'] and user is not None and user.is_authenticated:
+                pin_to_primary(user.id)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        replicas = settings.REPLICA_DATABASES
+        state = _request_state.get()
+        if replicas and state is not None and not state['wrote'] and request.method in SAFE_METHODS:
+            if not (request.user.is_authenticated and is_pinned(request.user.id)):
+                state['read'] = random.choice(replicas)
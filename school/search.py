@@ -0,0 +1,162 @@
+"""Pupil search over names and admission numbers.
+
+Each pupil has a set of ``StudentSearchKey`` rows: every normalized token of
+the first name, last name and admission number (plus the admission number
+with its separators removed). Alphabetic tokens of four or more letters also
+get their one-deletion variants (``john`` -> ``ohn``, ``jhn``, ``jon``,
+``joh``). A query token then matches by:
+
+* exact token (``EXACT``),
+* token prefix, for two or more characters (``PREFIX``),
+* a shared one-deletion variant, which covers a single insertion, deletion,
+  substitution or transposition (``FUZZY``).
+
+All query tokens are looked up in one indexed query. A pupil's score is the
+sum of each query token's best match, and pupils must match every query
+token. The keys are kept current by the ``Student`` save signal (deleting a
+pupil cascades). Bulk writes call ``index_students``, and the
+``rebuild_student_search`` command rebuilds everything.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Student, StudentSearchKey
+
+EXACT, PREFIX, FUZZY = 3, 2, 1
+MIN_PREFIX = 2
+MIN_FUZZY = 4
+MAX_KEY = 64
+MAX_TERMS = 5
+MAX_RESULTS = 200
+
+_SPLIT = re.compile(r'[^0-9a-z]+')
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def normalize(text):
+    """Lower-case, strip accents and split on anything that is not a letter or digit."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return [token[:MAX_KEY] for token in _SPLIT.split(text) if token]
+
+
+def variants(token):
+    if len(token) < MIN_FUZZY or not token.isalpha():
+        return set()
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def prefix_range(token):
+    """``(low, high)`` bounds covering every key that starts with ``token`` (``high`` is None past ``zzz``).
+
+    Keys only use ``ALPHABET``, which sorts the same under binary and locale
+    collations, so a range lookup can use the plain B-tree index on every
+    database where ``LIKE 'x%'`` might not.
+    """
+    stem = token.rstrip('z')
+    if not stem:
+        return token, None
+    return token, stem[:-1] + ALPHABET[ALPHABET.index(stem[-1]) + 1]
+
+
+def keys_for(first_name, last_name, admission_number):
+    """``(key, is_variant)`` pairs to index for one pupil."""
+    tokens = set(normalize(first_name)) | set(normalize(last_name)) | set(normalize(admission_number))
+    compact = ''.join(normalize(admission_number))
+    if compact:
+        tokens.add(compact[:MAX_KEY])
+    keys = {(token, False) for token in tokens}
+    keys |= {(variant, True) for token in tokens for variant in variants(token)} - {(token, True) for token in tokens}
+    return keys
+
+
+def index_students(students):
+    """Replace the search keys of ``students`` (instances or a queryset)."""
+    students = list(students)
+    with transaction.atomic():
+        StudentSearchKey.objects.filter(student__in=[s.pk for s in students]).delete()
+        StudentSearchKey.objects.bulk_create(
+            [
+                StudentSearchKey(student_id=s.pk, key=key, is_variant=is_variant)
+                for s in students
+                for key, is_variant in keys_for(s.first_name, s.last_name, s.admission_number)
+            ],
+            batch_size=2000,
+        )
+
+
+def rebuild(batch_size=2000):
+    """Reindex every pupil; returns the number indexed."""
+    StudentSearchKey.objects.all().delete()
+    count = 0
+    queryset = Student.objects.only('first_name', 'last_name', 'admission_number').order_by('pk')
+    batch = []
+    for student in queryset.iterator(chunk_size=batch_size):
+        batch.append(student)
+        if len(batch) == batch_size:
+            index_students(batch)
+            count, batch = count + len(batch), []
+    index_students(batch)
+    return count + len(batch)
+
+
+def _score(term, term_variants, key, is_variant):
+    if not is_variant:
+        if key == term:
+            return EXACT
+        if len(term) >= MIN_PREFIX and key.startswith(term):
+            return PREFIX
+    if key == term or key in term_variants:
+        return FUZZY
+    return 0
+
+
+def search(q, student_ids=None, limit=MAX_RESULTS):
+    """``[(student_id, score)]`` best first for query ``q``, optionally within ``student_ids``."""
+    terms = list(dict.fromkeys(normalize(q)))[:MAX_TERMS]
+    if not terms:
+        return []
+    term_variants = [variants(term) for term in terms]
+    condition = Q()
+    for term, others in zip(terms, term_variants):
+        condition |= Q(key__in=[term, *others])
+        if len(term) >= MIN_PREFIX:
+            low, high = prefix_range(term)
+            condition |= Q(is_variant=False, key__gte=low, **({'key__lt': high} if high else {}))
+    rows = StudentSearchKey.objects.filter(condition)
+    if student_ids is not None:
+        rows = rows.filter(student__in=student_ids)
+
+    best = defaultdict(dict)
+    for student_id, key, is_variant in rows.values_list('student_id', 'key', 'is_variant'):
+        matched = best[student_id]
+        for i, term in enumerate(terms):
+            score = _score(term, term_variants[i], key, is_variant)
+            if score > matched.get(i, 0):
+                matched[i] = score
+
+    ranked = [(sid, sum(matched.values())) for sid, matched in best.items() if len(matched) == len(terms)]
+    ranked.sort(key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+
+def filter_queryset(queryset, q, student_ids=None):
+    """Restrict a ``Student`` queryset to matches for ``q``, best first, then by name."""
+    ranked = search(q, student_ids)
+    if not ranked:
+        return queryset.none()
+    by_score = defaultdict(list)
+    for sid, score in ranked:
+        by_score[score].append(sid)
+    rank = Case(
+        *(When(pk__in=ids, then=Value(score)) for score, ids in by_score.items()),
+        default=Value(0), output_field=IntegerField(),
+    )
+    return (
+        queryset.filter(pk__in=[sid for sid, _ in ranked])
+        .annotate(search_rank=rank)
+        .order_by('-search_rank', 'last_name', 'first_name', 'pk')
+    )
@@ -1,5 +1,8 @@
+import datetime
+
+from django.utils import timezone
 from rest_framework import serializers
-from .models import User, Student, SchoolClass, Subject, Assessment, GradeEntry, AttendanceRecord, BehaviourIncident, MessageThread, Message, Notification, AcademicYear, Term
+from .models import User, Student, SchoolClass, Subject, Assessment, GradeEntry, AttendanceRecord, BehaviourIncident, MessageThread, Message, Notification, AcademicYear, Term, TermReport
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -22,7 +25,45 @@ class AttendanceSerializer(serializers.ModelSerializer):
     class Meta:
         model = AttendanceRecord
         fields = '__all__'
-        read_only_fields = ('recorded_by',)
+        read_only_fields = ('recorded_by', 'school_class')
+
+class AttendanceBulkEntrySerializer(serializers.Serializer):
+    """One row of a class register submitted through the bulk endpoint."""
+    student = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=AttendanceRecord.ATTENDANCE_CHOICES)
+    note = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+class AttendanceBulkSerializer(serializers.Serializer):
+    """Envelope for a whole class register: the class, the day and one entry per pupil.
+
+    Rows are validated individually by the view so a single bad row does not
+    reject the rest of the register.
+    """
+    school_class = serializers.PrimaryKeyRelatedField(queryset=SchoolClass.objects.all())
+    date = serializers.DateField()
+    records = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=1000)
+
+class AttendanceAnalyticsSerializer(serializers.Serializer):
+    """Range and grouping for attendance analytics. ``term`` fills in the range from
+    the term's dates; without either the last four weeks are used."""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    term = serializers.PrimaryKeyRelatedField(queryset=Term.objects.all(), required=False)
+    school_class = serializers.PrimaryKeyRelatedField(queryset=SchoolClass.objects.all(), required=False)
+    period = serializers.ChoiceField(choices=('day', 'week', 'month', 'total'), default='week')
+    threshold = serializers.FloatField(default=10.0, min_value=0, max_value=100)
+    min_days = serializers.IntegerField(default=1, min_value=1)
+
+    def validate(self, attrs):
+        term = attrs.get('term')
+        if term is not None:
+            attrs.setdefault('date_from', term.start_date)
+            attrs.setdefault('date_to', term.end_date)
+        attrs.setdefault('date_to', timezone.now().date())
+        attrs.setdefault('date_from', attrs['date_to'] - datetime.timedelta(days=27))
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError('date_from must not be after date_to')
+        return attrs
 
 class AssessmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -36,11 +77,44 @@ class GradeEntrySerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('recorded_by','recorded_at')
 
+class GradeSheetEntrySerializer(serializers.Serializer):
+    """One row of a grade sheet. The pupil is identified by id or admission number."""
+    student = serializers.IntegerField(required=False, allow_null=True)
+    admission_number = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    score = serializers.FloatField()
+    remarks = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate(self, attrs):
+        if attrs.get('student') is None and not attrs.get('admission_number'):
+            raise serializers.ValidationError('student or admission_number required')
+        return attrs
+
+class GradeSheetSerializer(serializers.Serializer):
+    """A whole assessment's scores, either as a JSON list or an uploaded CSV/XLSX file."""
+    assessment = serializers.PrimaryKeyRelatedField(queryset=Assessment.objects.all())
+    scores = serializers.ListField(child=serializers.DictField(), required=False, allow_empty=False)
+    file = serializers.FileField(required=False)
+
+    def validate(self, attrs):
+        if ('scores' in attrs) == ('file' in attrs):
+            raise serializers.ValidationError('provide either scores or file')
+        return attrs
+
 class BehaviourSerializer(serializers.ModelSerializer):
     class Meta:
         model = BehaviourIncident
         fields = '__all__'
 
+class TermReportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TermReport
+        fields = '__all__'
+
+class TermReportGenerateSerializer(serializers.Serializer):
+    term = serializers.PrimaryKeyRelatedField(queryset=Term.objects.select_related('academic_year'))
+    school_class = serializers.PrimaryKeyRelatedField(queryset=SchoolClass.objects.all(), required=False)
+    force = serializers.BooleanField(default=False)
+
 # school/serializers.py
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -53,19 +127,51 @@ class NotificationSerializer(serializers.ModelSerializer):
 
 # --- Messaging serializers ---
 class MessageSerializer(serializers.ModelSerializer):
+    """A message with its readers.
+
+    ``read_by`` merges the per-message receipts (prefetch ``read_by`` to avoid
+    a query per message) with participants whose read watermark covers the
+    message, passed in as ``context['watermarks']`` from ``unread.watermarks``.
+    """
     sender = UserSerializer(read_only=True)
-    read_by = UserSerializer(many=True, read_only=True)
+    read_by = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
         fields = ('id', 'thread', 'sender', 'body', 'sent_at', 'read_by')
         read_only_fields = ('sender', 'sent_at', 'read_by')
 
+    def get_read_by(self, obj):
+        readers = list(obj.read_by.all())
+        seen = {u.id for u in readers}
+        for last_read_id, user in self.context.get('watermarks', ()):
+            if last_read_id >= obj.id and user.id not in seen:
+                readers.append(user)
+                seen.add(user.id)
+        return UserSerializer(readers, many=True).data
+
 
 class MessageThreadSerializer(serializers.ModelSerializer):
+    """Inbox representation of a thread: no message bodies beyond a short preview.
+
+    Expects the ``last_activity``, ``last_message_*`` and ``unread_count``
+    annotations added by ``MessageThreadViewSet.get_queryset``; full messages
+    come from the thread's ``messages`` action.
+    """
     participants = UserSerializer(many=True, read_only=True)
-    messages = MessageSerializer(many=True, read_only=True)
+    last_activity = serializers.DateTimeField(read_only=True)
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = MessageThread
-        fields = ('id', 'subject', 'participants', 'created_at', 'messages')
\ No newline at end of file
+        fields = ('id', 'subject', 'participants', 'created_at', 'last_activity', 'last_message', 'unread_count')
+
+    def get_last_message(self, obj):
+        if getattr(obj, 'last_message_id', None) is None:
+            return None
+        return {
+            'id': obj.last_message_id,
+            'sender': obj.last_message_sender,
+            'preview': obj.last_message_preview,
+        }
@@ -1,30 +1,159 @@
 # signals to auto-notify parents when grades/behaviour are added:
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
 from django.dispatch import receiver
-from .models import GradeEntry, BehaviourIncident, Notification
+from django.utils import timezone
+from .models import User, Student, AttendanceRecord, GradeEntry, BehaviourIncident, Message, MessageThread
+from .notifications import guardians_by_student
+from . import analytics, dashboard, guardians, outbox, responsecache, search, unread
 
 @receiver(post_save, sender=GradeEntry)
 def grade_entry_notify(sender, instance, created, **kwargs):
     if created:
-        student = instance.student
-        # notify all guardians
-        for parent in student.guardian.all():
-            Notification.objects.create(
-                user=parent,
-                title=f"New grade for {student.first_name}",
-                message=f"{instance.assessment.title} - {instance.score}. Remarks: {instance.remarks}",
-                link=f"/students/{student.id}/reports/{instance.assessment.id}"
-            )
+        # guardians are notified by the outbox worker
+        outbox.enqueue('grades.recorded', {'entries': [instance.pk]})
 
 @receiver(post_save, sender=BehaviourIncident)
 def behaviour_notify(sender, instance, created, **kwargs):
     if created:
-        student = instance.student
-        for parent in student.guardian.all():
-            Notification.objects.create(
-                user=parent,
-                title=f"Behaviour incident for {student.first_name}",
-                message=instance.description,
-                link=f"/students/{student.id}/incidents/{instance.id}"
-            )
+        outbox.enqueue('incident.reported', {'incidents': [instance.pk]})
 
+# keep unread counters in step with thread membership
+@receiver(m2m_changed, sender=MessageThread.participants.through)
+def thread_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance is a user, pk_set holds thread ids
+        if pk_set:
+            unread.rebuild(thread_ids=pk_set, user_ids=[instance.pk])
+        else:
+            unread.rebuild(user_ids=[instance.pk])
+    else:
+        unread.rebuild(thread_ids=[instance.pk])
+
+@receiver(pre_delete, sender=MessageThread)
+def thread_deleted(sender, instance, **kwargs):
+    unread.forget_thread(instance.pk)
+
+@receiver(pre_delete, sender=Message)
+def message_deleted(sender, instance, origin=None, **kwargs):
+    # read receipts are deleted before post_delete; a deleted thread is uncounted as a whole
+    if isinstance(origin, MessageThread):
+        return
+    recipients = unread.forget_message(instance)
+    if recipients:
+        outbox.enqueue('unread.changed', {'users': recipients})
+
+# keep cached dashboard aggregates in step with writes, once they commit: a
+# rolled-back write must not move the counters
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, created, update_fields=None, **kwargs):
+    transaction.on_commit(lambda: dashboard.student_changed(instance, created=created))
+    if update_fields is None or {'first_name', 'last_name', 'admission_number'} & set(update_fields):
+        search.index_students([instance])
+
+@receiver(pre_delete, sender=Student)
+def student_deleting(sender, instance, **kwargs):
+    # guardian links are removed before post_delete fires
+    parents = guardians_by_student([instance.pk]).get(instance.pk, ())
+    transaction.on_commit(lambda: dashboard.forget_parents(parents))
+    # and again on commit: a concurrent read before then re-caches the old links
+    guardians.forget(parents)
+    transaction.on_commit(lambda: guardians.forget(parents))
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: dashboard.student_changed(instance, deleted=True))
+
+@receiver(m2m_changed, sender=Student.guardian.through)
+def student_guardians_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            # the children are unlinked by post_clear
+            instance._cleared_children = list(instance.children.values_list('id', flat=True))
+            return
+        parents = list(instance.guardian.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        parents = [instance.pk] if reverse else pk_set or ()
+        # the nested guardian list is part of the pupil's representation (ETags)
+        if reverse:
+            students = pk_set if action != 'post_clear' else getattr(instance, '_cleared_children', ())
+        else:
+            students = [instance.pk]
+        if students:
+            Student.objects.filter(pk__in=students).update(updated_at=timezone.now())
+            responsecache.bump(Student)
+    else:
+        return
+    transaction.on_commit(lambda: dashboard.forget_parents(parents))
+    # and again on commit: a concurrent read before then re-caches the old links
+    guardians.forget(parents)
+    transaction.on_commit(lambda: guardians.forget(parents))
+
+def touch_wards(user):
+    # pupils nest their guardians, so a guardian's change is a change to the pupil (ETags)
+    if Student.objects.filter(guardian=user).update(updated_at=timezone.now()):
+        responsecache.bump(Student)
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    transaction.on_commit(lambda: dashboard.user_changed(instance, created=created, update_fields=update_fields))
+    if not created and update_fields != frozenset({'last_login'}):
+        touch_wards(instance)
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # guardian links are removed with the user, without m2m_changed
+    touch_wards(instance)
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: dashboard.user_changed(instance, deleted=True))
+
+@receiver(post_save, sender=AttendanceRecord)
+def attendance_saved(sender, instance, created, **kwargs):
+    transaction.on_commit(lambda: dashboard.attendance_changed(instance.date, [instance.student_id], created=int(created)))
+
+@receiver(post_delete, sender=AttendanceRecord)
+def attendance_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: dashboard.attendance_changed(instance.date, [instance.student_id], deleted=1))
+
+@receiver(post_save, sender=BehaviourIncident)
+def incident_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: dashboard.incident_changed(instance))
+
+@receiver(post_delete, sender=BehaviourIncident)
+def incident_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: dashboard.incident_changed(instance))
+
+# keep the attendance rollups in step with single-record writes
+@receiver(pre_save, sender=AttendanceRecord)
+def attendance_saving(sender, instance, **kwargs):
+    instance._rollup_before = None
+    if instance.pk:
+        instance._rollup_before = (
+            AttendanceRecord.objects.filter(pk=instance.pk).values_list('student_id', 'school_class_id', 'date', 'status').first()
+        )
+    before = instance._rollup_before
+    if instance.school_class_id is None or (before and before[0] != instance.student_id):
+        # a new record (or one moved to another pupil) counts in the pupil's current class
+        instance.school_class_id = Student.objects.filter(pk=instance.student_id).values_list('current_class_id', flat=True).first()
+
+@receiver(post_save, sender=AttendanceRecord)
+def attendance_rollup_saved(sender, instance, **kwargs):
+    before = getattr(instance, '_rollup_before', None)
+    after = (instance.student_id, instance.school_class_id, instance.date, instance.status)
+    if before != after:
+        analytics.record_changed(before=before[1:] if before else None, after=after[1:])
+
+@receiver(post_delete, sender=AttendanceRecord)
+def attendance_rollup_deleted(sender, instance, **kwargs):
+    analytics.record_changed(before=(instance.school_class_id, instance.date, instance.status))
+
+# cached list/detail responses (school.responsecache) depend on these models
+@receiver([post_save, post_delete])
+def response_cache_invalidate(sender, update_fields=None, **kwargs):
+    # logins only touch last_login, which no cached response includes
+    if sender in responsecache.WATCHED and update_fields != frozenset({'last_login'}):
+        responsecache.bump(sender)
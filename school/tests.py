@@ -1,3 +1,1353 @@
-from django.test import TestCase
+import datetime
+import importlib.util
+import io
+import json
+import os
+import statistics
+import time
+import unittest
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .synthetic import build_school
+from .urls import router
+
+
+def staff_endpoints(school):
+    student = school.students[0]
+    thread = school.threads[0]
+    return {
+        'students-list': '/api/students/',
+        'students-detail': f'/api/students/{student.id}/',
+        'students-attendance': f'/api/students/{student.id}/attendance/',
+        'users-list': '/api/users/',
+        'assessments-list': '/api/assessments/',
+        'grades-list': '/api/grades/',
+        'attendance-list': '/api/attendance/',
+        'incidents-list': '/api/incidents/',
+        'threads-list': '/api/threads/',
+        'threads-detail': f'/api/threads/{thread.id}/',
+        'threads-messages': f'/api/threads/{thread.id}/messages/',
+        'threads-unread-count': '/api/threads/unread_count/',
+        'notifications-list': '/api/notifications/',
+        'dashboard': '/api/dashboard/?fresh=1',
+        'classes-gradebook': f'/api/classes/{student.current_class_id}/gradebook/?term={school.terms[0].id}',
+        'me': '/api/auth/me/',
+    }
+
+
+def parent_endpoints(school):
+    child = school.students[0]
+    thread = school.threads[0]
+    return {
+        'students-list': '/api/students/',
+        'students-detail': f'/api/students/{child.id}/',
+        'students-attendance': f'/api/students/{child.id}/attendance/',
+        'grades-list': '/api/grades/',
+        'attendance-list': '/api/attendance/',
+        'incidents-list': '/api/incidents/',
+        'threads-list': '/api/threads/',
+        'threads-messages': f'/api/threads/{thread.id}/messages/',
+        'threads-unread-count': '/api/threads/unread_count/',
+        'notifications-list': '/api/notifications/',
+        'dashboard': '/api/dashboard/?fresh=1',
+    }
+
+
+# Upper bounds on queries per request (authentication is forced, so these are
+# the view's own queries; savepoints count too). Raise one only together with
+# the change that needs it.
+STAFF_QUERY_CEILINGS = {
+    'students-list': 4,  # + conditional GET validator
+    'students-detail': 2,
+    'students-attendance': 4,  # + conditional GET validator
+    'users-list': 2,
+    'assessments-list': 2,
+    'grades-list': 1,
+    'attendance-list': 1,
+    'incidents-list': 1,
+    'threads-list': 2,
+    'threads-detail': 2,
+    'threads-messages': 10,
+    'threads-unread-count': 1,
+    'notifications-list': 1,
+    'dashboard': 6,
+    'classes-gradebook': 4,  # roster, assessments, scores
+    'me': 0,
+}
+PARENT_QUERY_CEILINGS = {
+    'students-list': 4,  # + conditional GET validator
+    'students-detail': 2,
+    'students-attendance': 4,  # + conditional GET validator
+    'grades-list': 1,
+    'attendance-list': 1,
+    'incidents-list': 1,
+    'threads-list': 2,
+    'threads-messages': 10,
+    'threads-unread-count': 1,
+    'notifications-list': 1,
+    'dashboard': 3,
+}
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(url)
+    assert response.status_code == 200, (url, response.status_code, response.content[:200])
+    return len(ctx)
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False, 'TIMEOUT': 0})
+class QueryCountRegressionTests(TestCase):
+    """Per-endpoint query counts stay under their ceiling and do not grow with the data."""
+
+    def setUp(self):
+        cache.clear()
+
+    def measure(self, client, endpoints):
+        counts = {}
+        for name, url in endpoints.items():
+            # the first request may do one-off work (e.g. writing read receipts)
+            client.get(url)
+            counts[name] = count_queries(client, url)
+        return counts
+
+    def test_query_counts_are_flat(self):
+        school = build_school()
+        staff = client_for(school.admin)
+        parent = client_for(school.parent)
+        staff_small = self.measure(staff, staff_endpoints(school))
+        parent_small = self.measure(parent, parent_endpoints(school))
+
+        # a second, larger batch of data for the same users
+        build_school(
+            classes=4, students_per_class=25, guardians_per_student=2, terms=2, attendance_days=10,
+            incidents_per_class=5, threads=6, messages_per_thread=30, children_of_parent=3,
+            prefix='b', admin=school.admin, teacher=school.teacher, parent=school.parent, seed=1,
+        )
+        staff_large = self.measure(staff, staff_endpoints(school))
+        parent_large = self.measure(parent, parent_endpoints(school))
+
+        self.assertEqual(staff_small, staff_large)
+        self.assertEqual(parent_small, parent_large)
+        for name, count in staff_large.items():
+            self.assertLessEqual(count, STAFF_QUERY_CEILINGS[name], f'staff {name}')
+        for name, count in parent_large.items():
+            self.assertLessEqual(count, PARENT_QUERY_CEILINGS[name], f'parent {name}')
+
+
+@unittest.skipUnless(os.environ.get('KPS_BENCHMARK_REPORT'), 'set KPS_BENCHMARK_REPORT to a file path to run the benchmark')
+class EndpointLatencyBenchmark(TestCase):
+    """Record p50/p95 latency and query counts for every router endpoint and the dashboard.
+
+    Runs only when ``$KPS_BENCHMARK_REPORT`` is set; results are written there
+    as JSON so runs can be diffed between releases. ``$KPS_BENCHMARK_SCALE``
+    multiplies the data size and ``$KPS_BENCHMARK_RUNS`` sets the number of
+    timed requests per endpoint.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def timed(self, client, url, runs):
+        client.get(url)
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - start) * 1000)
+            self.assertEqual(response.status_code, 200, url)
+        samples.sort()
+        return {
+            'queries': count_queries(client, url),
+            'p50_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+            'runs': runs,
+        }
+
+    def test_latency_report(self):
+        scale = int(os.environ.get('KPS_BENCHMARK_SCALE', '1'))
+        runs = int(os.environ.get('KPS_BENCHMARK_RUNS', '10'))
+        school = build_school(
+            classes=3 * scale, students_per_class=30, guardians_per_student=2, attendance_days=10 * scale,
+            threads=5 * scale, messages_per_thread=40, children_of_parent=3,
+        )
+        clients = {'staff': client_for(school.admin), 'parent': client_for(school.parent)}
+
+        # every list endpoint the router exposes, plus the named detail routes
+        urls = {f'{prefix}-list': f'/api/{prefix}/' for prefix, _, _ in router.registry}
+        rows = {}
+        for role, endpoints in (('staff', staff_endpoints(school)), ('parent', parent_endpoints(school))):
+            for url in {**urls, **endpoints}.values():
+                rows[f'{role} GET {url}'] = self.timed(clients[role], url, runs)
+        rows['staff GET /api/dashboard/ (cached)'] = self.timed(clients['staff'], '/api/dashboard/', runs)
+
+        with open(os.environ['KPS_BENCHMARK_REPORT'], 'w') as fh:
+            json.dump({
+                'generated_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'scale': scale,
+                'endpoints': rows,
+            }, fh, indent=2, sort_keys=True)
+
+
+class RequestProfilingTests(TestCase):
+    def test_server_timing_and_duplicate_detection(self):
+        from . import profiling
+        profiling.install()
+        school = build_school()
+        middleware = ['school.middleware.RequestProfilingMiddleware', *settings.MIDDLEWARE]
+        profile = {'ENABLED': True, 'SAMPLE_RATE': 1.0, 'SLOW_MS': 10_000, 'SERVER_TIMING': True}
+        with self.settings(MIDDLEWARE=middleware, REQUEST_PROFILING=profile), self.assertLogs('school.profiling') as logs:
+            response = client_for(school.admin).get('/api/students/')
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="4 queries"')
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], 4)
+        self.assertIn('serialize_ms', record)
+
+        with profiling.profile('n+1') as p:
+            for student in school.students[:3]:
+                list(student.guardian.all())
+        self.assertEqual(p.duplicates()[0][1], 3)
+
+
+class GuardianCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_child_ids_follow_guardian_changes(self):
+        school = build_school()
+        parent = client_for(school.parent)
+        other = school.students[-1]
+        ids = lambda: {s['id'] for s in parent.get('/api/students/').json()['results']}
+
+        self.assertEqual(ids(), {s.id for s in school.students[:2]})
+        self.assertEqual(parent.get(f'/api/students/{other.id}/').status_code, 404)
+        other.guardian.add(school.parent)
+        self.assertIn(other.id, ids())
+        school.parent.children.remove(other)
+        self.assertNotIn(other.id, ids())
+        other.guardian.add(school.parent)
+        other.guardian.clear()
+        self.assertNotIn(other.id, ids())
+
+    def test_stale_read_before_commit_is_dropped(self):
+        from . import guardians
+
+        school = build_school()
+        parent, child, other = school.parent, school.students[0], school.students[-1]
+        before = guardians.child_ids(parent)
+        self.assertIn(child.id, before)
+
+        def stale_read(ids):
+            # a concurrent request that does not see the uncommitted change yet
+            cache.set(guardians._key(parent.pk), list(ids), settings.GUARDIAN_CACHE_TIMEOUT)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            child.guardian.remove(parent)
+            other.guardian.add(parent)
+            stale_read(before)
+            self.assertIn(child.id, guardians.child_ids(parent))
+        self.assertNotIn(child.id, guardians.child_ids(parent))
+        self.assertIn(other.id, guardians.child_ids(parent))
+
+        linked = guardians.child_ids(parent)
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+            stale_read(linked)
+        self.assertNotIn(other.id, guardians.child_ids(parent))
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_move_on_commit_and_fresh_recomputes(self):
+        from django.db import transaction
+        from .models import AttendanceRecord, Student, User
+
+        school = build_school()
+        staff, parent = client_for(school.admin), client_for(school.parent)
+        totals = staff.get('/api/dashboard/').json()
+        students = totals['total_students']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(first_name='New', last_name='Pupil', admission_number='D-1')
+        self.assertEqual(staff.get('/api/dashboard/').json()['total_students'], students + 1)
+
+        # a rolled-back write leaves the cached counters alone
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Student.objects.create(first_name='Gone', last_name='Pupil', admission_number='D-2')
+                    User.objects.create_user(username='d-teacher', password='pass', role='teacher')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        data = staff.get('/api/dashboard/').json()
+        self.assertEqual((data['total_students'], data['total_teachers']), (students + 1, totals['total_teachers']))
+
+        # writes that skip the signals are only picked up by ?fresh=1
+        User.objects.filter(role='teacher').update(role='admin')
+        self.assertEqual(staff.get('/api/dashboard/').json()['total_teachers'], totals['total_teachers'])
+        self.assertEqual(staff.get('/api/dashboard/?fresh=1').json()['total_teachers'], 0)
+        self.assertEqual(staff.get('/api/dashboard/').json()['total_teachers'], 0)
+
+        # a child's attendance today drops the parent's cached dashboard
+        child = school.students[0]
+        today = timezone.now().date()
+        AttendanceRecord.objects.filter(student=child, date=today).delete()
+        before = parent.get('/api/dashboard/?fresh=1').json()['attendance_today']
+        with self.captureOnCommitCallbacks(execute=True):
+            AttendanceRecord.objects.create(student=child, date=today, status='present')
+        self.assertEqual(parent.get('/api/dashboard/').json()['attendance_today'], before + 1)
+
+
+class UnreadCounterTests(TestCase):
+    def counters(self):
+        from .models import ThreadReadState, UserUnreadCount
+        states = ThreadReadState.objects.filter(unread_count__gt=0).values_list('thread_id', 'user_id', 'unread_count')
+        return sorted(states), dict(UserUnreadCount.objects.filter(unread__gt=0).values_list('user_id', 'unread'))
+
+    def assertMatchesRebuild(self):
+        from . import unread
+        incremental = self.counters()
+        unread.rebuild()
+        self.assertEqual(self.counters(), incremental)
+
+    def test_counters_follow_writes_and_rebuilds(self):
+        from . import unread
+        from .models import Message, ThreadReadState, UserUnreadCount
+
+        school = build_school(threads=2, messages_per_thread=4)
+        thread, other_thread = school.threads
+        teacher, parent, admin = school.teacher, school.parent, school.admin
+        start = unread.unread_total(parent.id)
+        self.assertMatchesRebuild()
+
+        # send: every participant but the sender
+        teacher_total = unread.unread_total(teacher.id)
+        response = client_for(teacher).post(f'/api/threads/{thread.id}/messages/', {'body': 'hi'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(unread.unread_total(parent.id), start + 1)
+        self.assertEqual(unread.unread_total(teacher.id), teacher_total)
+        self.assertMatchesRebuild()
+
+        # read: the thread's count leaves the total
+        in_thread = ThreadReadState.objects.get(thread=thread, user=parent).unread_count
+        client_for(parent).get(f'/api/threads/{thread.id}/messages/')
+        self.assertEqual(unread.unread_total(parent.id), start + 1 - in_thread)
+        self.assertMatchesRebuild()
+
+        # deleting an unread message uncounts it; a read one changes nothing
+        read_total = unread.unread_total(parent.id)
+        message = Message.objects.create(thread=thread, sender=teacher, body='oops')
+        message.read_by.add(teacher)
+        unread.record_message(message)
+        self.assertEqual(unread.unread_total(parent.id), read_total + 1)
+        message.delete()
+        self.assertEqual(unread.unread_total(parent.id), read_total)
+        thread.messages.order_by('id').first().delete()
+        self.assertEqual(unread.unread_total(parent.id), read_total)
+        self.assertMatchesRebuild()
+
+        # membership: a new participant starts with the whole thread unread
+        thread.participants.add(admin)
+        self.assertEqual(unread.unread_total(admin.id), thread.messages.count())
+        admin.threads.remove(thread)
+        self.assertEqual(unread.unread_total(admin.id), 0)
+        self.assertMatchesRebuild()
+
+        # deleting a thread takes its counts with it
+        remaining = ThreadReadState.objects.get(thread=other_thread, user=parent).unread_count
+        total = unread.unread_total(parent.id)
+        other_thread.delete()
+        self.assertEqual(unread.unread_total(parent.id), total - remaining)
+        self.assertMatchesRebuild()
+
+        # full and partial rebuilds repair drifted counters
+        expected = self.counters()
+        UserUnreadCount.objects.filter(user__in=[teacher, parent]).update(unread=42)
+        ThreadReadState.objects.update(unread_count=7)
+        unread.rebuild(user_ids=[parent.id])
+        self.assertEqual(unread.unread_total(parent.id), expected[1].get(parent.id, 0))
+        self.assertEqual(unread.unread_total(teacher.id), 42)
+        unread.rebuild(thread_ids=[thread.id])
+        self.assertEqual(self.counters(), expected)
+        UserUnreadCount.objects.update(unread=42)
+        unread.rebuild()
+        self.assertEqual(self.counters(), expected)
+
+    def test_message_sent_while_reading_stays_unread(self):
+        from unittest import mock
+        from . import unread
+        from .models import Message
+
+        school = build_school(threads=1, messages_per_thread=4)
+        thread, teacher, parent = school.threads[0], school.teacher, school.parent
+        Receipt = Message.read_by.through
+        bulk_create = Receipt.objects.bulk_create
+
+        def send_meanwhile(*args, **kwargs):
+            message = Message.objects.create(thread=thread, sender=teacher, body='late')
+            message.read_by.add(teacher)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Receipt.objects, 'bulk_create', side_effect=send_meanwhile):
+            unread.mark_thread_read(parent.id, thread.id)
+        # the sender's counter update waits on the read state's row lock
+        late = thread.messages.get(body='late')
+        unread.record_message(late)
+        self.assertEqual(unread.unread_total(parent.id), 1)
+        self.assertFalse(late.read_by.filter(pk=parent.pk).exists())
+        self.assertMatchesRebuild()
+
+
+class OutboxTests(TestCase):
+    def test_fan_out_happens_in_the_worker(self):
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from . import outbox, unread
+        from .models import Notification, OutboxEvent
+
+        school = build_school(guardians_per_student=3)
+        student = school.students[0]
+        assessment = school.assessments[-1]
+        student.grades.filter(assessment=assessment).delete()
+        teacher = client_for(school.teacher)
+
+        response = teacher.post('/api/grades/', {'student': student.id, 'assessment': assessment.id, 'score': 80}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(OutboxEvent.objects.filter(processed_at__isnull=True).count(), 1)
+
+        def boom(events):
+            raise RuntimeError('db away')
+        with mock.patch.dict(outbox.HANDLERS, {'grades.recorded': boom}):
+            outbox.drain()
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertIn('db away', event.last_error)
+        OutboxEvent.objects.update(available_at=timezone.now())
+        outbox.drain()
+        self.assertEqual(Notification.objects.filter(user__in=student.guardian.all()).count(), 4)
+
+        layer = get_channel_layer()
+        async_to_sync(layer.group_add)(f'user_{school.parent.id}', 'test.parent')
+        thread = school.threads[0]
+        for body in ('one', 'two'):
+            teacher.post(f'/api/threads/{thread.id}/messages/', {'body': body}, format='json')
+        outbox.drain()
+        message = async_to_sync(layer.receive)('test.parent')
+        # both sends coalesce into one push carrying the latest total
+        self.assertEqual(message, {'type': 'unread.count', 'unread': unread.unread_total(school.parent.id)})
+        self.assertEqual(OutboxEvent.objects.filter(processed_at__isnull=True).count(), 0)
+
+    def test_failed_group_retries_events_one_by_one(self):
+        from unittest import mock
+        from . import outbox
+        from .models import Notification, OutboxEvent
+
+        school = build_school()
+        teacher = client_for(school.teacher)
+        assessment = school.assessments[-1]
+        good, poison = school.students[0], school.students[1]
+        for student in (good, poison):
+            student.grades.filter(assessment=assessment).delete()
+            response = teacher.post('/api/grades/', {'student': student.id, 'assessment': assessment.id, 'score': 70}, format='json')
+            self.assertEqual(response.status_code, 201)
+        poison_entry = poison.grades.get(assessment=assessment).pk
+
+        grades_recorded = outbox.HANDLERS['grades.recorded']
+
+        def picky(events):
+            if any(poison_entry in event.payload['entries'] for event in events):
+                raise RuntimeError('bad entry')
+            return grades_recorded(events)
+        with mock.patch.dict(outbox.HANDLERS, {'grades.recorded': picky}):
+            outbox.drain()
+
+        pending = OutboxEvent.objects.get(processed_at__isnull=True)
+        self.assertEqual(pending.payload['entries'], [poison_entry])
+        self.assertIn('bad entry', pending.last_error)
+        self.assertGreater(pending.available_at, timezone.now())
+        self.assertTrue(Notification.objects.filter(user__in=good.guardian.all()).exists())
+        self.assertFalse(Notification.objects.filter(user__in=poison.guardian.all()).exclude(user__in=good.guardian.all()).exists())
+
+    def test_create_and_event_commit_together(self):
+        from unittest import mock
+        from .models import GradeEntry, OutboxEvent
+
+        school = build_school()
+        student, assessment = school.students[0], school.assessments[-1]
+        student.grades.filter(assessment=assessment).delete()
+        with mock.patch.object(OutboxEvent, 'save', side_effect=RuntimeError('outbox down')):
+            with self.assertRaises(RuntimeError):
+                client_for(school.teacher).post('/api/grades/', {'student': student.id, 'assessment': assessment.id, 'score': 80}, format='json')
+        self.assertFalse(GradeEntry.objects.filter(student=student, assessment=assessment).exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class NotificationPushTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_resume_push_and_mark_all_read(self):
+        from asgiref.sync import async_to_sync, sync_to_async
+        from asgiref.testing import ApplicationCommunicator
+        from channels.routing import URLRouter
+        from rest_framework_simplejwt.tokens import AccessToken
+        from . import outbox
+        from .middleware import JWTAuthMiddleware
+        from .models import GradeEntry, Notification
+        from .routing import websocket_urlpatterns
+
+        school = build_school()
+        parent = school.parent
+        seen, missed = [Notification.objects.create(user=parent, title=t, message=t) for t in ('seen', 'missed')]
+        student = school.students[0]
+        assessment = school.assessments[-1]
+        GradeEntry.objects.filter(student=student, assessment=assessment).delete()
+        outbox.drain()
+        app = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+        async def receive(socket):
+            return json.loads((await socket.receive_output(timeout=5))['text'])
+
+        async def scenario():
+            socket = ApplicationCommunicator(app, {
+                'type': 'websocket', 'path': '/ws/notifications/', 'headers': [],
+                'query_string': f'token={AccessToken.for_user(parent)}&last_id={seen.id}'.encode(),
+            })
+            await socket.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await socket.receive_output(timeout=5))['type'], 'websocket.accept')
+            snapshot = await receive(socket)
+            self.assertEqual(snapshot['type'], 'snapshot')
+            self.assertEqual([n['id'] for n in snapshot['notifications']], [missed.id])
+            self.assertEqual(snapshot['notifications_unread'], 2)
+
+            await sync_to_async(GradeEntry.objects.create)(student=student, assessment=assessment, score=64)
+            await outbox.run(once=True)
+            pushed = await receive(socket)
+            self.assertEqual(pushed['type'], 'notification')
+            self.assertIn(student.first_name, pushed['notification']['title'])
+            self.assertEqual(await receive(socket), {'type': 'notification_count', 'unread': 3})
+
+            await socket.send_input({'type': 'websocket.receive', 'text': json.dumps({'action': 'mark_all_read'})})
+            self.assertEqual(await receive(socket), {'type': 'notification_count', 'unread': 0})
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(timeout=5)
+
+        async_to_sync(scenario)()
+        self.assertEqual(client_for(parent).get('/api/notifications/unread_count/').json(), {'unread': 0})
+
+
+class WebsocketAdmissionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_token_cache_and_connection_limits(self):
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from asgiref.testing import ApplicationCommunicator
+        from channels.routing import URLRouter
+        from rest_framework_simplejwt.tokens import AccessToken
+        from . import consumers, middleware
+        from .models import User
+        from .routing import websocket_urlpatterns
+
+        user = User.objects.create_user(username='storm', password='pass', role='parent')
+        app = middleware.JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+        query = f'token={AccessToken.for_user(user)}'.encode()
+
+        async def connect():
+            socket = ApplicationCommunicator(app, {'type': 'websocket', 'path': '/ws/notifications/', 'headers': [], 'query_string': query})
+            await socket.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await socket.receive_output(timeout=5))['type'], 'websocket.accept')
+            message = await socket.receive_output(timeout=5)
+            return socket, message.get('code')
+
+        async def scenario():
+            first, code = await connect()
+            self.assertIsNone(code)
+            second, code = await connect()
+            self.assertIsNone(code)
+            _, code = await connect()
+            self.assertEqual(code, 4429)  # over the per-user connection limit
+            await first.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await first.wait(timeout=5)
+            third, code = await connect()
+            self.assertIsNone(code)
+            _, code = await connect()
+            self.assertEqual(code, 4429)  # over the connect rate
+            for socket in (second, third):
+                await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+                await socket.wait(timeout=5)
+
+        limits = {'MAX_CONNECTIONS_PER_USER': 2, 'CONNECTS_PER_MINUTE': 4}
+        clock = mock.Mock(time=lambda: 600.0)  # keep every connect in one rate window
+        with self.settings(WEBSOCKET_LIMITS=limits), mock.patch.object(consumers, 'time', clock), \
+                mock.patch.object(middleware, '_load_user', wraps=middleware._load_user) as load:
+            async_to_sync(scenario)()
+        self.assertEqual(load.call_count, 1)
+
+
+def fake_redis_server():
+    """Start an in-process Redis-protocol server (fakeredis) and return (server, url)."""
+    import threading
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f'redis://{host}:{port}/0'
+
+
+@unittest.skipUnless(importlib.util.find_spec('fakeredis'), 'fakeredis is not installed (requirements-dev.txt)')
+class CrossWorkerPushTests(TransactionTestCase):
+    """A push sent by one process reaches a websocket held by another, through Redis."""
+
+    def setUp(self):
+        cache.clear()
+
+    def check_layer(self, config):
+        from asgiref.sync import async_to_sync
+        from asgiref.testing import ApplicationCommunicator
+        from channels.layers import channel_layers
+        from channels.routing import URLRouter
+        from rest_framework_simplejwt.tokens import AccessToken
+        from . import outbox
+        from .middleware import JWTAuthMiddleware
+        from .models import User
+        from .routing import websocket_urlpatterns
+
+        user = User.objects.create_user(username='tab', password='pass', role='parent')
+
+        async def scenario():
+            socket = ApplicationCommunicator(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)), {
+                'type': 'websocket', 'path': '/ws/notifications/', 'headers': [],
+                'query_string': f'token={AccessToken.for_user(user)}'.encode(),
+            })
+            await socket.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await socket.receive_output(timeout=5))['type'], 'websocket.accept')
+            await socket.receive_output(timeout=5)  # snapshot
+            # the next get_channel_layer() builds a new layer with its own connections,
+            # as a separate web or outbox worker process would
+            channel_layers.backends.clear()
+            await outbox.send({(user.id, 'unread.count'): {'type': 'unread.count', 'unread': 7}})
+            pushed = json.loads((await socket.receive_output(timeout=5))['text'])
+            self.assertEqual(pushed, {'type': 'unread_count', 'unread': 7})
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await socket.wait(timeout=5)
+
+        server, url = fake_redis_server()
+        try:
+            config['default'].setdefault('CONFIG', {})['hosts'] = [url]
+            with self.settings(CHANNEL_LAYERS=config):
+                async_to_sync(scenario)()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_pubsub_layer(self):
+        self.check_layer({'default': {'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer'}})
+
+    @unittest.skipUnless(importlib.util.find_spec('lupa'), 'fakeredis needs lupa for the Lua scripts of the list-based layer')
+    def test_redis_layer(self):
+        self.check_layer({'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}})
+
+
+class GradeSheetTests(TestCase):
+    def setUp(self):
+        school = self.school = build_school()
+        self.assessment = school.assessments[0]
+        self.pupils = [s for s in school.students if s.current_class_id == self.assessment.school_class_id]
+        self.outsider = next(s for s in school.students if s.current_class_id != self.assessment.school_class_id)
+        self.staff = client_for(school.teacher)
+
+    def events(self):
+        from .models import OutboxEvent
+        return list(OutboxEvent.objects.filter(kind='grades.recorded').values_list('payload', flat=True))
+
+    def test_json_sheet(self):
+        from .models import GradeEntry
+
+        first, second, third = self.pupils[:3]
+        GradeEntry.objects.filter(assessment=self.assessment, student__in=[first, second]).delete()
+        response = self.staff.post('/api/grades/bulk/', {'assessment': self.assessment.id, 'scores': [
+            {'student': first.id, 'score': 81},
+            {'admission_number': second.admission_number, 'score': 62.5, 'remarks': 'late paper'},
+            {'student': third.id, 'score': 90},
+            {'student': first.id, 'score': 10},
+            {'student': self.outsider.id, 'score': 50},
+            {'admission_number': 'NOPE-1', 'score': 50},
+            {'student': third.id, 'score': 'abc'},
+            {'score': 70},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual((data['created'], data['updated'], data['errors']), (2, 1, 5))
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'created', 'updated'] + ['error'] * 5)
+        self.assertEqual([r['index'] for r in data['results']], list(range(8)))
+        self.assertIn('Duplicate', data['results'][3]['errors']['student'][0])
+        self.assertIn('not enrolled', data['results'][4]['errors']['student'][0])
+        self.assertIn('not enrolled', data['results'][5]['errors']['student'][0])
+        self.assertIn('score', data['results'][6]['errors'])
+        self.assertEqual(GradeEntry.objects.get(assessment=self.assessment, student=first).score, 81)
+        self.assertEqual(GradeEntry.objects.get(assessment=self.assessment, student=third).score, 90)
+        # one outbox event for the whole sheet, carrying only the new entries
+        created = set(GradeEntry.objects.filter(assessment=self.assessment, student__in=[first, second]).values_list('id', flat=True))
+        events = self.events()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(set(events[0]['entries']), created)
+
+    def test_csv_upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import GradeEntry
+
+        rows = ['Admission_Number,Score,Remarks']
+        rows += [f'{s.admission_number},{60 + n},' for n, s in enumerate(self.pupils[:4])]
+        rows += ['UNKNOWN-9,55,', f'{self.pupils[0].admission_number},99,again', ',,', f'{self.pupils[4].admission_number},,']
+        upload = SimpleUploadedFile('sheet.csv', '\n'.join(rows).encode('utf-8-sig'), content_type='text/csv')
+        response = self.staff.post('/api/grades/bulk/', {'assessment': self.assessment.id, 'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        # the blank line is skipped; the pupils already had marks from the synthetic data
+        self.assertEqual((data['created'], data['updated'], data['errors']), (0, 4, 3))
+        self.assertEqual([r['status'] for r in data['results']], ['updated'] * 4 + ['error'] * 3)
+        self.assertEqual(GradeEntry.objects.get(assessment=self.assessment, student=self.pupils[3]).score, 63)
+        self.assertEqual(self.events(), [])
+
+        bad = SimpleUploadedFile('sheet.csv', b'name,mark\nx,1\n', content_type='text/csv')
+        response = self.staff.post('/api/grades/bulk/', {'assessment': self.assessment.id, 'file': bad}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('score column', response.json()['error'])
+
+    @unittest.skipUnless(importlib.util.find_spec('openpyxl'), 'openpyxl is not installed')
+    def test_xlsx_upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        workbook.active.append(['student', 'admission_number', 'score'])
+        for s in self.pupils[:3]:
+            workbook.active.append([float(s.id), None, 75.0])
+        workbook.active.append(['  ', self.pupils[3].admission_number, 70.0])
+        content = io.BytesIO()
+        workbook.save(content)
+        upload = SimpleUploadedFile('sheet.xlsx', content.getvalue())
+        response = self.staff.post('/api/grades/bulk/', {'assessment': self.assessment.id, 'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['updated'], 4)
+
+    def test_csv_upload_with_both_id_columns(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import GradeEntry
+
+        first, second = self.pupils[:2]
+        rows = ['student,admission_number,score', f'{first.id},,71', f',{second.admission_number},72', ',,73']
+        upload = SimpleUploadedFile('sheet.csv', '\n'.join(rows).encode(), content_type='text/csv')
+        response = self.staff.post('/api/grades/bulk/', {'assessment': self.assessment.id, 'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        # a blank cell counts as missing, so either column identifies the pupil
+        self.assertEqual([r['status'] for r in data['results']], ['updated', 'updated', 'error'])
+        self.assertEqual(data['results'][1]['student'], second.id)
+        self.assertEqual(GradeEntry.objects.get(assessment=self.assessment, student=second).score, 72)
+
+    def test_rejections(self):
+        url = '/api/grades/bulk/'
+        all_bad = {'assessment': self.assessment.id, 'scores': [{'student': self.outsider.id, 'score': 1}, {'score': 2}]}
+        response = self.staff.post(url, all_bad, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], 2)
+        self.assertEqual(self.staff.post(url, {'assessment': self.assessment.id}, format='json').status_code, 400)
+        parent = client_for(self.school.parent)
+        sheet = {'assessment': self.assessment.id, 'scores': [{'student': self.pupils[0].id, 'score': 1}]}
+        self.assertEqual(parent.post(url, sheet, format='json').status_code, 403)
+        self.assertEqual(self.events(), [])
+
+
+class ExportTests(TestCase):
+    def test_streaming_exports_keep_role_filters(self):
+        import csv
+        school = build_school()
+        staff, parent = client_for(school.admin), client_for(school.parent)
+        term = school.terms[0]
+
+        response = staff.get(f'/api/attendance/export/?school_class={school.classes[0].id}&term={term.id}')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(line.decode() for line in response.streaming_content))
+        self.assertEqual(rows[0][:3], ['id', 'date', 'admission_number'])
+        self.assertEqual(len(rows) - 1, 10 * 5)
+
+        response = parent.get('/api/grades/export/?format=ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        children = {s.admission_number for s in school.students[:2]}
+        self.assertEqual({line['admission_number'] for line in lines}, children)
+        self.assertEqual(len(lines), 2 * 3 * 2)
+
+        day = school.students[0].attendance.order_by('date').values_list('date', flat=True).first()
+        response = staff.get(f'/api/incidents/export/?format=ndjson&date_from={day}&date_to={day}')
+        self.assertTrue(all(json.loads(line)['date'] == str(day) for line in b''.join(response.streaming_content).splitlines()))
+        self.assertEqual(staff.get('/api/attendance/export/?date_from=yesterday').status_code, 400)
+        # only the streamed formats are offered; JSON would silently get CSV
+        self.assertEqual(staff.get('/api/attendance/export/', HTTP_ACCEPT='application/json').status_code, 406)
+
+
+class AsgiExportTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_export_streams_in_chunks_under_asgi(self):
+        import asyncio
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.core.handlers.asgi import ASGIHandler
+        from rest_framework_simplejwt.tokens import AccessToken
+        from . import exports
+        from .models import AttendanceRecord
+
+        school = build_school()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+            'method': 'GET', 'path': '/api/attendance/export/', 'raw_path': b'/api/attendance/export/',
+            'query_string': b'format=ndjson', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {AccessToken.for_user(school.admin)}'.encode())],
+        }
+        received, sent = [], []
+
+        async def receive():
+            if received:
+                await asyncio.Future()  # the client never disconnects
+            received.append(True)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        with mock.patch.object(exports, 'CHUNK_SIZE', 20):
+            async_to_sync(ASGIHandler())(scope, receive, send)
+
+        self.assertEqual(sent[0]['status'], 200)
+        bodies = [message.get('body') for message in sent[1:] if message.get('body')]
+        self.assertGreater(len(bodies), 1)
+        self.assertEqual(max(body.count(b'\n') for body in bodies), 20)
+        lines = b''.join(bodies).splitlines()
+        self.assertEqual(len(lines), AttendanceRecord.objects.count())
+        self.assertEqual({json.loads(line)['id'] for line in lines}, set(AttendanceRecord.objects.values_list('id', flat=True)))
+
+
+class TermReportTests(TestCase):
+    def test_generate_is_idempotent(self):
+        import tempfile
+        from unittest import mock
+        from .models import GradeEntry, TermReport
+        from .reports import generate_term_reports, rank_with_ties
+
+        self.assertEqual(rank_with_ties({'a': 90, 'b': 75, 'c': 90, 'd': None}), {'a': 1, 'c': 1, 'b': 3})
+
+        school = build_school()
+        term = school.terms[0]
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            self.assertEqual(generate_term_reports(term, workers=2), {'generated': 20, 'skipped': 0})
+            report = TermReport.objects.get(student=school.students[0], term=term)
+            with report.pdf_file.open('rb') as fh:
+                self.assertTrue(fh.read().startswith(b'%PDF-1.4'))
+            self.assertEqual(len(report.summary['subjects']), 3)
+            self.assertEqual(report.summary['class_size'], 10)
+
+            self.assertEqual(generate_term_reports(term, workers=1), {'generated': 0, 'skipped': 20})
+            GradeEntry.objects.filter(student=school.students[0]).update(score=100)
+            old_file = report.pdf_file.name
+
+            # a batch that fails to save keeps the old rows and their files
+            with mock.patch.object(TermReport.objects, 'bulk_update', side_effect=RuntimeError('db down')):
+                with self.assertRaises(RuntimeError):
+                    generate_term_reports(term, classes=[school.classes[0]], workers=1)
+            report.refresh_from_db()
+            self.assertEqual(report.pdf_file.name, old_file)
+            self.assertTrue(report.pdf_file.storage.exists(old_file))
+
+            with self.captureOnCommitCallbacks() as callbacks:
+                summary = generate_term_reports(term, classes=[school.classes[0]], workers=1)
+            self.assertTrue(report.pdf_file.storage.exists(old_file))
+            for callback in callbacks:
+                callback()
+            self.assertFalse(report.pdf_file.storage.exists(old_file))
+            self.assertGreaterEqual(summary['generated'], 1)
+            self.assertEqual(summary['generated'] + summary['skipped'], 10)
+            report.refresh_from_db()
+            self.assertNotEqual(report.pdf_file.name, old_file)
+            self.assertTrue(report.pdf_file.storage.exists(report.pdf_file.name))
+            self.assertEqual(report.summary['position'], 1)
+
+
+class GradebookTests(TestCase):
+    def test_gradebook_matrix(self):
+        from .models import Assessment, GradeEntry, Student
+
+        school = build_school()
+        term, school_class = school.terms[0], school.classes[0]
+        url = f'/api/classes/{school_class.id}/gradebook/?term={term.id}'
+        data = client_for(school.admin).get(url).json()
+        self.assertEqual(len(data['students']['id']), 10)
+        self.assertEqual(len(data['assessments']['id']), 6)
+        self.assertEqual([len(row) for row in data['scores']], [6] * 10)
+        best = data['students']['weighted_total'].index(max(data['students']['weighted_total']))
+        self.assertEqual(data['students']['rank'][best], 1)
+        self.assertEqual(len(data['subjects']['std']), 3)
+        self.assertEqual(client_for(school.parent).get(url).status_code, 403)
+        self.assertEqual(client_for(school.admin).get(url.split('?')[0]).status_code, 400)
+
+        # rows are the active roster and columns the term's assessments, marked or not
+        template = Assessment.objects.filter(school_class=school_class, term=term).first()
+        unmarked = Assessment.objects.create(
+            title='Unmarked', subject=template.subject, school_class=school_class, term=term, assessment_type='test'
+        )
+        newcomer = Student.objects.create(first_name='New', last_name='Comer', admission_number='G-1', current_class=school_class)
+        one_mark = Student.objects.create(first_name='One', last_name='Mark', admission_number='G-2', current_class=school_class)
+        GradeEntry.objects.create(student=one_mark, assessment=template, score=100)
+        school.students[1].is_active = False
+        school.students[1].save()
+
+        data = client_for(school.admin).get(url).json()
+        ids = data['students']['id']
+        self.assertEqual(len(ids), 11)
+        self.assertNotIn(school.students[1].id, ids)
+        self.assertIn(unmarked.id, data['assessments']['id'])
+        self.assertTrue(all(row[data['assessments']['id'].index(unmarked.id)] is None for row in data['scores']))
+        # a pupil without marks is unranked; missing scores count as 0, so one 100 does not rank first
+        self.assertIsNone(data['students']['weighted_total'][ids.index(newcomer.id)])
+        self.assertIsNone(data['students']['rank'][ids.index(newcomer.id)])
+        self.assertEqual(data['students']['weighted_total'][ids.index(one_mark.id)], round(100 * template.weight / sum(data['assessments']['weight']), 2))
+        self.assertGreater(data['students']['rank'][ids.index(one_mark.id)], 1)
+
+
+class AttendanceBulkTests(TestCase):
+    def test_register(self):
+        from .models import AttendanceRecord
+
+        school = build_school()
+        school_class = school.classes[0]
+        pupils = [s for s in school.students if s.current_class_id == school_class.id]
+        outsider = next(s for s in school.students if s.current_class_id != school_class.id)
+        staff = client_for(school.teacher)
+        day = datetime.date(2025, 12, 2)
+        AttendanceRecord.objects.create(student=pupils[0], date=day, status='absent')
+        AttendanceRecord.objects.create(student=pupils[1], date=day, status='present')
+
+        def register(client, records, date=day):
+            return client.post('/api/attendance/bulk/', {'school_class': school_class.id, 'date': str(date), 'records': records}, format='json')
+
+        response = register(staff, [
+            {'student': pupils[0].id, 'status': 'present'},
+            {'student': pupils[1].id, 'status': 'late', 'note': 'bus'},
+            {'student': pupils[2].id, 'status': 'absent'},
+            {'student': pupils[3].id, 'status': 'present'},
+            {'student': pupils[2].id, 'status': 'present'},
+            {'student': outsider.id, 'status': 'present'},
+            {'student': pupils[4].id, 'status': 'asleep'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual((data['created'], data['updated']), (2, 2))
+        self.assertEqual([r['status'] for r in data['results']], ['updated', 'updated', 'created', 'created', 'error', 'error', 'error'])
+        self.assertIn('Duplicate', data['results'][4]['errors']['student'][0])
+        self.assertIn('not enrolled', data['results'][5]['errors']['student'][0])
+        self.assertIn('status', data['results'][6]['errors'])
+        records = dict(AttendanceRecord.objects.filter(date=day).values_list('student_id', 'status'))
+        self.assertEqual(records, {pupils[0].id: 'present', pupils[1].id: 'late', pupils[2].id: 'absent', pupils[3].id: 'present'})
+        record = AttendanceRecord.objects.get(student=pupils[1], date=day)
+        self.assertEqual((record.note, record.recorded_by_id, record.school_class_id), ('bus', school.teacher.id, school_class.id))
+
+        # an inactive pupil is not on the register
+        pupils[5].is_active = False
+        pupils[5].save()
+        response = register(staff, [{'student': pupils[5].id, 'status': 'present'}, {'student': outsider.id, 'status': 'late'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.json()['created'], response.json()['updated']), (0, 0))
+        self.assertEqual([r['status'] for r in response.json()['results']], ['error', 'error'])
+        self.assertEqual(register(staff, []).status_code, 400)
+        self.assertEqual(register(client_for(school.parent), [{'student': pupils[0].id, 'status': 'absent'}]).status_code, 403)
+        self.assertEqual(AttendanceRecord.objects.get(student=pupils[0], date=day).status, 'present')
+
+
+class AttendanceAnalyticsTests(TestCase):
+    def rollups(self):
+        from .models import AttendanceDailyRollup
+        return sorted(AttendanceDailyRollup.objects.values_list('school_class', 'date', 'present', 'absent', 'late', 'excused'))
+
+    def test_rollups_follow_writes(self):
+        from . import analytics
+        from .models import AttendanceRecord
+
+        school = build_school()
+        staff = client_for(school.admin)
+        school_class, student = school.classes[0], school.students[0]
+        built = self.rollups()
+        self.assertEqual(sum(r[2] + r[3] + r[4] + r[5] for r in built), 20 * 5)
+
+        record = student.attendance.order_by('date').first()
+        record.status = 'late' if record.status != 'late' else 'absent'
+        record.save()
+        day = datetime.date(2025, 12, 1)
+        AttendanceRecord.objects.create(student=student, date=day, status='absent')
+        student.attendance.filter(date=day).get().delete()
+        response = staff.post('/api/attendance/bulk/', {
+            'school_class': school_class.id,
+            'date': str(record.date),
+            'records': [{'student': s.id, 'status': 'excused'} for s in school.students[:10]],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        # a pupil moved to another class keeps their earlier days in the old class
+        mover = school.students[1]
+        mover.current_class = school.classes[1]
+        mover.save()
+        old_days = list(mover.attendance.exclude(date=record.date).order_by('date'))
+        old_days[0].status = 'late' if old_days[0].status != 'late' else 'present'
+        old_days[0].save()
+        old_days[1].delete()
+        AttendanceRecord.objects.create(student=mover, date=day, status='present')
+
+        incremental = self.rollups()
+        self.assertTrue(all(n >= 0 for row in incremental for n in row[2:]))
+        self.assertEqual(analytics.rebuild(), len(incremental))
+        self.assertEqual(self.rollups(), incremental)
+        self.assertIn((school_class.id, record.date, 0, 0, 0, 10), incremental)
+        self.assertIn((school.classes[1].id, day, 1, 0, 0, 0), incremental)
+
+        url = f'/api/attendance/analytics/?term={school.terms[0].id}&period=total'
+        data = staff.get(url).json()
+        self.assertEqual([row['total'] for row in data['results']], [49, 50])
+        self.assertEqual(client_for(school.parent).get(url).status_code, 403)
+        self.assertEqual(staff.get('/api/attendance/analytics/?period=year').status_code, 400)
+
+        data = staff.get(f'/api/attendance/chronic_absence/?term={school.terms[0].id}&threshold=0').json()
+        self.assertTrue(all(row['absent'] > 0 for row in data['results']))
+
+        # chronic absence also counts days in the class they were taken in
+        AttendanceRecord.objects.create(student=mover, date=day + datetime.timedelta(days=1), status='absent')
+        rows = analytics.chronic_absence(day, day + datetime.timedelta(days=1), threshold=0, class_ids=[school.classes[1].id])
+        moved = next(row for row in rows if row['student'] == mover.id)
+        self.assertEqual((moved['school_class'], moved['days'], moved['absent']), (school.classes[1].id, 2, 1))
+        old_days[2].status = 'absent'
+        old_days[2].save()
+        rows = analytics.chronic_absence(old_days[2].date, day, threshold=0, class_ids=[old_days[2].school_class_id])
+        self.assertIn(mover.id, [row['student'] for row in rows])
+
+
+class FastSerializerTests(TestCase):
+    def test_matches_model_serializers(self):
+        from rest_framework.test import APIRequestFactory
+        from .fastserializers import compile_serializer
+        from .models import AttendanceRecord, GradeEntry, Student
+        from .serializers import AttendanceSerializer, GradeEntrySerializer, StudentSerializer
+
+        school = build_school(guardians_per_student=2)
+        school.students[0].photo = 'students/photos/a.jpg'
+        school.students[0].save()
+        request = APIRequestFactory().get('/api/students/')
+        for serializer_class, queryset in (
+            (StudentSerializer, Student.objects.prefetch_related('guardian')),
+            (AttendanceSerializer, AttendanceRecord.objects.all()),
+            (GradeEntrySerializer, GradeEntry.objects.all()),
+        ):
+            queryset = queryset.order_by('id')
+            compiled = compile_serializer(serializer_class)
+            expected = json.loads(json.dumps(serializer_class(queryset, many=True, context={'request': request}).data))
+            fast = json.loads(json.dumps(compiled.serialize(list(compiled.values(queryset)), request)))
+            for row in expected + fast:
+                row.get('guardian', []).sort(key=lambda g: g['id'])
+            self.assertEqual(fast, expected, serializer_class.__name__)
+
+        data = client_for(school.admin).get('/api/students/?limit=5').json()
+        self.assertEqual(data['count'], 20)
+        self.assertTrue(all(len(row['guardian']) >= 2 for row in data['results']))
+        data = client_for(school.parent).get('/api/attendance/').json()
+        self.assertEqual({row['student'] for row in data['results']}, {s.id for s in school.students[:2]})
+
+    def test_benchmark(self):
+        """Compare list serialization time of the compiled path against the DRF serializer."""
+        from .fastserializers import compile_serializer
+        from .models import Student
+        from .serializers import StudentSerializer
+
+        build_school(classes=5, students_per_class=40, guardians_per_student=2)
+        queryset = Student.objects.prefetch_related('guardian').order_by('id')
+        compiled = compile_serializer(StudentSerializer)
+
+        def best(fn, runs=5):
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - start)
+            return min(timings)
+
+        drf = best(lambda: StudentSerializer(list(queryset.all()), many=True).data)
+        fast = best(lambda: compiled.serialize(list(compiled.values(queryset))))
+        # loose bound so slow CI machines do not flake; typically several times faster
+        self.assertLess(fast, drf, f'fast {fast * 1000:.1f}ms vs drf {drf * 1000:.1f}ms')
+
+
+class StudentSearchTests(TestCase):
+    def test_prefix_typo_and_scope(self):
+        from .models import Student, StudentSearchKey
+
+        school = build_school()
+        staff, parent = client_for(school.admin), client_for(school.parent)
+        pupil = Student.objects.create(first_name='Katherine', last_name='Ssewankambo', admission_number='KPS/2025-017')
+        Student.objects.create(first_name='Kathy', last_name='Ssekandi', admission_number='KPS/2025-018')
+
+        def names(client, q):
+            return [f"{row['first_name']} {row['last_name']}" for row in client.get('/api/students/', {'q': q}).json()['results']]
+
+        self.assertEqual(names(staff, 'kath')[:2], ['Kathy Ssekandi', 'Katherine Ssewankambo'])
+        # prefix match ahead of the one-edit match
+        self.assertEqual(names(staff, 'kathe'), ['Katherine Ssewankambo', 'Kathy Ssekandi'])
+        self.assertEqual(names(staff, 'kathrine'), ['Katherine Ssewankambo'])
+        self.assertEqual(names(staff, 'ssewnakambo katherine'), ['Katherine Ssewankambo'])
+        self.assertEqual(names(staff, 'kps2025017'), ['Katherine Ssewankambo'])
+        self.assertEqual(names(staff, 'kathy ssekandi')[0], 'Kathy Ssekandi')
+        self.assertEqual(names(parent, 'kath'), [])
+        child = school.students[0]
+        self.assertIn(f'{child.first_name} {child.last_name}', names(parent, child.admission_number))
+
+        pupil.last_name = 'Nansubuga'
+        pupil.save()
+        self.assertEqual(names(staff, 'ssewankambo'), [])
+        self.assertEqual(names(staff, 'nansubuga'), ['Katherine Nansubuga'])
+        pupil.delete()
+        self.assertFalse(StudentSearchKey.objects.filter(student_id=pupil.pk).exists())
+
+
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # an in-memory SQLite database standing in for a replica that has not
+        # caught up; the test lists it in REPLICA_DATABASES with override_settings.
+        # It is added here rather than in settings, so the runner never sees it.
+        from django.apps import apps
+        from django.db import connections
+        replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+        connections.settings['replica'] = connections.configure_settings({'default': {}, 'replica': replica})['replica']
+        with connections['replica'].schema_editor() as editor:
+            for model in apps.get_models():
+                editor.create_model(model)
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        from django.db import connections
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reads_use_replica_until_the_user_writes(self):
+        from .models import AttendanceRecord, Student, User
+
+        admin = User.objects.create_user(username='r-admin', password='pass', role='admin')
+        primary = Student.objects.create(first_name='Primary', last_name='Pupil', admission_number='P-1')
+        AttendanceRecord.objects.create(student=primary, date=datetime.date(2025, 3, 3), status='present')
+        # bulk_create skips the signals, which write to the primary
+        Student.objects.using('replica').bulk_create([Student(first_name='Replica', last_name='Pupil', admission_number='R-1')])
+        teacher = User.objects.create_user(username='r-teacher', password='pass', role='teacher')
+        client, other = client_for(admin), client_for(teacher)
+
+        def names(client):
+            response = client.get('/api/students/')
+            return response.get('X-Cache'), sorted(row['first_name'] for row in response.json()['results'])
+
+        self.assertEqual(names(client), ('MISS', ['Primary']))
+        with self.settings(REPLICA_DATABASES=['replica'], RESPONSE_CACHE={**settings.RESPONSE_CACHE, 'ENABLED': False}):
+            self.assertEqual(names(client), (None, ['Replica']))
+        with self.settings(REPLICA_DATABASES=['replica']):
+            response = client.post('/api/students/', {'first_name': 'New', 'last_name': 'Pupil', 'admission_number': 'P-2'})
+            self.assertEqual(response.status_code, 201, response.content)
+            # another staff member reads right after the write: the replica has
+            # not caught up, so the miss that fills the shared entry uses the primary
+            self.assertEqual(names(other), ('MISS', ['New', 'Primary']))
+            self.assertEqual(names(client), ('HIT', ['New', 'Primary']))
+            # reads that skip the cache still use the replica; the writer is pinned
+            response = other.get('/api/attendance/export/?format=ndjson')
+            self.assertEqual(b''.join(response.streaming_content), b'')
+            response = client.get('/api/attendance/export/?format=ndjson')
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+        response = other.get('/api/attendance/export/?format=ndjson')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+
+class ConditionalGetTests(TestCase):
+    def test_not_modified_until_the_data_changes(self):
+        school = build_school()
+        parent, staff = client_for(school.parent), client_for(school.admin)
+        child = school.students[0]
+
+        def revalidate(client, url):
+            first = client.get(url)
+            self.assertEqual(first.status_code, 200)
+            return client.get(url, HTTP_IF_NONE_MATCH=first['ETag']), first
+
+        urls = ['/api/students/', f'/api/students/{child.id}/', f'/api/students/{child.id}/attendance/', '/api/auth/me/', '/api/reports/']
+        for url in urls:
+            response, first = revalidate(parent, url)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], first['ETag'])
+            self.assertEqual(response.content, b'')
+        self.assertNotEqual(staff.get('/api/students/')['ETag'], parent.get('/api/students/')['ETag'])
+
+        list_etag = parent.get('/api/students/')['ETag']
+        response = parent.get(f'/api/students/{child.id}/')
+        child.guardian.add(school.admin)
+        self.assertEqual(parent.get(f'/api/students/{child.id}/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(parent.get('/api/students/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        last_modified = parent.get(f'/api/students/{child.id}/')['Last-Modified']
+        self.assertEqual(parent.get(f'/api/students/{child.id}/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        # the nested guardians are part of the pupil
+        response = staff.get(f'/api/students/{child.id}/')
+        list_etag = staff.get('/api/students/')['ETag']
+        school.admin.first_name = 'Renamed'
+        school.admin.save()
+        response = staff.get(f'/api/students/{child.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Renamed', [guardian['first_name'] for guardian in response.json()['guardian']])
+        self.assertEqual(staff.get('/api/students/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+        url = f'/api/students/{child.id}/attendance/'
+        etag = parent.get(url)['ETag']
+        day = child.attendance.order_by('date').first()
+        response = staff.post('/api/attendance/bulk/', {
+            'school_class': child.current_class_id, 'date': str(day.date),
+            'records': [{'student': child.id, 'status': 'excused' if day.status != 'excused' else 'late'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(parent.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_per_scope_until_a_write(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import Assessment
+        from . import responsecache
+
+        school = build_school()
+        teacher, admin, parent = client_for(school.teacher), client_for(school.admin), client_for(school.parent)
+
+        self.assertEqual(admin.get('/api/assessments/')['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as ctx:
+            response = teacher.get('/api/assessments/')
+        self.assertEqual((response['X-Cache'], len(ctx)), ('HIT', 0))
+        self.assertEqual(parent.get('/api/students/')['X-Cache'], 'MISS')
+        self.assertEqual(admin.get('/api/students/')['X-Cache'], 'MISS')
+        staff_students = admin.get('/api/students/')
+        self.assertEqual(staff_students['X-Cache'], 'HIT')
+        self.assertNotEqual(parent.get('/api/students/').json()['count'], staff_students.json()['count'])
+        # a cached hit still answers conditional requests
+        response = admin.get('/api/students/', HTTP_IF_NONE_MATCH=staff_students['ETag'])
+        self.assertEqual((response.status_code, response['X-Cache']), (304, 'HIT'))
+
+        assessment = Assessment.objects.first()
+        assessment.title = 'Renamed'
+        assessment.save()
+        response = teacher.get('/api/assessments/?limit=100')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Renamed', [row['title'] for row in response.json()['results']])
+        school.students[0].guardian.remove(school.parent)
+        self.assertEqual(parent.get('/api/students/').json()['count'], 1)
+
+        # a miss between a write and its commit is not served after the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            assessment.title = 'Renamed again'
+            assessment.save()
+            self.assertEqual(teacher.get('/api/assessments/?limit=100')['X-Cache'], 'MISS')
+            self.assertEqual(teacher.get('/api/assessments/?limit=100')['X-Cache'], 'HIT')
+        self.assertEqual(teacher.get('/api/assessments/?limit=100')['X-Cache'], 'MISS')
+
+        stats = responsecache.stats()
+        self.assertEqual(stats['assessment-list']['hit'], 2)
+        out = StringIO()
+        call_command('response_cache_stats', '--reset', stdout=out)
+        self.assertIn('student-list', out.getvalue())
+        self.assertEqual(responsecache.stats(), {})
+
+
+class AsyncMessagingTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_send_list_and_unread(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from django.test import AsyncClient
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        school = build_school(messages_per_thread=8)
+        thread = school.threads[0]
+        sender = school.parent
+        recipient = thread.participants.exclude(pk=sender.pk).first()
+        url = f'/api/async/threads/{thread.id}/messages/'
+
+        def normalized(rows):
+            return [{**row, 'read_by': sorted(row['read_by'], key=lambda u: u['id'])} for row in rows]
+
+        outsider_user = school.students[0].guardian.exclude(pk=sender.pk).first()
+        sync_page = client_for(sender).get(f'/api/threads/{thread.id}/messages/').json()['results']
+
+        async def scenario():
+            client = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(sender)}')
+            page = (await client.get(url)).json()
+            self.assertEqual(normalized(page['results']), normalized(sync_page))
+            first = (await client.get(url, {'limit': 3})).json()
+            rest = (await client.get(url, {'limit': 50, 'before': first['next_before']})).json()
+            self.assertEqual([m['id'] for m in first['results'] + rest['results']], [m['id'] for m in page['results']])
+
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add(f'user_{recipient.id}', channel)
+            response = await client.post(url, {'body': ' hello '}, content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()['body'], 'hello')
+            self.assertEqual([u['id'] for u in response.json()['read_by']], [sender.id])
+            pushed = await layer.receive(channel)
+            self.assertEqual(pushed['type'], 'unread.count')
+
+            other = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(recipient)}')
+            self.assertEqual((await other.get('/api/async/unread/')).json(), {'unread': pushed['unread']})
+            self.assertEqual((await client.post(url, {'body': ''}, content_type='application/json')).status_code, 400)
+            self.assertEqual((await AsyncClient().get('/api/async/unread/')).status_code, 401)
+            self.assertEqual((await other.post('/api/async/unread/')).status_code, 405)
+            outsider = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(outsider_user)}')
+            self.assertEqual((await outsider.get(url)).status_code, 404)
+
+        async_to_sync(scenario)()
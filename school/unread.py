@@ -0,0 +1,199 @@
+"""Materialized unread-message counters.
+
+Each participant of a thread has a ``ThreadReadState`` row holding the number
+of messages in that thread they have not read, and every user has a
+``UserUnreadCount`` row with the total. The counters are adjusted with
+``F()`` updates when messages are sent or read, so reading a user's unread
+total is a primary-key lookup instead of a scan of their message history.
+
+A message counts as read by a user when they have a ``Message.read_by``
+receipt for it or it is at or below their ``last_read_message`` watermark.
+Deleting a message takes it out of the counters of everyone who had not
+read it (``forget_message``); deleting a thread subtracts its counts
+(``forget_thread``). ``rebuild`` recomputes both tables from that data and is
+used when thread membership changes and by the ``rebuild_unread_counters``
+command.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Message, MessageThread, ThreadReadState, UserUnreadCount
+
+
+def unread_total(user_id):
+    """Return the number of unread messages for one user."""
+    return UserUnreadCount.objects.filter(user_id=user_id).values_list('unread', flat=True).first() or 0
+
+
+def unread_totals(user_ids):
+    """Return {user_id: unread} for several users in one query."""
+    totals = dict.fromkeys(user_ids, 0)
+    totals.update(UserUnreadCount.objects.filter(user_id__in=user_ids).values_list('user_id', 'unread'))
+    return totals
+
+
+def record_message(message):
+    """Count ``message`` as unread for every participant except its sender.
+
+    Returns the ids of the participants whose counters changed.
+    """
+    recipients = list(
+        MessageThread.participants.through.objects
+        .filter(messagethread_id=message.thread_id)
+        .exclude(user_id=message.sender_id)
+        .values_list('user_id', flat=True)
+    )
+    if not recipients:
+        return recipients
+    with transaction.atomic():
+        ThreadReadState.objects.bulk_create(
+            [ThreadReadState(thread_id=message.thread_id, user_id=u) for u in recipients], ignore_conflicts=True
+        )
+        UserUnreadCount.objects.bulk_create([UserUnreadCount(user_id=u) for u in recipients], ignore_conflicts=True)
+        ThreadReadState.objects.filter(thread_id=message.thread_id, user_id__in=recipients).update(
+            unread_count=F('unread_count') + 1
+        )
+        UserUnreadCount.objects.filter(user_id__in=recipients).update(unread=F('unread') + 1)
+    return recipients
+
+
+def mark_thread_read(user_id, thread_id):
+    """Mark every message in a thread as read by ``user_id``.
+
+    Missing ``Message.read_by`` receipts are written with one INSERT. When a
+    thread has more than ``MESSAGE_RECEIPT_LIMIT`` unreceipted messages only
+    the read watermark is advanced, which covers them without a row each.
+    The user's unread counters are reset either way. Returns how many
+    messages were unread.
+    """
+    with transaction.atomic():
+        state, _ = ThreadReadState.objects.select_for_update().get_or_create(thread_id=thread_id, user_id=user_id)
+        # one snapshot for both the receipts and the watermark, so a message
+        # sent meanwhile is neither receipted nor covered by the watermark
+        snapshot = list(
+            Message.objects
+            .filter(thread_id=thread_id, id__gt=state.last_read_message_id or 0)
+            .annotate(receipted=Exists(Message.read_by.through.objects.filter(message_id=OuterRef('pk'), user_id=user_id)))
+            .values_list('id', 'receipted')
+        )
+        missing = [message_id for message_id, receipted in snapshot if not receipted]
+        if missing and len(missing) <= settings.MESSAGE_RECEIPT_LIMIT:
+            Receipt = Message.read_by.through
+            Receipt.objects.bulk_create(
+                [Receipt(message_id=message_id, user_id=user_id) for message_id in missing], ignore_conflicts=True
+            )
+        latest = max((message_id for message_id, _ in snapshot), default=state.last_read_message_id)
+        if state.unread_count:
+            UserUnreadCount.objects.filter(user_id=user_id).update(unread=F('unread') - state.unread_count)
+        cleared = state.unread_count
+        if cleared or latest != state.last_read_message_id:
+            state.unread_count = 0
+            state.last_read_message_id = latest
+            state.save(update_fields=['unread_count', 'last_read_message'])
+    return cleared
+
+
+def watermarks(thread_id):
+    """Return [(last_read_message_id, user)] for participants with a read watermark."""
+    return [
+        (state.last_read_message_id, state.user)
+        for state in ThreadReadState.objects.filter(thread_id=thread_id, last_read_message__isnull=False).select_related('user')
+    ]
+
+
+def forget_message(message):
+    """Uncount a message that is about to be deleted for everyone who has not read it.
+
+    Returns the ids of the users whose counters changed.
+    """
+    unread_by = (
+        ThreadReadState.objects
+        .filter(thread_id=message.thread_id, unread_count__gt=0)
+        .exclude(user_id__in=Message.read_by.through.objects.filter(message_id=message.pk).values('user_id'))
+        .exclude(last_read_message_id__gte=message.pk)
+    )
+    with transaction.atomic():
+        user_ids = list(unread_by.select_for_update().values_list('user_id', flat=True))
+        if user_ids:
+            ThreadReadState.objects.filter(thread_id=message.thread_id, user_id__in=user_ids).update(
+                unread_count=F('unread_count') - 1
+            )
+            UserUnreadCount.objects.filter(user_id__in=user_ids).update(unread=F('unread') - 1)
+    return user_ids
+
+
+def forget_thread(thread_id):
+    """Subtract a thread's unread messages from its participants' totals (used before deletion)."""
+    with transaction.atomic():
+        for user_id, count in ThreadReadState.objects.filter(thread_id=thread_id, unread_count__gt=0).values_list('user_id', 'unread_count'):
+            UserUnreadCount.objects.filter(user_id=user_id).update(unread=F('unread') - count)
+
+
+def rebuild(thread_ids=None, user_ids=None):
+    """Recompute counters from ``Message.read_by`` and the read watermarks.
+
+    With no arguments every counter is rebuilt. ``thread_ids`` and/or
+    ``user_ids`` restrict the rebuild to those threads and users; totals of
+    the affected users are always recomputed across all their threads.
+    """
+    participants = MessageThread.participants.through.objects.all()
+    states = ThreadReadState.objects.all()
+    if thread_ids is not None:
+        participants = participants.filter(messagethread_id__in=thread_ids)
+        states = states.filter(thread_id__in=thread_ids)
+    if user_ids is not None:
+        participants = participants.filter(user_id__in=user_ids)
+        states = states.filter(user_id__in=user_ids)
+
+    watermark = ThreadReadState.objects.filter(
+        thread_id=OuterRef(OuterRef('messagethread_id')), user_id=OuterRef(OuterRef('user_id'))
+    ).values('last_read_message_id')
+    unread = (
+        Message.objects
+        .filter(thread_id=OuterRef('messagethread_id'))
+        .filter(id__gt=Coalesce(Subquery(watermark), Value(0)))
+        .filter(~Exists(Message.read_by.through.objects.filter(message_id=OuterRef('pk'), user_id=OuterRef(OuterRef('user_id')))))
+        .values('thread_id')
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    rows = list(
+        participants
+        .annotate(unread=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0)))
+        .values_list('messagethread_id', 'user_id', 'unread')
+    )
+
+    with transaction.atomic():
+        affected = set(states.values_list('user_id', flat=True))
+        affected.update(user_id for _, user_id, _ in rows)
+        # drop states for people who are no longer participants
+        keep = {(thread_id, user_id) for thread_id, user_id, _ in rows}
+        stale = [pk for pk, t, u in states.values_list('pk', 'thread_id', 'user_id') if (t, u) not in keep]
+        if stale:
+            ThreadReadState.objects.filter(pk__in=stale).delete()
+        ThreadReadState.objects.bulk_create(
+            [ThreadReadState(thread_id=t, user_id=u, unread_count=c) for t, u, c in rows],
+            update_conflicts=True,
+            unique_fields=['thread', 'user'],
+            update_fields=['unread_count'],
+            batch_size=500,
+        )
+
+        full = thread_ids is None and user_ids is None
+        if full:
+            UserUnreadCount.objects.update(unread=0)
+        totals = dict.fromkeys(affected, 0)
+        totals.update(
+            (ThreadReadState.objects.all() if full else ThreadReadState.objects.filter(user_id__in=affected))
+            .values('user_id').annotate(total=Sum('unread_count')).values_list('user_id', 'total')
+        )
+        UserUnreadCount.objects.bulk_create(
+            [UserUnreadCount(user_id=u, unread=total) for u, total in totals.items()],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['unread'],
+            batch_size=500,
+        )
+    return len(rows)
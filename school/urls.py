@@ -1,26 +1,33 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path
+from . import async_views
 from .views import (
-    StudentViewSet, AssessmentViewSet, GradeEntryViewSet,
+    StudentViewSet, SchoolClassViewSet, AssessmentViewSet, GradeEntryViewSet,
     AttendanceViewSet, BehaviourViewSet, RegisterView, LoginView, MeView,
     DashboardView,
-    UserViewSet, MessageThreadViewSet,
+    UserViewSet, MessageThreadViewSet, TermReportViewSet, NotificationViewSet,
 )
 
 router = DefaultRouter()
 router.register(r'students', StudentViewSet)
 router.register(r'users', UserViewSet)
+router.register(r'classes', SchoolClassViewSet)
 router.register(r'assessments', AssessmentViewSet)
 router.register(r'grades', GradeEntryViewSet)
 router.register(r'attendance', AttendanceViewSet)
 router.register(r'incidents', BehaviourViewSet)
 router.register(r'threads', MessageThreadViewSet)
+router.register(r'reports', TermReportViewSet)
+router.register(r'notifications', NotificationViewSet)
 
 urlpatterns = [
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/login/', LoginView.as_view(), name='login'),
     path('auth/me/', MeView.as_view(), name='me'),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    # async messaging hot path (school.async_views)
+    path('async/threads/<int:thread_id>/messages/', async_views.thread_messages, name='async-thread-messages'),
+    path('async/unread/', async_views.unread_count, name='async-unread'),
 
 ]
 
@@ -1,27 +1,42 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import User, Student, SchoolClass, Assessment, GradeEntry, AttendanceRecord, BehaviourIncident, Notification, MessageThread, Message
+from .models import User, Student, SchoolClass, Assessment, GradeEntry, AttendanceRecord, BehaviourIncident, Notification, MessageThread, Message, ThreadReadState, TermReport
 from .serializers import UserSerializer, StudentSerializer, SchoolClassSerializer, AssessmentSerializer, GradeEntrySerializer, AttendanceSerializer, BehaviourSerializer, UserSerializer, NotificationSerializer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import serializers
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from .gradesheets import GradeSheetError, import_grade_sheet, iter_upload_rows
+from . import analytics, conditional, dashboard, guardians, notifications, outbox, reports, search, unread
+from .conditional import ConditionalGetMixin
+from .exports import ExportMixin
+from .responsecache import ResponseCacheMixin
+from .fastserializers import FastListMixin, compile_serializer
+from .routers import ReplicaReadMixin
+from .gradebook import class_gradebook
+from rest_framework.pagination import LimitOffsetPagination
+from .pagination import ThreadCursorPagination, MessageCursorPagination, NotificationCursorPagination
 
 
 from . import serializers
 
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
 from django.utils import timezone
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 
 
-class DashboardView(APIView):
+class DashboardView(ReplicaReadMixin, APIView):
     """Admin/dashboard aggregated data endpoint.
 
     Returns counts and a few recent items used by the frontend admin dashboard.
     Only accessible to admins and teachers.
+
+    Figures are served from the cache maintained by ``school.dashboard``;
+    pass ``?fresh=1`` to recompute them from the database (and refresh the cache).
     """
     permission_classes = [IsAuthenticated]
 
@@ -31,99 +46,21 @@ class DashboardView(APIView):
         if not user or not user.is_authenticated:
             return Response({'detail': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
         role = getattr(user, 'role', None)
+        fresh = request.query_params.get('fresh') in ('1', 'true')
 
         # Admin / teacher aggregated dashboard
         if role in ('admin', 'teacher') or getattr(user, 'is_superuser', False):
-            # totals
-            total_students = Student.objects.count()
-            total_parents = User.objects.filter(role='parent').count()
-            total_teachers = User.objects.filter(role='teacher').count()
-
-            # recent students
-            recent_students_qs = Student.objects.select_related('current_class').order_by('-created_at')[:6]
-            recent_students = [
-                {
-                    'id': s.id,
-                    'first_name': s.first_name,
-                    'last_name': s.last_name,
-                    'admission_number': s.admission_number,
-                    'class': s.current_class.name if s.current_class else None,
-                    'created_at': s.created_at.isoformat() if getattr(s, 'created_at', None) is not None else None,
-                }
-                for s in recent_students_qs
-            ]
-
-            # recent incidents
-            recent_incidents_qs = BehaviourIncident.objects.select_related('student').order_by('-date')[:6]
-            recent_incidents = [
-                {
-                    'id': i.id,
-                    'student': {'id': i.student.id, 'name': f"{i.student.first_name} {i.student.last_name}"} if i.student else None,
-                    'date': i.date.isoformat() if getattr(i, 'date', None) is not None else None,
-                    'severity': i.severity,
-                    'description': (i.description[:140] + '...') if i.description and len(i.description) > 140 else i.description,
-                }
-                for i in recent_incidents_qs
-            ]
-
-            # today's attendance summary
-            today = timezone.now().date()
-            attendance_today = AttendanceRecord.objects.filter(date=today).count()
-
-            data = {
-                'total_students': total_students,
-                'total_parents': total_parents,
-                'total_teachers': total_teachers,
-                'attendance_today': attendance_today,
-                'recent_students': recent_students,
-                'recent_incidents': recent_incidents,
-            }
-
-            return Response(data)
+            return Response(dashboard.staff_dashboard(fresh=fresh))
 
         # Parent-specific dashboard
         if role == 'parent':
-            # students where this user is guardian
-            students_qs = Student.objects.filter(guardian=user).select_related('current_class')
-            students = [
-                {
-                    'id': s.id,
-                    'first_name': s.first_name,
-                    'last_name': s.last_name,
-                    'admission_number': s.admission_number,
-                    'class': s.current_class.name if s.current_class else None,
-                }
-                for s in students_qs
-            ]
-
-            today = timezone.now().date()
-            attendance_today = AttendanceRecord.objects.filter(student__guardian=user, date=today).count()
-
-            recent_incidents_qs = BehaviourIncident.objects.select_related('student').filter(student__guardian=user).order_by('-date')[:6]
-            recent_incidents = [
-                {
-                    'id': i.id,
-                    'student': {'id': i.student.id, 'name': f"{i.student.first_name} {i.student.last_name}"} if i.student else None,
-                    'date': i.date.isoformat() if getattr(i, 'date', None) is not None else None,
-                    'severity': i.severity,
-                    'description': (i.description[:140] + '...') if i.description and len(i.description) > 140 else i.description,
-                }
-                for i in recent_incidents_qs
-            ]
-
-            data = {
-                'students': students,
-                'attendance_today': attendance_today,
-                'recent_incidents': recent_incidents,
-            }
-
-            return Response(data)
+            return Response(dashboard.parent_dashboard(user, fresh=fresh))
 
         # all other roles are forbidden from this aggregated endpoint
         return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     """API for managing users. Admins/teachers see all users. Parents only see their own record.
 
     Creating a user will use Django's create_user helper so passwords are hashed.
@@ -131,6 +68,8 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LimitOffsetPagination
+    cache_models = (User,)
 
     def get_queryset(self):
         user = getattr(self.request, 'user', None)
@@ -187,102 +126,373 @@ class IsGuardianOrStaff(permissions.BasePermission):
 
         # for student-scoped objects, check guardian relationship
         # obj may be a Student, GradeEntry, AttendanceRecord, BehaviourIncident
-        # normalize to a Student instance
-        student = None
         if isinstance(obj, Student):
-            student = obj
+            student_id = obj.pk
         else:
             # many related models reference student under attribute 'student'
-            student = getattr(obj, 'student', None)
+            student_id = getattr(obj, 'student_id', None)
 
-        if student is None:
+        if student_id is None:
             # if we cannot determine student, deny access by default
             return False
 
-        return user in student.guardian.all()
+        return student_id in guardians.child_ids(user, request)
 
-class StudentViewSet(viewsets.ModelViewSet):
+class StudentViewSet(ReplicaReadMixin, ResponseCacheMixin, ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Student.objects.select_related('current_class').prefetch_related('guardian').all()
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated, IsGuardianOrStaff]
+    pagination_class = LimitOffsetPagination
+    cache_models = (Student, User)  # guardians are nested users
 
     def get_queryset(self):
         """Return queryset filtered by role: parents only see their guardianed students.
 
         Admins and teachers see the full set (same dashboard). Parents only see
-        students where they are listed as a guardian.
+        students where they are listed as a guardian. ``?q=`` searches names
+        and admission numbers (prefix and single-typo matches), best match first.
         """
         user = getattr(self.request, 'user', None)
         qs = super().get_queryset()
+        child_ids = None
         if user and user.is_authenticated and getattr(user, 'role', None) == 'parent':
-            return qs.filter(guardian=user)
+            child_ids = guardians.child_ids(user, self.request)
+            qs = qs.filter(id__in=child_ids)
+        q = self.request.query_params.get('q', '').strip()
+        if q and self.action == 'list':
+            qs = search.filter_queryset(qs, q, child_ids)
         return qs
 
     @action(detail=True, methods=['get'])
     def attendance(self, request, pk=None):
         student = self.get_object()
-        qs = student.attendance.all().order_by('-date')[:100]
-        serializer = AttendanceSerializer(qs, many=True)
-        return Response(serializer.data)
+        compiled = compile_serializer(AttendanceSerializer)
+        recent = student.attendance.order_by('-date')[:100]
+        count, changed, last = conditional.queryset_validators(recent, 'updated_at')
+        etag = conditional.make_etag(conditional.scope(request), 'attendance', student.pk, count, changed, last)
+        return conditional.respond(request, etag, changed, lambda: Response(compiled.serialize(list(compiled.values(recent)), request)))
+
+class SchoolClassViewSet(ReplicaReadMixin, ResponseCacheMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = SchoolClass.objects.all().order_by('grade', 'name')
+    serializer_class = SchoolClassSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = LimitOffsetPagination
+    cache_models = (SchoolClass,)
+
+    @action(detail=True, methods=['get'])
+    def gradebook(self, request, pk=None):
+        """The class's student x assessment score matrix for ``?term=``, with totals, ranks and subject statistics."""
+        user = request.user
+        if not (getattr(user, 'role', None) in ('admin', 'teacher') or getattr(user, 'is_superuser', False)):
+            return Response({'detail': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        term = request.query_params.get('term')
+        if not term or not term.isdigit():
+            return Response({'error': 'term is required'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(class_gradebook(self.get_object(), int(term)))
 
-class AssessmentViewSet(viewsets.ModelViewSet):
+class AssessmentViewSet(ReplicaReadMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Assessment.objects.all()
     serializer_class = AssessmentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LimitOffsetPagination
+    cache_models = (Assessment,)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
-class GradeEntryViewSet(viewsets.ModelViewSet):
+class GradeEntryViewSet(ReplicaReadMixin, FastListMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = GradeEntry.objects.select_related('student','assessment').all()
     serializer_class = GradeEntrySerializer
     permission_classes = [IsAuthenticated, IsGuardianOrStaff]
+    export_columns = (
+        ('id', 'id'),
+        ('admission_number', 'student__admission_number'),
+        ('first_name', 'student__first_name'),
+        ('last_name', 'student__last_name'),
+        ('class', 'assessment__school_class__name'),
+        ('term', 'assessment__term__name'),
+        ('subject', 'assessment__subject__name'),
+        ('assessment', 'assessment__title'),
+        ('assessment_type', 'assessment__assessment_type'),
+        ('assessment_date', 'assessment__date'),
+        ('weight', 'assessment__weight'),
+        ('score', 'score'),
+        ('remarks', 'remarks'),
+        ('recorded_at', 'recorded_at'),
+    )
+    export_class_lookup = 'assessment__school_class'
+    export_date_lookup = 'assessment__date'
+    export_term_lookup = 'assessment__term'
 
     def get_queryset(self):
         user = getattr(self.request, 'user', None)
         qs = super().get_queryset()
         # parents see only grade entries for their children
         if user and user.is_authenticated and getattr(user, 'role', None) == 'parent':
-            return qs.filter(student__guardian=user)
+            return qs.filter(student_id__in=guardians.child_ids(user, self.request))
         return qs
 
     def perform_create(self, serializer):
-        serializer.save(recorded_by=self.request.user)
+        # the entry and its outbox event commit together
+        with transaction.atomic():
+            serializer.save(recorded_by=self.request.user)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Record a whole assessment's marks in one request.
+
+        Accepts either JSON ``{"assessment": id, "scores": [{"student": id, "score": 71, "remarks": ""}, ...]}``
+        or a multipart upload with ``assessment`` and a CSV/XLSX ``file`` whose
+        header has ``score`` plus ``student`` or ``admission_number`` (and
+        optionally ``remarks``). Uploaded files are read row by row.
+        """
+        user = request.user
+        if not (getattr(user, 'role', None) in ('admin', 'teacher') or getattr(user, 'is_superuser', False)):
+            return Response({'detail': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        sheet = serializers.GradeSheetSerializer(data=request.data)
+        sheet.is_valid(raise_exception=True)
+        assessment = sheet.validated_data['assessment']
+        upload = sheet.validated_data.get('file')
+        rows = iter_upload_rows(upload) if upload else sheet.validated_data['scores']
+        try:
+            summary = import_grade_sheet(assessment, rows, user)
+        except GradeSheetError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if summary['errors'] and not (summary['created'] or summary['updated']):
+            return Response(summary, status=status.HTTP_400_BAD_REQUEST)
+        return Response(summary)
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(ReplicaReadMixin, FastListMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = AttendanceRecord.objects.all()
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated, IsGuardianOrStaff]
+    export_columns = (
+        ('id', 'id'),
+        ('date', 'date'),
+        ('admission_number', 'student__admission_number'),
+        ('first_name', 'student__first_name'),
+        ('last_name', 'student__last_name'),
+        ('class', 'student__current_class__name'),
+        ('status', 'status'),
+        ('note', 'note'),
+        ('recorded_by', 'recorded_by__username'),
+    )
 
     def get_queryset(self):
         user = getattr(self.request, 'user', None)
         qs = super().get_queryset()
         if user and user.is_authenticated and getattr(user, 'role', None) == 'parent':
-            return qs.filter(student__guardian=user)
+            return qs.filter(student_id__in=guardians.child_ids(user, self.request))
         return qs
 
     def perform_create(self, serializer):
-        serializer.save(recorded_by=self.request.user)
+        # the record and its rollup update commit together
+        with transaction.atomic():
+            serializer.save(recorded_by=self.request.user)
+
+    def analytics_params(self, request):
+        user = request.user
+        if not (getattr(user, 'role', None) in ('admin', 'teacher') or getattr(user, 'is_superuser', False)):
+            return None, Response({'detail': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        params = serializers.AttendanceAnalyticsSerializer(data=request.query_params)
+        if not params.is_valid():
+            return None, Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        return params.validated_data, None
+
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """Attendance, absence and late rates per class per ``period`` (day/week/month/total), from the daily rollups.
+
+        Query: ``date_from``, ``date_to`` or ``term``; optional ``school_class`` and ``period`` (default week).
+        """
+        params, error = self.analytics_params(request)
+        if error:
+            return error
+        school_class = params.get('school_class')
+        rows = analytics.class_rates(
+            params['date_from'], params['date_to'], params['period'], class_ids=[school_class.id] if school_class else None
+        )
+        return Response({'date_from': params['date_from'], 'date_to': params['date_to'], 'period': params['period'], 'results': rows})
+
+    @action(detail=False, methods=['get'])
+    def chronic_absence(self, request):
+        """Pupils absent on at least ``threshold`` percent (default 10) of their recorded days in the range."""
+        params, error = self.analytics_params(request)
+        if error:
+            return error
+        school_class = params.get('school_class')
+        rows = analytics.chronic_absence(
+            params['date_from'], params['date_to'], params['threshold'], params['min_days'],
+            class_ids=[school_class.id] if school_class else None,
+        )
+        return Response({'date_from': params['date_from'], 'date_to': params['date_to'], 'threshold': params['threshold'], 'results': rows})
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Take a whole class register in one request.
+
+        Body: ``{"school_class": id, "date": "YYYY-MM-DD", "records": [{"student": id, "status": "present", "note": ""}, ...]}``.
+        Rows are validated as a batch and every valid row is upserted on the
+        ``(student, date)`` unique key in a single statement. The response
+        carries one result per submitted row, in the order received.
+        """
+        user = request.user
+        if not (getattr(user, 'role', None) in ('admin', 'teacher') or getattr(user, 'is_superuser', False)):
+            return Response({'detail': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        envelope = serializers.AttendanceBulkSerializer(data=request.data)
+        envelope.is_valid(raise_exception=True)
+        school_class = envelope.validated_data['school_class']
+        date = envelope.validated_data['date']
+        rows = envelope.validated_data['records']
+
+        # validate every row without touching the database first
+        results = []
+        valid = {}
+        for index, row in enumerate(rows):
+            entry = serializers.AttendanceBulkEntrySerializer(data=row)
+            if not entry.is_valid():
+                results.append({'index': index, 'student': row.get('student'), 'status': 'error', 'errors': entry.errors})
+                continue
+            student_id = entry.validated_data['student']
+            if student_id in valid:
+                results.append({'index': index, 'student': student_id, 'status': 'error', 'errors': {'student': ['Duplicate entry for this student.']}})
+                continue
+            valid[student_id] = (index, entry.validated_data)
+            results.append(None)
+
+        # one query to check class membership for the whole batch
+        enrolled = set(
+            Student.objects.filter(id__in=valid.keys(), current_class=school_class, is_active=True).values_list('id', flat=True)
+        )
+        for student_id in list(valid):
+            if student_id not in enrolled:
+                index, _ = valid.pop(student_id)
+                results[index] = {'index': index, 'student': student_id, 'status': 'error', 'errors': {'student': ['Student is not enrolled in this class.']}}
+
+        if not valid:
+            return Response({'school_class': school_class.id, 'date': date, 'created': 0, 'updated': 0, 'results': results}, status=status.HTTP_400_BAD_REQUEST)
+
+        records = [
+            AttendanceRecord(
+                student_id=student_id, school_class=school_class, date=date, status=data['status'], note=data.get('note'), recorded_by=user
+            )
+            for student_id, (index, data) in valid.items()
+        ]
+        with transaction.atomic():
+            existing = {
+                student_id: (class_id, previous)
+                for student_id, class_id, previous in AttendanceRecord.objects.filter(date=date, student_id__in=valid.keys())
+                .values_list('student_id', 'school_class_id', 'status')
+            }
+            AttendanceRecord.objects.bulk_create(
+                records,
+                update_conflicts=True,
+                unique_fields=['student', 'date'],
+                update_fields=['school_class', 'status', 'note', 'recorded_by', 'updated_at'],
+            )
+            # retaken rows now count in this register's class
+            rollup = defaultdict(Counter)
+            rollup[(school_class.id, date)].update(data['status'] for _, data in valid.values())
+            for class_id, previous in existing.values():
+                rollup[(class_id, date)][previous] -= 1
+            analytics.apply(rollup)
+            # bulk_create skips post_save, so update the cached aggregates here
+            transaction.on_commit(lambda: dashboard.attendance_changed(date, list(valid), created=len(valid) - len(existing)))
+
+        for student_id, (index, data) in valid.items():
+            results[index] = {
+                'index': index,
+                'student': student_id,
+                'status': 'updated' if student_id in existing else 'created',
+                'attendance': data['status'],
+            }
+
+        return Response({
+            'school_class': school_class.id,
+            'date': date,
+            'created': len(valid) - len(existing),
+            'updated': len(existing),
+            'results': results,
+        })
 
-class BehaviourViewSet(viewsets.ModelViewSet):
+class BehaviourViewSet(ReplicaReadMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = BehaviourIncident.objects.all()
     serializer_class = BehaviourSerializer
     permission_classes = [IsAuthenticated, IsGuardianOrStaff]
+    export_columns = (
+        ('id', 'id'),
+        ('date', 'date'),
+        ('admission_number', 'student__admission_number'),
+        ('first_name', 'student__first_name'),
+        ('last_name', 'student__last_name'),
+        ('class', 'student__current_class__name'),
+        ('severity', 'severity'),
+        ('description', 'description'),
+        ('action_taken', 'action_taken'),
+        ('notified_parents', 'notified_parents'),
+        ('reported_by', 'reported_by__username'),
+    )
 
     def get_queryset(self):
         user = getattr(self.request, 'user', None)
         qs = super().get_queryset()
         if user and user.is_authenticated and getattr(user, 'role', None) == 'parent':
-            return qs.filter(student__guardian=user)
+            return qs.filter(student_id__in=guardians.child_ids(user, self.request))
         return qs
 
     def perform_create(self, serializer):
-        serializer.save(reported_by=self.request.user)
+        # the incident and its outbox event commit together
+        with transaction.atomic():
+            serializer.save(reported_by=self.request.user)
 
-class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+class TermReportViewSet(ReplicaReadMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = TermReport.objects.select_related('student', 'term').order_by('-generated_at', '-id')
+    serializer_class = serializers.TermReportSerializer
+    permission_classes = [IsAuthenticated, IsGuardianOrStaff]
+    pagination_class = LimitOffsetPagination
+    conditional_timestamp = 'generated_at'
+
+    def get_queryset(self):
+        user = getattr(self.request, 'user', None)
+        qs = super().get_queryset()
+        term = self.request.query_params.get('term')
+        if term:
+            qs = qs.filter(term_id=term)
+        if user and user.is_authenticated and getattr(user, 'role', None) == 'parent':
+            return qs.filter(student_id__in=guardians.child_ids(user, self.request))
+        return qs
+
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        """Generate the term's report cards for one class (or every class).
+
+        Body: ``{"term": id, "school_class": id, "force": false}``. Reports whose
+        grades, attendance and incidents are unchanged since they were last
+        generated are skipped unless ``force`` is set.
+        """
+        user = request.user
+        if not (getattr(user, 'role', None) in ('admin', 'teacher') or getattr(user, 'is_superuser', False)):
+            return Response({'detail': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        params = serializers.TermReportGenerateSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        school_class = params.validated_data.get('school_class')
+        summary = reports.generate_term_reports(
+            params.validated_data['term'],
+            classes=[school_class] if school_class else None,
+            force=params.validated_data['force'],
+            user=user,
+        )
+        return Response(summary)
+
+class NotificationViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = serializers.NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user).order_by('-created_at')
@@ -290,29 +500,59 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         n = self.get_object()
-        n.is_read = True
-        n.save()
+        if notifications.mark_read(request.user.id, [n.pk]):
+            # badge counts on the user's open sockets are updated by the outbox worker
+            outbox.enqueue('notifications.changed', {'users': [request.user.id]})
         return Response({'status':'ok'})
 
+    @action(detail=False, methods=['post'])
+    def mark_all_read(self, request):
+        updated = notifications.mark_read(request.user.id)
+        if updated:
+            outbox.enqueue('notifications.changed', {'users': [request.user.id]})
+        return Response({'status': 'ok', 'updated': updated})
 
-class MessageThreadViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({'unread': notifications.unread_counts([request.user.id])[request.user.id]})
+
+
+class MessageThreadViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Threads between users and nested messages endpoint.
 
-    - list: parents see only threads they participate in; teachers/admins see all threads
+    - list: parents see only threads they participate in; teachers/admins see all threads.
+      Cursor-paginated by last activity; each thread carries a last-message preview and the
+      caller's unread count instead of its whole history.
     - create: provide subject and participants (list of user ids). Optionally include `initial_message` to seed the thread.
-    - messages (action): GET messages for a thread, POST to add a new message to the thread.
+    - messages (action): GET messages for a thread (cursor-paginated, newest first), POST to add a new message to the thread.
     """
     queryset = MessageThread.objects.all().order_by('-created_at')
     serializer_class = serializers.MessageThreadSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ThreadCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         qs = super().get_queryset()
         if user and getattr(user, 'role', None) == 'parent':
-            return qs.filter(participants=user)
+            qs = qs.filter(participants=user)
+        if self.action in ('list', 'retrieve', 'create'):
+            qs = self.annotate_inbox(qs, user)
         return qs
 
+    @staticmethod
+    def annotate_inbox(qs, user):
+        """Add last activity, last-message preview and the user's unread count to each thread."""
+        last = Message.objects.filter(thread=OuterRef('pk')).order_by('-sent_at', '-id')
+        unread_count = ThreadReadState.objects.filter(thread=OuterRef('pk'), user_id=user.id).values('unread_count')[:1]
+        return qs.annotate(
+            last_message_id=Subquery(last.values('id')[:1]),
+            last_message_sender=Subquery(last.values('sender_id')[:1]),
+            last_message_preview=Subquery(last.annotate(preview=Substr('body', 1, 140)).values('preview')[:1]),
+            last_activity=Coalesce(Subquery(last.values('sent_at')[:1]), F('created_at')),
+            unread_count=Coalesce(Subquery(unread_count), Value(0)),
+        ).prefetch_related('participants')
+
     def create(self, request, *args, **kwargs):
         data = request.data
         subject = data.get('subject', '').strip()
@@ -337,65 +577,50 @@ class MessageThreadViewSet(viewsets.ModelViewSet):
 
         # optionally create initial message
         if initial_message:
-            m = Message.objects.create(thread=thread, sender=request.user, body=initial_message)
-            # mark sender as having read their own message
-            try:
-                m.read_by.add(request.user)
-            except Exception:
-                pass
-            # notify other participants about unread count
-            try:
-                channel_layer = get_channel_layer()
-                for u in thread.participants.all():
-                    if u.id == request.user.id:
-                        continue
-                    unread = Message.objects.filter(thread__participants=u).exclude(read_by=u).count()
-                    async_to_sync(channel_layer.group_send)(f'user_{u.id}', {'type': 'unread.count', 'unread': unread})
-            except Exception:
-                pass
-
-        serializer = self.get_serializer(thread)
+            with transaction.atomic():
+                m = Message.objects.create(thread=thread, sender=request.user, body=initial_message)
+                # mark sender as having read their own message
+                try:
+                    m.read_by.add(request.user)
+                except Exception:
+                    pass
+                # other participants' unread counts are pushed by the outbox worker
+                recipients = unread.record_message(m)
+                if recipients:
+                    outbox.enqueue('unread.changed', {'users': recipients})
+
+        serializer = self.get_serializer(self.get_queryset().get(pk=thread.pk))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['get', 'post'])
     def messages(self, request, pk=None):
         thread = self.get_object()
         if request.method == 'GET':
-            qs = thread.messages.select_related('sender').all().order_by('sent_at')
-            # mark as read for the requesting user
-            for m in qs:
-                if request.user not in m.read_by.all():
-                    m.read_by.add(request.user)
-            # send updated unread count for this user
-            try:
-                channel_layer = get_channel_layer()
-                unread = Message.objects.filter(thread__participants=request.user).exclude(read_by=request.user).count()
-                async_to_sync(channel_layer.group_send)(f'user_{request.user.id}', {'type': 'unread.count', 'unread': unread})
-            except Exception:
-                pass
-            serializer = serializers.MessageSerializer(qs, many=True)
-            return Response(serializer.data)
+            # mark everything as read for the requesting user in one set-based write
+            if unread.mark_thread_read(request.user.id, thread.id):
+                # push the lower count to the user's other sessions
+                outbox.enqueue('unread.changed', {'users': [request.user.id]})
+            qs = thread.messages.select_related('sender').prefetch_related('read_by')
+            paginator = MessageCursorPagination()
+            page = paginator.paginate_queryset(qs, request, view=self)
+            serializer = serializers.MessageSerializer(page, many=True, context={'watermarks': unread.watermarks(thread.id)})
+            return paginator.get_paginated_response(serializer.data)
 
         # POST: create a new message in the thread
         body = request.data.get('body', '').strip()
         if not body:
             return Response({'error': 'body required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        msg = Message.objects.create(thread=thread, sender=request.user, body=body)
-        try:
-            msg.read_by.add(request.user)
-        except Exception:
-            pass
-        # notify other participants about unread count
-        try:
-            channel_layer = get_channel_layer()
-            for u in thread.participants.all():
-                if u.id == request.user.id:
-                    continue
-                unread = Message.objects.filter(thread__participants=u).exclude(read_by=u).count()
-                async_to_sync(channel_layer.group_send)(f'user_{u.id}', {'type': 'unread.count', 'unread': unread})
-        except Exception:
-            pass
+        with transaction.atomic():
+            msg = Message.objects.create(thread=thread, sender=request.user, body=body)
+            try:
+                msg.read_by.add(request.user)
+            except Exception:
+                pass
+            # other participants' unread counts are pushed by the outbox worker
+            recipients = unread.record_message(msg)
+            if recipients:
+                outbox.enqueue('unread.changed', {'users': recipients})
         serializer = serializers.MessageSerializer(msg)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -406,10 +631,8 @@ class MessageThreadViewSet(viewsets.ModelViewSet):
         if not user or not user.is_authenticated:
             return Response({'unread': 0})
 
-        # messages in threads where the user is a participant and they have not read the message
-        qs = Message.objects.filter(thread__participants=user).exclude(read_by=user)
-        count = qs.count()
-        return Response({'unread': count})
+        # maintained by school.unread, see the rebuild_unread_counters command
+        return Response({'unread': unread.unread_total(user.id)})
 
 
 # login and registration views
@@ -453,9 +676,10 @@ class LoginView(APIView):
 
 
 
-class MeView(APIView):
+class MeView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
-        return Response(serializer.data)
+        # the user row is already loaded, so the validator costs no query
+        etag = conditional.make_etag('me', *(getattr(request.user, name) for name in UserSerializer.Meta.fields))
+        return conditional.respond(request, etag, None, lambda: Response(UserSerializer(request.user).data))